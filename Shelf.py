@@ -1,8 +1,26 @@
+import os
+import re
 import sys
+import csv
+import bz2
+import gzip
+import hmac
+import json
+import lzma
+import time
+import heapq
+import base64
+import hashlib
+import logging
 import sqlite3
-from PyQt5.QtCore import pyqtSignal, Qt
-from PyQt5.QtGui import QPixmap
-from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QApplication, QWidget, QLabel, QLineEdit, QPushButton, QMessageBox, QTextEdit, QProgressBar
+import cProfile
+import functools
+import threading
+from array import array
+from datetime import date
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from itertools import islice
 
 '''Shelf.app is a book management application. It allows users to manage their book collections, add books they've read this year, and track their current reading progress. 
 Components:
@@ -15,6 +33,7 @@ SignupApp Class: GUI for user signup. It allows users to input their name, email
 ShelfApp Class: Represents the main application window where users can manage their book collections. It has fields for adding, removing, searching, and listing books. 
 Additionally, it displays the user's reading goal, books read in the current year, and output text area. The user can log out from here.
 ShelfApplication Class: The main application class. It initializes the database and creates instances of LoginSignupApp and ShelfApp. It manages the flow between login/signup and the main ShelfApp.
+The Qt classes live in shelf_gui.py and are only imported when the GUI starts or one of them is looked up on this module. shelf_cli.py is a headless command line (import, export, stats, search) over the same Database.
 Workflow:
 Shelfapplication is instantiated when the application starts.
 ShelfApplication initializes the database and shows the LoginSignupApp.
@@ -22,11 +41,30 @@ In LoginSignupApp, users can either log in with existing credentials or sign up
 Upon successful login, ShelfApplication switches to ShelfApp.
 In ShelfApp, users can manage their book collection, add books read in the current year, track reading progress, and log out.
 Users can log out from ShelfApp, which returns them to LoginSignupApp.
+Upgrades:
+Opening a shelf.db written by an older version upgrades its schema in place, once. Moving the books of an old, large shelf.db into the shared catalog takes a while (about 20 s for 500,000 books), so the GUI opens the database on a worker thread and shows the upgrade's progress, and shelf_cli.py prints it.
+Diagnostics:
+Set SHELF_STATS=<file> to record per-method and per-query timings with a slow-query log, written on exit (Prometheus text for .prom/.txt files, JSON otherwise).
+Set SHELF_PROFILE=<directory> to write a cProfile dump for every UI action.
+Passwords:
+Passwords are stored as salted scrypt (or PBKDF2) hashes; Database.authenticate checks them off the UI thread and replaces passwords stored in plaintext by older versions on the next successful login.
+Backups:
+Database.backup copies the live database with SQLite's online backup API and Database.restore puts a copy back; verify_backup checks a copy. Set SHELF_BACKUP_DIR=<directory> to take scheduled snapshots while the GUI runs (SHELF_BACKUP_INTERVAL seconds apart, SHELF_BACKUP_KEEP kept). shelf_cli.py has backup, snapshot, verify and restore commands.
+Replicas:
+ReplicaPublisher (or shelf_cli.py publish <file> --interval <seconds>) keeps a snapshot of the database up to date, and ReplicaDatabase reads one read only, immutable and memory-mapped, for reporting jobs and kiosks that shouldn't compete with writers. Use shelf_cli.py --replica for export, stats and search on one, and SHELF_REPLICA=<file> to run the GUI on one.
+Sync:
+Every write to users, the catalog and shelves is logged in the changes table. Database.changes_since and apply_changes move only the changes a peer lacks; sync_databases (or shelf_cli.py sync <peer.db>) does both directions. Each database is its own replica, so start a new machine from an empty database and sync, rather than copying shelf.db. The log grows with every write until shelf_cli.py compact [--vacuum] deletes what every peer already has; a new machine then starts from restoring a backup (restore takes a new replica id), since syncing from empty is refused once changes are gone.
+Covers:
+Cover images are copied into a content-addressed store next to the database (shelf-covers/ for shelf.db), from the GUI's Set Cover button or a cover column in an imported CSV/JSONL file. The GUI decodes thumbnails on a worker pool and keeps them in a size-bounded on-disk LRU (ThumbnailCache) behind an in-memory QPixmapCache.
+Sharding:
+For many users, ShardedDatabase keeps users in a directory database and each user's books in a shard file of their own (opened on demand, with an LRU of open shards), so users never wait on each other's writes. shelf_cli.py --sharded runs import, export, stats and search on one.
 Next Steps.
 I want to continue to make an easy to use UI for Shelf. The biggest aaaaaddition I want to make inn the future is to expand the types of collections a user can make because people don't just store books on shelves. '''
 
 #class representing a User
 class User:
+    __slots__ = ('username', 'password', 'name', 'email', 'favorite_genre')
+
     def __init__(self, username, password, name='', email='', favorite_genre=''):
         self.username = username
         self.password = password
@@ -34,20 +72,635 @@ class User:
         self.email = email
         self.favorite_genre = favorite_genre
 
+# Salted, slow password hashes. Stored hashes carry their scheme and parameters, e.g.
+# scrypt$16384$8$1$<salt>$<hash> or pbkdf2_sha256$600000$<salt>$<hash>, so the cost can be
+# raised later and old hashes are still checked (and flagged by needs_rehash). Anything
+# else is taken to be a plaintext password from before hashing. Every hash costs real CPU
+# (and, for scrypt, 128 * n * r bytes of memory), so at most max_concurrent run at once
+# and further logins queue instead of starving the rest of the process.
+class PasswordHasher:
+    SCHEMES = ('scrypt', 'pbkdf2_sha256')
+    # Parameters each scheme stores between its name and the salt: n, r, p or iterations
+    PARAMETER_COUNTS = {'scrypt': 3, 'pbkdf2_sha256': 1}
+
+    def __init__(self, scheme=None, n=2 ** 14, r=8, p=1, iterations=600000, max_concurrent=None):
+        # scrypt needs OpenSSL 1.1+; PBKDF2 is always available
+        self.scheme = scheme or ('scrypt' if hasattr(hashlib, 'scrypt') else 'pbkdf2_sha256')
+        if self.scheme not in self.SCHEMES:
+            raise ValueError(f'Unknown password hash scheme: {self.scheme}')
+        self.parameters = (n, r, p) if self.scheme == 'scrypt' else (iterations,)
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self.slots = threading.BoundedSemaphore(self.max_concurrent)
+        self.dummy_hash = None
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        digest = self.derive(self.scheme, self.parameters, password, salt)
+        fields = [self.scheme, *map(str, self.parameters), base64.b64encode(salt).decode(), base64.b64encode(digest).decode()]
+        return '$'.join(fields)
+
+    def derive(self, scheme, parameters, password, salt):
+        with self.slots:
+            if scheme == 'scrypt':
+                n, r, p = parameters
+                return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                                      maxmem=256 * n * r * p, dklen=32)
+            return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, parameters[0], dklen=32)
+
+    # Whether password matches a stored hash (or stored plaintext)
+    def verify(self, password, stored):
+        if stored is None:
+            return False
+        fields = stored.split('$')
+        if fields[0] not in self.SCHEMES:
+            return hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+        # A malformed hash (or a plaintext password that looks like one) never matches
+        try:
+            if len(fields) != self.PARAMETER_COUNTS[fields[0]] + 3:
+                return False
+            parameters = tuple(int(field) for field in fields[1:-2])
+            salt, digest = base64.b64decode(fields[-2], validate=True), base64.b64decode(fields[-1], validate=True)
+            return hmac.compare_digest(self.derive(fields[0], parameters, password, salt), digest)
+        except (ValueError, OverflowError, MemoryError):
+            return False
+
+    # Spend the time of a verification when there is no user, so timing doesn't tell
+    # whether a username exists
+    def verify_nothing(self, password):
+        if self.dummy_hash is None:
+            self.dummy_hash = self.hash('')
+        self.verify(password, self.dummy_hash)
+        return False
+
+    # Plaintext and hashes made with another scheme or other parameters are replaced on login
+    def needs_rehash(self, stored):
+        return stored.split('$')[:len(self.parameters) + 1] != [self.scheme, *map(str, self.parameters)]
+
 #class representing a Book
 class Book:
-    def __init__(self, title, author, genre, year):
+    __slots__ = ('title', 'author', 'genre', 'year', 'id', 'cover', 'catalog_id')
+
+    # cover is the name of the book's image in the cover store (see store_cover); catalog_id
+    # is set on books read by get_books_page, whose page keys include it
+    def __init__(self, title, author, genre, year, id=None, cover=None, catalog_id=None):
         self.title = title
         self.author = author
         self.genre = genre
         self.year = year
+        self.id = id
+        self.cover = cover
+        self.catalog_id = catalog_id
+
+# Compact, column-oriented list of books. Each field is stored in its own column and the
+# author, genre and year strings are shared between books instead of repeated per row.
+# Indexing and iterating give Book objects, so it can stand in for a list of books.
+class BookCollection:
+    def __init__(self, books=()):
+        self.ids = array('q')
+        self.titles = []
+        self.authors = []
+        self.genres = []
+        self.years = []
+        self.strings = {}
+        for book in books:
+            self.append(book)
+
+    # Return the shared copy of a repeated string
+    def intern(self, value):
+        return self.strings.setdefault(value, value)
+
+    def append_row(self, id, title, author, genre, year):
+        self.ids.append(id or 0)
+        self.titles.append(title)
+        self.authors.append(self.intern(author))
+        self.genres.append(self.intern(genre))
+        self.years.append(self.intern(year))
+
+    def append(self, book):
+        self.append_row(book.id, book.title, book.author, book.genre, book.year)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __getitem__(self, index):
+        return Book(self.titles[index], self.authors[index], self.genres[index], self.years[index],
+                    id=self.ids[index] or None)
+
+    def __iter__(self):
+        for index in range(len(self.titles)):
+            yield self[index]
+
+#class representing a kind of collection item (vinyl, board games, ...) and the attributes it has
+class ItemType:
+    __slots__ = ('name', 'attributes', 'username', 'id')
+
+    def __init__(self, name, attributes, username=None, id=None):
+        self.name = name
+        self.attributes = attributes
+        self.username = username
+        self.id = id
+
+#class representing an item in a collection; attributes holds the type's fields
+class Item:
+    __slots__ = ('title', 'type_name', 'attributes', 'id')
+
+    def __init__(self, title, type_name, attributes=None, id=None):
+        self.title = title
+        self.type_name = type_name
+        self.attributes = attributes or {}
+        self.id = id
+
+    # A book as an item of the built-in book type
+    @classmethod
+    def from_book(cls, book):
+        return cls(book.title, 'book', {'author': book.author, 'genre': book.genre, 'year': book.year}, id=book.id)
+
+#class representing a summary of a user's shelf: genre and author counts (most common first),
+#books per publication decade (None for years that aren't numbers) and this year's reading
+class ShelfStats:
+    __slots__ = ('books', 'genres', 'authors', 'decades', 'goal', 'books_read', 'day_of_year', 'days_in_year',
+                 'favorite_genre', 'favorite_genre_read')
+
+    def __init__(self, books, genres, authors, decades, goal, books_read, day_of_year, days_in_year,
+                 favorite_genre='', favorite_genre_read=0):
+        self.books = books
+        self.genres = genres
+        self.authors = authors
+        self.decades = decades
+        self.goal = goal
+        self.books_read = books_read
+        self.day_of_year = day_of_year
+        self.days_in_year = days_in_year
+        self.favorite_genre = favorite_genre
+        self.favorite_genre_read = favorite_genre_read
+
+    # Books the goal calls for by today
+    def expected_by_now(self):
+        return self.goal * self.day_of_year / self.days_in_year
+
+    # Books that will have been read by the end of the year at the current pace
+    def projected(self):
+        return self.books_read * self.days_in_year / self.day_of_year
+
+    # Books in the favorite genre and that genre's rank among the shelf's genres (0 if absent)
+    def favorite_genre_books(self):
+        for rank, (genre, count) in enumerate(self.genres, 1):
+            if genre.casefold() == self.favorite_genre.casefold():
+                return count, rank
+        return 0, 0
+
+logger = logging.getLogger('shelf')
+
+# Decade a publication year falls in, or None when the year isn't a number
+def publication_decade(year):
+    if year and year.isascii() and year.isdecimal():
+        return int(year) // 10 * 10
+    return None
+
+# Identity of a book in the shared catalog: a hash of its title, author, genre and year
+# exactly as entered. Users only share a catalog row when they entered the same book, so
+# no one's spelling, genre or year is replaced by another user's.
+def book_key(title, author, genre, year):
+    fields = f'{title or ""}\x1f{author or ""}\x1f{genre or ""}\x1f{"" if year is None else year}'
+    return hashlib.blake2b(fields.encode('utf-8'), digest_size=16).digest()
+
+# Collects timings for a Database: calls, time and rows per Database method, and calls,
+# time, rows changed and VM steps per SQL statement. Statements are seen through sqlite3's
+# trace callback (fired as each statement starts, so a statement ends when the next one
+# starts or the method returns) and VM steps are counted with a progress handler.
+class QueryStats:
+    PROGRESS_STEPS = 1000
+    LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+    def __init__(self, slow_query_ms=100.0, slow_log_size=100):
+        self.slow_query_ms = slow_query_ms
+        self.methods = {}
+        self.queries = {}
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    # Register the callbacks on a new connection
+    def attach(self, connection):
+        connection.set_trace_callback(lambda sql: self.statement_started(connection, sql))
+        connection.set_progress_handler(self.progress, self.PROGRESS_STEPS)
+
+    # Per-thread stack of running Database methods
+    def method_stack(self):
+        if not hasattr(self.local, 'methods'):
+            self.local.methods = []
+            self.local.statement = None
+        return self.local.methods
+
+    def progress(self):
+        statement = getattr(self.local, 'statement', None)
+        if statement:
+            statement['steps'] += self.PROGRESS_STEPS
+        return 0
+
+    def statement_started(self, connection, sql):
+        # Statements run by triggers and virtual tables are reported with a leading comment;
+        # their time is already part of the statement that fired them
+        if sql.startswith('--'):
+            return
+        methods = self.method_stack()
+        # sqlite also reports the running statement again as each trigger starts
+        statement = self.local.statement
+        if statement and statement['raw'] == sql and statement['connection'] is connection:
+            return
+        self.finish_statement()
+        raw = sql
+        sql = ' '.join(self.LITERALS.sub('?', sql).split())
+        if not methods:
+            self.record_query(sql, None, 0.0, 0, 0)
+            return
+        self.local.statement = {'sql': sql, 'raw': raw, 'method': methods[-1], 'connection': connection,
+                                'start': time.perf_counter(), 'steps': 0, 'changes': connection.total_changes}
+
+    def finish_statement(self):
+        statement = getattr(self.local, 'statement', None)
+        if not statement:
+            return
+        self.local.statement = None
+        elapsed = time.perf_counter() - statement['start']
+        changes = statement['connection'].total_changes - statement['changes']
+        self.record_query(statement['sql'], statement['method'], elapsed, changes, statement['steps'])
+
+    def record_query(self, sql, method, seconds, changes, steps):
+        with self.lock:
+            query = self.queries.setdefault(sql, {'calls': 0, 'seconds': 0.0, 'rows_changed': 0, 'vm_steps': 0})
+            query['calls'] += 1
+            query['seconds'] += seconds
+            query['rows_changed'] += changes
+            query['vm_steps'] += steps
+            if seconds * 1000 >= self.slow_query_ms:
+                self.slow_queries.append({'time': time.time(), 'method': method, 'sql': sql,
+                                          'ms': seconds * 1000, 'rows_changed': changes})
+                logger.warning('Slow query in %s (%.1f ms): %s', method, seconds * 1000, sql)
+
+    # Time one Database method call; statements it runs are attributed to it
+    def call(self, name, function, *args, **kwargs):
+        methods = self.method_stack()
+        self.finish_statement()
+        methods.append(name)
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self.finish_statement()
+            methods.pop()
+            elapsed = time.perf_counter() - start
+            rows = 0
+            if not failed:
+                if isinstance(result, int) and not isinstance(result, bool):
+                    rows = result
+                elif hasattr(result, '__len__'):
+                    rows = len(result)
+            with self.lock:
+                method = self.methods.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': 0, 'errors': 0})
+                method['calls'] += 1
+                method['seconds'] += elapsed
+                method['rows'] += rows
+                method['errors'] += failed
+
+    def snapshot(self):
+        with self.lock:
+            return {'methods': {name: dict(values) for name, values in self.methods.items()},
+                    'queries': {sql: dict(values) for sql, values in self.queries.items()},
+                    'slow_queries': list(self.slow_queries),
+                    'slow_query_ms': self.slow_query_ms}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    # Prometheus text exposition format
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, label, values, field):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key, value in values.items():
+                escaped = key.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                lines.append(f'{name}{{{label}="{escaped}"}} {value[field]}')
+
+        metric('shelf_method_calls_total', 'counter', 'Database method calls.', 'method', snapshot['methods'], 'calls')
+        metric('shelf_method_seconds_total', 'counter', 'Time spent in Database methods.', 'method', snapshot['methods'], 'seconds')
+        metric('shelf_method_rows_total', 'counter', 'Rows returned or removed by Database methods.', 'method', snapshot['methods'], 'rows')
+        metric('shelf_method_errors_total', 'counter', 'Database method calls that raised.', 'method', snapshot['methods'], 'errors')
+        metric('shelf_query_calls_total', 'counter', 'SQL statements run.', 'query', snapshot['queries'], 'calls')
+        metric('shelf_query_seconds_total', 'counter', 'Time spent in SQL statements.', 'query', snapshot['queries'], 'seconds')
+        metric('shelf_query_rows_changed_total', 'counter', 'Rows changed by SQL statements.', 'query', snapshot['queries'], 'rows_changed')
+        metric('shelf_query_vm_steps_total', 'counter', 'SQLite VM steps, in units of progress callbacks.', 'query', snapshot['queries'], 'vm_steps')
+        lines.append('# HELP shelf_slow_queries Slow statements currently in the log.')
+        lines.append('# TYPE shelf_slow_queries gauge')
+        lines.append(f"shelf_slow_queries {len(snapshot['slow_queries'])}")
+        return '\n'.join(lines) + '\n'
+
+    # Write a snapshot; .prom and .txt files get the Prometheus format, anything else JSON
+    def write(self, path):
+        text = self.to_prometheus() if path.endswith(('.prom', '.txt')) else self.to_json()
+        with open(path, 'w') as stats_file:
+            stats_file.write(text)
+
+# Record a Database method in the Database's QueryStats, if it has one
+def instrumented(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.stats is None:
+            return method(self, *args, **kwargs)
+        return self.stats.call(method.__name__, method, self, *args, **kwargs)
+    return wrapper
+
+# Profile a UI action with cProfile when SHELF_PROFILE names a directory; each call writes
+# <action>-<timestamp>.prof there
+def profiled(action):
+    @functools.wraps(action)
+    def wrapper(self):
+        directory = os.environ.get('SHELF_PROFILE')
+        if not directory:
+            return action(self)
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(action, self)
+        finally:
+            os.makedirs(directory, exist_ok=True)
+            profile.dump_stats(os.path.join(directory, f'{action.__name__}-{time.time():.6f}.prof'))
+    return wrapper
+
+# Hands out one SQLite connection per thread, all configured the same way. WAL journaling
+# lets readers run alongside a writer (also across processes), and the busy timeout makes
+# writers queue for the lock instead of failing with "database is locked".
+class ConnectionPool:
+    # read_only opens path as an immutable file (mode=ro&immutable=1): SQLite then takes no
+    # locks and never looks for a journal or WAL, so the file must only ever be replaced
+    # whole (as Database.backup does), never written in place.
+    def __init__(self, path='shelf.db', timeout=30.0, journal_mode='WAL', synchronous='NORMAL',
+                 cache_size=-16000, mmap_size=256 * 1024 * 1024, stats=None, read_only=False):
+        self.path = path
+        self.stats = stats
+        self.timeout = timeout
+        self.read_only = read_only
+        self.pragmas = {'journal_mode': journal_mode, 'synchronous': synchronous,
+                        'cache_size': cache_size, 'mmap_size': mmap_size,
+                        'busy_timeout': int(timeout * 1000)}
+        if read_only:
+            del self.pragmas['journal_mode']
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    # Open and configure a new connection
+    def connect(self):
+        if self.read_only:
+            # Imported here: only replicas need it and it is slow to import
+            from pathlib import Path
+            uri = f'{Path(os.path.abspath(self.path)).as_uri()}?mode=ro&immutable=1'
+            connection = sqlite3.connect(uri, uri=True, timeout=self.timeout, check_same_thread=False)
+        else:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        connection.create_function('book_key', 4, book_key, deterministic=True)
+        if self.stats:
+            self.stats.attach(connection)
+        return connection
+
+    # Connection and cursor for the calling thread. Thread ids are reused by the OS, so a
+    # connection left behind by a finished thread is picked up by the next one.
+    def get(self):
+        thread_id = threading.get_ident()
+        if thread_id not in self.connections:
+            connection = self.connect()
+            with self.lock:
+                self.connections[thread_id] = (connection, connection.cursor())
+        return self.connections[thread_id]
+
+    def close(self):
+        with self.lock:
+            for connection, _ in self.connections.values():
+                connection.close()
+            self.connections.clear()
 
 # class representing a Database
 class Database:
-    def __init__(self):
-        self.connection = sqlite3.connect('shelf.db')
-        self.cursor = self.connection.cursor()
-        self.create_tables()
+    # Columns a book list can be ordered by; each one has an index on the catalog
+    SORT_COLUMNS = ('title', 'author', 'year')
+    # Reading goal for a year the user hasn't set one for
+    DEFAULT_READING_GOAL = 50
+    # Books are the built-in item type. They keep their own tables, where these attributes are columns.
+    BOOK_TYPE = ItemType('book', ['author', 'genre', 'year'])
+    ATTRIBUTE_NAME = re.compile(r'[a-z_][a-z0-9_]*$')
+    # Every indexed attribute costs each write to the type's items an index update
+    MAX_INDEXED_ATTRIBUTES = 4
+    # How search_books weighs matches: title over author over genre
+    SEARCH_RANK = 'bm25(10.0, 5.0, 1.0)'
+    # Shelves of up to this many books are searched through an index of their own (see
+    # index_shelf) rather than the catalog's, which finds every user's matches
+    SEARCH_SHELF_LIMIT = 10000
+    # Status of a user's link to a catalog book
+    OWNED = 'owned'
+    READ = 'read'
+    # What the change log records for each synced table: the table, the key of a row and
+    # its contents as JSON, written with {row} standing for new, old or the table itself
+    # Passwords are only logged once hashed: plaintext left from before hashing is logged as
+    # null, and a peer keeps the password it has until the hash made at the next login arrives
+    LOGGED_PASSWORD = '''CASE WHEN {row}.password GLOB 'scrypt$*' OR {row}.password GLOB 'pbkdf2_sha256$*'
+                              THEN {row}.password END'''
+    CHANGE_SOURCES = {
+        'user': ('users', '{row}.username',
+                 f'''json_object('username', {{row}}.username, 'password', {LOGGED_PASSWORD}, 'name', {{row}}.name,
+                                 'email', {{row}}.email, 'favorite_genre', {{row}}.favorite_genre)'''),
+        'book': ('catalog', 'hex({row}.book_key)',
+                 '''json_object('title', {row}.title, 'author', {row}.author, 'genre', {row}.genre,
+                                'year', {row}.year)'''),
+        'link': ('shelf_books', '(SELECT hex(book_key) FROM catalog WHERE id = {row}.catalog_id)',
+                 '''json_object('username', {row}.username, 'status', {row}.status, 'read_year', {row}.read_year)'''),
+    }
+    CHANGE_TIME = "(julianday('now') - 2440587.5) * 86400.0"
+    # Writes logged for each entity, as (event, op) pairs
+    CHANGE_EVENTS = {'user': [('insert', 'upsert'), ('update', 'upsert'), ('delete', 'delete')],
+                     'book': [('insert', 'upsert'), ('update', 'upsert')],
+                     'link': [('insert', 'insert'), ('delete', 'delete')]}
+    # How links are stored in changes since compact_change_log: by their book's catalog id
+    # instead of its book_key, and with username, status and read_year in an array.
+    # changes_since expands them back into the form CHANGE_SOURCES gives.
+    LOGGED_LINK = '''json_array({row}.username, {row}.status, {row}.read_year)'''
+    LINK_DATA = '''json_object('username', json_extract(data, '$[0]'), 'status', json_extract(data, '$[1]'),
+                               'read_year', json_extract(data, '$[2]'))'''
+    # Rows copied per statement by migrations that report their progress
+    MIGRATION_BATCH = 50000
+
+    # With write_behind, add_book only queues the book; queued books are written in one
+    # transaction once flush_size of them are waiting or flush_interval seconds have passed.
+    # Pass a QueryStats as stats to time every method and statement, and a PasswordHasher to
+    # tune the cost of password hashes. Upgrading an old shelf.db copies every book and can
+    # take many seconds for a large one; migration_progress(message) hears how it is going.
+    def __init__(self, path='shelf.db', pool=None, write_behind=False, flush_size=100, flush_interval=2.0,
+                 stats=None, password_hasher=None, user_cache_size=1024, migration_progress=None):
+        self.path = path
+        self.migration_progress = migration_progress
+        # Set by create_catalog, whose rows need no rekeying
+        self.catalog_rekeyed = False
+        self.stats = stats
+        self.password_hasher = password_hasher or PasswordHasher()
+        # Recently used user rows, least recently used first. Writes through this Database
+        # (add_user, rehashes on login, sync and restore) drop them; writes by other
+        # processes are only seen once a row has been evicted.
+        self.user_cache = OrderedDict()
+        self.user_cache_size = user_cache_size
+        self.user_cache_lock = threading.Lock()
+        # Cover images are kept next to the database, e.g. shelf-covers/ for shelf.db
+        self.covers_directory = os.path.splitext(path)[0] + '-covers'
+        self.pool = pool or ConnectionPool(path, stats=stats)
+        # A read-only pool (see ReplicaDatabase) is used as it is
+        if not self.pool.read_only:
+            self.migrate()
+        self.fts_enabled = self.table_exists('catalog_fts')
+        # In-process search indexes per user, only used when SQLite lacks FTS5
+        self.search_indexes = {}
+        # Genre, author and decade counts per user, with the shelf version they were counted at
+        # (see get_shelf_stats). Shared by every thread, so only touched under breakdown_lock.
+        self.shelf_breakdowns = {}
+        self.breakdown_lock = threading.Lock()
+        # Number of books owned per user, for choosing get_books_page's plan. Kept up to date
+        # by writes through this Database; other processes' writes only make it approximate.
+        self.shelf_sizes = {}
+        self.write_behind = write_behind
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending_writes = []
+        self.flush_timer = None
+        self.write_lock = threading.RLock()
+
+    # Every thread works on its own connection from the pool, so one Database can be shared
+    @property
+    def connection(self):
+        return self.pool.get()[0]
+
+    @property
+    def cursor(self):
+        return self.pool.get()[1]
+
+    # Write queued books and close every pooled connection
+    def close(self):
+        self.flush(durable=True)
+        self.pool.close()
+
+    # Copy the live database to path with SQLite's online backup, pages at a time. The copy
+    # reads from one WAL snapshot held open for its whole length, which doesn't block writers
+    # and stops their commits from restarting the copy at the first page, as they otherwise
+    # would after every step. The copy is written next to path and checked before it
+    # replaces it. progress(percent) is called after every step.
+    def backup(self, path, pages=256, progress=None):
+        self.flush()
+        partial = path + '.partial'
+        if os.path.exists(partial):
+            os.remove(partial)
+        target = sqlite3.connect(partial)
+        try:
+            self.connection.execute('BEGIN')
+            self.connection.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            try:
+                self.connection.backup(target, pages=pages, progress=self.backup_progress(progress))
+            finally:
+                self.connection.rollback()
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+        verify_backup(partial)
+        os.replace(partial, path)
+        return path
+
+    # Replace the contents of this database with a backup, after checking the backup is
+    # intact and not from a newer version of Shelf. Queued writes are flushed, then overwritten.
+    # The restored database syncs as a new replica: its sequence numbers went back to the
+    # backup's, and peers already hold the changes the old replica id made after that.
+    def restore(self, path, pages=256, progress=None):
+        summary = verify_backup(path)
+        if summary['schema_version'] > len(self.migrations()):
+            raise ValueError(f'{path} was made by a newer version of Shelf')
+        self.flush(durable=True)
+        source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            source.backup(self.connection, pages=pages, progress=self.backup_progress(progress))
+        finally:
+            source.close()
+        self.migrate()
+        self.become_new_replica()
+        self.fts_enabled = self.table_exists('catalog_fts')
+        self.search_indexes.clear()
+        self.shelf_breakdowns.clear()
+        self.shelf_sizes.clear()
+        self.forget_user()
+        return summary
+
+    # Take a new replica id. The old one is kept as a peer, up to the last change logged
+    # under it here, so its changes are still passed on and the ones made after the backup
+    # come back from peers that have them.
+    def become_new_replica(self):
+        old_replica = self.replica_id()
+        seq = self.sync_vector()[old_replica]
+        with self.connection:
+            self.cursor.execute('''INSERT INTO sync_peers (origin, seq) VALUES (?, ?)''', (old_replica, seq))
+            replica = os.urandom(16).hex()
+            self.cursor.execute('''UPDATE sync_state SET replica = ?, origin = ?, origin_seq = NULL, changed_at = NULL''',
+                                (replica, self.replica_number(replica)))
+
+    # Adapt sqlite3's backup progress callback to progress(percent)
+    @staticmethod
+    def backup_progress(progress):
+        def report(status, remaining, total):
+            if progress and total:
+                progress(100 * (total - remaining) // total)
+        return report
+
+    # Schema migrations, applied in order. PRAGMA user_version stores how many have run,
+    # so an existing shelf.db is upgraded in place and new steps are only ever appended.
+    def migrations(self):
+        return [self.create_tables, self.create_indexes, self.create_search_index, self.create_sort_indexes,
+                self.create_reading_progress, self.create_collections, self.create_catalog, self.create_change_log,
+                self.create_covers, self.create_user_shards, self.scrub_logged_passwords,
+                self.separate_catalog_variants, self.create_shelf_catalog_index, self.create_sync_acks,
+                self.index_attributes_per_type, self.fill_catalog_nulls, self.create_shelf_versions,
+                self.rank_search_matches, self.compact_change_log]
+
+    # Bring the schema up to date, one transaction per migration. The version is re-read
+    # under the write lock so processes starting at the same time never apply a step twice.
+    def migrate(self):
+        migrations = self.migrations()
+        while True:
+            self.cursor.execute('BEGIN IMMEDIATE')
+            try:
+                version = self.cursor.execute('PRAGMA user_version').fetchone()[0]
+                if version >= len(migrations):
+                    self.connection.commit()
+                    return
+                self.report_migration(f'Upgrading the database, step {version + 1} of {len(migrations)}')
+                migrations[version]()
+                self.cursor.execute(f'PRAGMA user_version = {version + 1}')
+            except Exception:
+                self.connection.rollback()
+                raise
+            self.connection.commit()
+
+    def report_migration(self, message):
+        if self.migration_progress:
+            self.migration_progress(message)
+
+    # Rowid ranges of MIGRATION_BATCH rows covering a table, reporting progress as each is done
+    def rowid_ranges(self, table_name, description):
+        self.cursor.execute(f'''SELECT MIN(rowid), MAX(rowid) FROM {table_name}''')
+        low, high = self.cursor.fetchone()
+        if low is None:
+            return
+        for first in range(low, high + 1, self.MIGRATION_BATCH):
+            last = min(first + self.MIGRATION_BATCH - 1, high)
+            yield first, last
+            self.report_migration(f'{description}: {last - low + 1} of {high - low + 1}')
 
     # Create necessary tables in the database
     def create_tables(self):
@@ -60,6 +713,7 @@ class Database:
                                 favorite_genre TEXT)''')
         # Table for storing book information
         self.cursor.execute('''CREATE TABLE IF NOT EXISTS books (
+                                id INTEGER PRIMARY KEY,
                                 title TEXT,
                                 author TEXT,
                                 genre TEXT,
@@ -68,483 +722,1885 @@ class Database:
                                 FOREIGN KEY (username) REFERENCES users(username))''')
         # Table for storing books read in the current year
         self.cursor.execute('''CREATE TABLE IF NOT EXISTS books_read_this_year (
+                                id INTEGER PRIMARY KEY,
                                 title TEXT,
                                 author TEXT,
                                 genre TEXT,
                                 year TEXT,
                                 username TEXT,
-                                FOREIGN KEY (username) REFERENCES users(username))''')  
-        self.connection.commit()
+                                FOREIGN KEY (username) REFERENCES users(username))''')
 
-    # Add a new user to the database
+    # Index the per-user lookups. Tables created before the id column existed keep using
+    # SQLite's implicit rowid (which id aliases), so they are indexed without being rewritten.
+    def create_indexes(self):
+        for table_name in ('books', 'books_read_this_year'):
+            self.cursor.execute(f'''CREATE INDEX IF NOT EXISTS idx_{table_name}_username_title
+                                    ON {table_name} (username, title)''')
+            self.cursor.execute(f'''CREATE INDEX IF NOT EXISTS idx_{table_name}_username_author
+                                    ON {table_name} (username, author)''')
+
+    # Full-text index over books, kept in sync by triggers. Skipped when SQLite was built
+    # without FTS5; search_books then falls back to an in-process TrigramIndex.
+    def create_search_index(self):
+        try:
+            self.cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5 (
+                                    title, author, genre,
+                                    content='books', content_rowid='rowid',
+                                    tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+        except sqlite3.OperationalError:
+            return
+        self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+                                    INSERT INTO books_fts (rowid, title, author, genre)
+                                    VALUES (new.rowid, new.title, new.author, new.genre);
+                                END''')
+        self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+                                    INSERT INTO books_fts (books_fts, rowid, title, author, genre)
+                                    VALUES ('delete', old.rowid, old.title, old.author, old.genre);
+                                END''')
+        self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE ON books BEGIN
+                                    INSERT INTO books_fts (books_fts, rowid, title, author, genre)
+                                    VALUES ('delete', old.rowid, old.title, old.author, old.genre);
+                                    INSERT INTO books_fts (rowid, title, author, genre)
+                                    VALUES (new.rowid, new.title, new.author, new.genre);
+                                END''')
+        self.cursor.execute('''INSERT INTO books_fts (books_fts) VALUES ('rebuild')''')
+
+    # Index year as well so every SORT_COLUMNS ordering is served by an index
+    def create_sort_indexes(self):
+        self.cursor.execute('''CREATE INDEX IF NOT EXISTS idx_books_username_year ON books (username, year)''')
+
+    # Per-user, per-year reading goals and counts of books read. Triggers on books_read_this_year
+    # keep books_read up to date, so progress is a primary key lookup however long the history.
+    # Books already recorded as read this year are counted towards the current year.
+    def create_reading_progress(self):
+        self.cursor.execute('''ALTER TABLE books_read_this_year ADD COLUMN read_year INTEGER''')
+        self.cursor.execute('''UPDATE books_read_this_year SET read_year = CAST(strftime('%Y', 'now', 'localtime') AS INTEGER)''')
+        self.cursor.execute('''CREATE INDEX IF NOT EXISTS idx_books_read_this_year_username_read_year
+                                ON books_read_this_year (username, read_year)''')
+        self.cursor.execute('''CREATE TABLE IF NOT EXISTS reading_progress (
+                                username TEXT,
+                                year INTEGER,
+                                goal INTEGER,
+                                books_read INTEGER NOT NULL DEFAULT 0,
+                                PRIMARY KEY (username, year)) WITHOUT ROWID''')
+        self.cursor.execute('''INSERT INTO reading_progress (username, year, books_read)
+                                SELECT username, read_year, COUNT(*) FROM books_read_this_year
+                                GROUP BY username, read_year''')
+        self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS reading_progress_insert
+                                AFTER INSERT ON books_read_this_year BEGIN
+                                    INSERT INTO reading_progress (username, year, books_read)
+                                    VALUES (new.username, new.read_year, 1)
+                                    ON CONFLICT (username, year) DO UPDATE SET books_read = books_read + 1;
+                                END''')
+        self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS reading_progress_delete
+                                AFTER DELETE ON books_read_this_year BEGIN
+                                    UPDATE reading_progress SET books_read = books_read - 1
+                                    WHERE username = old.username AND year = old.read_year;
+                                END''')
+
+    # Generic collections: user-defined item types, and one items table for every type with
+    # the type-specific fields in a JSON attributes column
+    def create_collections(self):
+        self.cursor.execute('''CREATE TABLE IF NOT EXISTS item_types (
+                                id INTEGER PRIMARY KEY,
+                                username TEXT,
+                                name TEXT,
+                                attributes TEXT,
+                                UNIQUE (username, name),
+                                FOREIGN KEY (username) REFERENCES users(username))''')
+        self.cursor.execute('''CREATE TABLE IF NOT EXISTS items (
+                                id INTEGER PRIMARY KEY,
+                                type_id INTEGER,
+                                username TEXT,
+                                title TEXT,
+                                attributes TEXT,
+                                FOREIGN KEY (type_id) REFERENCES item_types(id),
+                                FOREIGN KEY (username) REFERENCES users(username))''')
+        self.cursor.execute('''CREATE INDEX IF NOT EXISTS idx_items_username_type_title ON items (username, type_id, title)''')
+
+    # Normalize books into a shared catalog with one row per distinct book (see book_key), plus a
+    # small shelf_books link row per user and status (owned, or read in read_year). Existing rows
+    # are deduplicated into the catalog and books and books_read_this_year become views over the
+    # two tables, so reads keep working.
+    # Owned books keep their ids. Search and reading progress move onto the new tables.
+    def create_catalog(self):
+        self.cursor.execute('''CREATE TABLE catalog (
+                                id INTEGER PRIMARY KEY,
+                                book_key BLOB NOT NULL UNIQUE,
+                                title TEXT,
+                                author TEXT,
+                                genre TEXT,
+                                year TEXT)''')
+        self.cursor.execute('''CREATE TABLE shelf_books (
+                                id INTEGER PRIMARY KEY,
+                                username TEXT,
+                                catalog_id INTEGER,
+                                status TEXT,
+                                read_year INTEGER,
+                                FOREIGN KEY (username) REFERENCES users(username),
+                                FOREIGN KEY (catalog_id) REFERENCES catalog(id))''')
+        for table_name in ('books', 'books_read_this_year'):
+            for first, last in self.rowid_ranges(table_name, f'Adding {table_name} to the catalog'):
+                self.cursor.execute(f'''INSERT INTO catalog (book_key, title, author, genre, year)
+                                        SELECT book_key(title, author, genre, year), COALESCE(title, ''),
+                                               COALESCE(author, ''), COALESCE(genre, ''), COALESCE(year, '')
+                                        FROM {table_name}
+                                        WHERE rowid BETWEEN ? AND ? ORDER BY rowid
+                                        ON CONFLICT (book_key) DO NOTHING''', (first, last))
+        for first, last in self.rowid_ranges('books', 'Shelving owned books'):
+            self.cursor.execute('''INSERT INTO shelf_books (id, username, catalog_id, status)
+                                    SELECT books.rowid, books.username, catalog.id, 'owned' FROM books
+                                    JOIN catalog ON catalog.book_key = book_key(books.title, books.author,
+                                                                                 books.genre, books.year)
+                                    WHERE books.rowid BETWEEN ? AND ?''', (first, last))
+        for first, last in self.rowid_ranges('books_read_this_year', 'Shelving books read'):
+            self.cursor.execute('''INSERT INTO shelf_books (username, catalog_id, status, read_year)
+                                    SELECT read.username, catalog.id, 'read', read.read_year FROM books_read_this_year AS read
+                                    JOIN catalog ON catalog.book_key = book_key(read.title, read.author, read.genre,
+                                                                                 read.year)
+                                    WHERE read.rowid BETWEEN ? AND ? ORDER BY read.rowid''', (first, last))
+        # Already keyed the way separate_catalog_variants would rekey them
+        self.catalog_rekeyed = True
+
+        self.cursor.execute('''DROP TABLE IF EXISTS books_fts''')
+        self.cursor.execute('''DROP TABLE books''')
+        self.cursor.execute('''DROP TABLE books_read_this_year''')
+        self.cursor.execute('''CREATE VIEW books AS
+                                SELECT shelf_books.id AS id, title, author, genre, year, username, catalog_id
+                                FROM shelf_books JOIN catalog ON catalog.id = shelf_books.catalog_id
+                                WHERE status = 'owned' ''')
+        self.cursor.execute('''CREATE VIEW books_read_this_year AS
+                                SELECT shelf_books.id AS id, title, author, genre, year, username, catalog_id, read_year
+                                FROM shelf_books JOIN catalog ON catalog.id = shelf_books.catalog_id
+                                WHERE status = 'read' ''')
+
+        # A user's links, looked up by status and read_year (books read) or walked in catalog
+        # order; the catalog's own indexes serve the SORT_COLUMNS orderings and remove_book
+        self.cursor.execute('''CREATE INDEX idx_shelf_books_username_status ON shelf_books (username, status, read_year)''')
+        self.cursor.execute('''CREATE INDEX idx_shelf_books_catalog_username ON shelf_books (catalog_id, username, status)''')
+        for column in self.SORT_COLUMNS:
+            self.cursor.execute(f'''CREATE INDEX idx_catalog_{column} ON catalog ({column})''')
+
+        self.cursor.execute('''CREATE TRIGGER reading_progress_insert
+                                AFTER INSERT ON shelf_books WHEN new.status = 'read' BEGIN
+                                    INSERT INTO reading_progress (username, year, books_read)
+                                    VALUES (new.username, new.read_year, 1)
+                                    ON CONFLICT (username, year) DO UPDATE SET books_read = books_read + 1;
+                                END''')
+        self.cursor.execute('''CREATE TRIGGER reading_progress_delete
+                                AFTER DELETE ON shelf_books WHEN old.status = 'read' BEGIN
+                                    UPDATE reading_progress SET books_read = books_read - 1
+                                    WHERE username = old.username AND year = old.read_year;
+                                END''')
+
+        try:
+            self.cursor.execute('''CREATE VIRTUAL TABLE catalog_fts USING fts5 (
+                                    title, author, genre,
+                                    content='catalog', content_rowid='id',
+                                    tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+        except sqlite3.OperationalError:
+            pass
+        else:
+            self.cursor.execute('''CREATE TRIGGER catalog_fts_insert AFTER INSERT ON catalog BEGIN
+                                        INSERT INTO catalog_fts (rowid, title, author, genre)
+                                        VALUES (new.id, new.title, new.author, new.genre);
+                                    END''')
+            self.cursor.execute('''CREATE TRIGGER catalog_fts_delete AFTER DELETE ON catalog BEGIN
+                                        INSERT INTO catalog_fts (catalog_fts, rowid, title, author, genre)
+                                        VALUES ('delete', old.id, old.title, old.author, old.genre);
+                                    END''')
+            self.cursor.execute('''CREATE TRIGGER catalog_fts_update AFTER UPDATE ON catalog BEGIN
+                                        INSERT INTO catalog_fts (catalog_fts, rowid, title, author, genre)
+                                        VALUES ('delete', old.id, old.title, old.author, old.genre);
+                                        INSERT INTO catalog_fts (rowid, title, author, genre)
+                                        VALUES (new.id, new.title, new.author, new.genre);
+                                    END''')
+            self.cursor.execute('''INSERT INTO catalog_fts (catalog_fts) VALUES ('rebuild')''')
+
+    # Change log for syncing databases. Triggers append every write to users, catalog and
+    # shelf_books to changes, keyed by username or book_key since row ids differ between
+    # databases. Each database is a replica with a random id; a change keeps the replica it
+    # was made on (origin) and its sequence number there, so it is applied once however it
+    # arrives. sync_state holds this replica's id and, while apply_changes runs, the origin
+    # of the change being applied, which the triggers copy; sync_peers holds how far the
+    # changes of every other replica have been applied.
+    def create_change_log(self):
+        self.cursor.execute('''CREATE TABLE changes (
+                                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                                origin TEXT NOT NULL,
+                                origin_seq INTEGER,
+                                entity TEXT NOT NULL,
+                                op TEXT NOT NULL,
+                                key TEXT,
+                                data TEXT,
+                                changed_at REAL NOT NULL)''')
+        self.cursor.execute('''CREATE INDEX idx_changes_origin ON changes (origin, COALESCE(origin_seq, seq))''')
+        self.cursor.execute('''CREATE INDEX idx_changes_key ON changes (entity, key) WHERE entity != 'link' ''')
+        self.cursor.execute('''CREATE TABLE sync_state (
+                                replica TEXT NOT NULL,
+                                origin TEXT NOT NULL,
+                                origin_seq INTEGER,
+                                changed_at REAL)''')
+        self.cursor.execute('''INSERT INTO sync_state (replica, origin)
+                                SELECT id, id FROM (SELECT lower(hex(randomblob(16))) AS id)''')
+        self.cursor.execute('''CREATE TABLE sync_peers (
+                                origin TEXT PRIMARY KEY,
+                                seq INTEGER NOT NULL)''')
+
+        # Existing rows are logged once, so a new replica receives the whole shelf
+        for entity, (table_name, key, data) in self.CHANGE_SOURCES.items():
+            op = 'insert' if entity == 'link' else 'upsert'
+            self.cursor.execute(f'''INSERT INTO changes (origin, entity, op, key, data, changed_at)
+                                    SELECT replica, '{entity}', '{op}', {key.format(row=table_name)},
+                                           {data.format(row=table_name)}, {self.CHANGE_TIME}
+                                    FROM {table_name}, sync_state ORDER BY {table_name}.rowid''')
+
+        for entity in self.CHANGE_SOURCES:
+            for event, op in self.CHANGE_EVENTS[entity]:
+                self.create_change_trigger(entity, event, op)
+
+    # Trigger logging one kind of write to changes. Link triggers log them the way
+    # compact_change_log stores them; no migration before it writes shelf_books.
+    def create_change_trigger(self, entity, event, op):
+        table_name, key, data = self.CHANGE_SOURCES[entity]
+        row = 'old' if event == 'delete' else 'new'
+        logged = 'NULL' if (entity, op) == ('user', 'delete') else data.format(row=row)
+        key_column = 'key'
+        if entity == 'link':
+            key_column, key, logged = 'catalog_id', '{row}.catalog_id', self.LOGGED_LINK.format(row=row)
+        self.cursor.execute(f'''CREATE TRIGGER changes_{table_name}_{event} AFTER {event.upper()} ON {table_name} BEGIN
+                                    INSERT INTO changes (origin, origin_seq, entity, op, {key_column}, data, changed_at)
+                                    SELECT origin, origin_seq, '{entity}', '{op}', {key.format(row=row)}, {logged},
+                                           COALESCE(changed_at, {self.CHANGE_TIME})
+                                    FROM sync_state;
+                                END''')
+
+    # Cover images. The catalog holds the name of a book's image in the cover store, so every
+    # user with the book sees the same cover. Setting a cover must not rewrite the book's
+    # search entry, so the FTS trigger now only fires when an indexed column changes.
+    def create_covers(self):
+        self.cursor.execute('''ALTER TABLE catalog ADD COLUMN cover TEXT''')
+        self.cursor.execute('''DROP VIEW books''')
+        self.cursor.execute('''DROP VIEW books_read_this_year''')
+        self.cursor.execute('''CREATE VIEW books AS
+                                SELECT shelf_books.id AS id, title, author, genre, year, username, catalog_id, cover
+                                FROM shelf_books JOIN catalog ON catalog.id = shelf_books.catalog_id
+                                WHERE status = 'owned' ''')
+        self.cursor.execute('''CREATE VIEW books_read_this_year AS
+                                SELECT shelf_books.id AS id, title, author, genre, year, username, catalog_id, read_year, cover
+                                FROM shelf_books JOIN catalog ON catalog.id = shelf_books.catalog_id
+                                WHERE status = 'read' ''')
+        if self.table_exists('catalog_fts_update'):
+            self.cursor.execute('''DROP TRIGGER catalog_fts_update''')
+            self.cursor.execute('''CREATE TRIGGER catalog_fts_update AFTER UPDATE OF title, author, genre ON catalog BEGIN
+                                        INSERT INTO catalog_fts (catalog_fts, rowid, title, author, genre)
+                                        VALUES ('delete', old.id, old.title, old.author, old.genre);
+                                        INSERT INTO catalog_fts (rowid, title, author, genre)
+                                        VALUES (new.id, new.title, new.author, new.genre);
+                                    END''')
+
+    # Directory of a sharded deployment (see ShardedDatabase): the shard file holding each
+    # user's books, relative to the shards directory. Stays empty in a single-file database.
+    def create_user_shards(self):
+        self.cursor.execute('''CREATE TABLE user_shards (
+                                username TEXT PRIMARY KEY,
+                                shard TEXT NOT NULL,
+                                FOREIGN KEY (username) REFERENCES users(username))''')
+
+    # Earlier versions logged users' passwords as stored, so plaintext from before hashing
+    # was kept in changes and sent to peers. Log them as LOGGED_PASSWORD does from now on,
+    # and null the ones already logged, with secure_delete on so the old text is overwritten.
+    def scrub_logged_passwords(self):
+        for event in ('insert', 'update'):
+            self.cursor.execute(f'''DROP TRIGGER changes_users_{event}''')
+            self.create_change_trigger('user', event, 'upsert')
+        secure_delete = self.cursor.execute('PRAGMA secure_delete').fetchone()[0]
+        self.cursor.execute('PRAGMA secure_delete = ON')
+        try:
+            self.cursor.execute('''UPDATE changes SET data = json_set(data, '$.password', NULL)
+                                   WHERE entity = 'user' AND json_extract(data, '$.password') IS NOT NULL
+                                   AND NOT (json_extract(data, '$.password') GLOB 'scrypt$*'
+                                            OR json_extract(data, '$.password') GLOB 'pbkdf2_sha256$*')''')
+        finally:
+            self.cursor.execute(f'PRAGMA secure_delete = {secure_delete}')
+
+    # Catalog rows were keyed by title and author with case ignored, so books entered with a
+    # different case, genre or year were merged into the first one. Rows are now keyed by all
+    # four fields as stored (book_key); the details merged away earlier are lost, but nothing
+    # is merged from here on. Logged changes move to the new keys too. Every replica computes
+    # the same keys, so the rekeying itself isn't logged.
+    def separate_catalog_variants(self):
+        if self.catalog_rekeyed:
+            return
+        self.cursor.execute('''CREATE TEMP TABLE rekeyed (old TEXT PRIMARY KEY, new TEXT NOT NULL)''')
+        for first, last in self.rowid_ranges('catalog', 'Rekeying the catalog'):
+            self.cursor.execute('''INSERT INTO rekeyed (old, new)
+                                    SELECT hex(book_key), hex(book_key(title, author, genre, year)) FROM catalog
+                                    WHERE id BETWEEN ? AND ?''', (first, last))
+        self.cursor.execute('''DELETE FROM rekeyed WHERE old = new''')
+        self.cursor.execute('''DROP TRIGGER changes_catalog_update''')
+        self.cursor.execute('''UPDATE catalog SET book_key = book_key(title, author, genre, year)
+                                WHERE hex(book_key) IN (SELECT old FROM rekeyed)''')
+        self.create_change_trigger('book', 'update', 'upsert')
+        self.cursor.execute('''UPDATE changes SET key = (SELECT new FROM rekeyed WHERE old = changes.key)
+                                WHERE entity != 'user' AND key IN (SELECT old FROM rekeyed)''')
+        self.cursor.execute('''DROP TABLE temp.rekeyed''')
+
+    # A user's owned catalog ids in one index: get_books_page reads a small shelf from it
+    # without visiting shelf_books rows, and counts the shelf from it
+    def create_shelf_catalog_index(self):
+        self.cursor.execute('''CREATE INDEX idx_shelf_books_username_catalog ON shelf_books (username, status, catalog_id)''')
+
+    # What each peer is known to hold, for compact_changes: sync_acks holds every peer's
+    # sync_vector as of the last sync with it, and sync_pruned how far each origin's changes
+    # have been deleted. Replicas already synced with count as peers holding nothing until
+    # they sync again.
+    def create_sync_acks(self):
+        self.cursor.execute('''CREATE TABLE sync_acks (
+                                peer TEXT NOT NULL,
+                                origin TEXT NOT NULL,
+                                seq INTEGER NOT NULL,
+                                PRIMARY KEY (peer, origin))''')
+        self.cursor.execute('''CREATE TABLE sync_pruned (
+                                origin TEXT PRIMARY KEY,
+                                seq INTEGER NOT NULL)''')
+        self.cursor.execute('''INSERT INTO sync_acks (peer, origin, seq)
+                                SELECT sync_peers.origin, replica, 0 FROM sync_peers, sync_state''')
+
+    # Indexed attributes used to be generated columns on the shared items table, one per
+    # attribute name any user ever indexed, bounded only by SQLite's 2000 column limit.
+    # Replace each with an index per item type that has the attribute (see index_attribute).
+    def index_attributes_per_type(self):
+        columns = [row[1] for row in self.cursor.execute('''PRAGMA table_xinfo(items)''')]
+        self.cursor.execute('''SELECT id, attributes FROM item_types''')
+        item_types = self.cursor.fetchall()
+        for column in columns:
+            if not column.startswith('attr_'):
+                continue
+            attribute = column[len('attr_'):]
+            for type_id, attributes in item_types:
+                if attribute in json.loads(attributes):
+                    self.index_attribute(type_id, attribute)
+            self.cursor.execute(f'''DROP INDEX IF EXISTS idx_items_{column}''')
+            self.cursor.execute(f'''ALTER TABLE items DROP COLUMN {column}''')
+
+    # Missing titles, authors, genres and years are stored as '' (which book_key already
+    # treats the same as NULL), so they sort, compare and page like any other value.
+    # Earlier versions stored NULLs from old shelves, the API and peers.
+    def fill_catalog_nulls(self):
+        self.cursor.execute('''UPDATE catalog SET title = COALESCE(title, ''), author = COALESCE(author, ''),
+                               genre = COALESCE(genre, ''), year = COALESCE(year, '')
+                               WHERE title IS NULL OR author IS NULL OR genre IS NULL OR year IS NULL''')
+
+    # A version per user that moves whenever a book is added to or removed from their shelf
+    # or a book on it is edited, from any connection or process, for the caches kept of a
+    # user's shelf (see get_shelf_stats). A user without a row is at version 0.
+    def create_shelf_versions(self):
+        self.cursor.execute('''CREATE TABLE shelf_versions (
+                                username TEXT PRIMARY KEY,
+                                version INTEGER NOT NULL) WITHOUT ROWID''')
+        for event, row in (('insert', 'new'), ('delete', 'old')):
+            self.cursor.execute(f'''CREATE TRIGGER shelf_versions_{event}
+                                    AFTER {event.upper()} ON shelf_books WHEN {row}.status = 'owned' BEGIN
+                                        INSERT INTO shelf_versions (username, version) VALUES ({row}.username, 1)
+                                        ON CONFLICT (username) DO UPDATE SET version = version + 1;
+                                    END''')
+        self.cursor.execute('''CREATE TRIGGER shelf_versions_catalog_update
+                                AFTER UPDATE OF title, author, genre, year ON catalog
+                                WHEN old.title IS NOT new.title OR old.author IS NOT new.author
+                                     OR old.genre IS NOT new.genre OR old.year IS NOT new.year BEGIN
+                                    INSERT INTO shelf_versions (username, version)
+                                    SELECT DISTINCT username, 1 FROM shelf_books WHERE catalog_id = new.id AND status = 'owned'
+                                    ON CONFLICT (username) DO UPDATE SET version = version + 1;
+                                END''')
+
+    # Make SEARCH_RANK the catalog index's rank, so search_books can order by the rank column:
+    # FTS5 then returns matches best first and the join to the user's links stops at the limit
+    # instead of collecting every user's matches to sort them
+    def rank_search_matches(self):
+        if self.table_exists('catalog_fts'):
+            self.cursor.execute(f'''INSERT INTO catalog_fts (catalog_fts, rank) VALUES ('rank', '{self.SEARCH_RANK}')''')
+
+    # Every change stored its origin's 32 character replica id and every link its book's hex
+    # book_key and a JSON object, which made the log about twice the size of the shelves it
+    # records. Origins are now numbered in sync_replicas (sync_state.origin too) and links are
+    # stored as LOGGED_LINK describes. What changes_since returns is unchanged.
+    def compact_change_log(self):
+        self.cursor.execute('''CREATE TABLE sync_replicas (
+                                id INTEGER PRIMARY KEY,
+                                replica TEXT NOT NULL UNIQUE)''')
+        self.cursor.execute('''INSERT INTO sync_replicas (replica) SELECT replica FROM sync_state''')
+        self.cursor.execute('''INSERT INTO sync_replicas (replica) SELECT DISTINCT origin FROM changes WHERE true
+                                ON CONFLICT (replica) DO NOTHING''')
+        self.cursor.execute('''CREATE TEMP TABLE catalog_keys (key TEXT PRIMARY KEY, id INTEGER NOT NULL)''')
+        self.cursor.execute('''INSERT INTO catalog_keys (key, id) SELECT hex(book_key), id FROM catalog''')
+        for entity in self.CHANGE_SOURCES:
+            for event, _ in self.CHANGE_EVENTS[entity]:
+                self.cursor.execute(f'''DROP TRIGGER changes_{self.CHANGE_SOURCES[entity][0]}_{event}''')
+
+        self.cursor.execute('''CREATE TABLE compacted_changes (
+                                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                                origin INTEGER NOT NULL,
+                                origin_seq INTEGER,
+                                entity TEXT NOT NULL,
+                                op TEXT NOT NULL,
+                                key TEXT,
+                                catalog_id INTEGER,
+                                data TEXT,
+                                changed_at REAL NOT NULL)''')
+        for first, last in self.rowid_ranges('changes', 'Compacting the change log'):
+            self.cursor.execute('''INSERT INTO compacted_changes (seq, origin, origin_seq, entity, op, key, catalog_id,
+                                                                  data, changed_at)
+                                    SELECT seq, sync_replicas.id, origin_seq, entity, op,
+                                           CASE WHEN catalog_keys.id IS NULL THEN changes.key END, catalog_keys.id,
+                                           CASE WHEN entity = 'link'
+                                                THEN json_array(json_extract(data, '$.username'),
+                                                                json_extract(data, '$.status'),
+                                                                json_extract(data, '$.read_year'))
+                                                ELSE data END,
+                                           changed_at
+                                    FROM changes JOIN sync_replicas ON sync_replicas.replica = changes.origin
+                                    LEFT JOIN catalog_keys ON entity = 'link' AND catalog_keys.key = changes.key
+                                    WHERE seq BETWEEN ? AND ?''', (first, last))
+        # Own changes are numbered on from the last seq ever used, even when it was compacted away
+        sequence = self.cursor.execute('''SELECT seq FROM sqlite_sequence WHERE name = 'changes' ''').fetchone()
+        self.cursor.execute('''DROP TABLE changes''')
+        self.cursor.execute('''ALTER TABLE compacted_changes RENAME TO changes''')
+        if sequence:
+            self.cursor.execute('''UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'changes' ''', sequence)
+        self.cursor.execute('''CREATE INDEX idx_changes_origin ON changes (origin, COALESCE(origin_seq, seq))''')
+        self.cursor.execute('''CREATE INDEX idx_changes_key ON changes (entity, key) WHERE entity != 'link' ''')
+        self.cursor.execute('''DROP TABLE temp.catalog_keys''')
+
+        self.cursor.execute('''CREATE TABLE numbered_sync_state (
+                                replica TEXT NOT NULL,
+                                origin INTEGER NOT NULL,
+                                origin_seq INTEGER,
+                                changed_at REAL)''')
+        self.cursor.execute('''INSERT INTO numbered_sync_state (replica, origin, origin_seq, changed_at)
+                                SELECT sync_state.replica, sync_replicas.id, origin_seq, changed_at
+                                FROM sync_state JOIN sync_replicas ON sync_replicas.replica = sync_state.replica''')
+        self.cursor.execute('''DROP TABLE sync_state''')
+        self.cursor.execute('''ALTER TABLE numbered_sync_state RENAME TO sync_state''')
+        for entity in self.CHANGE_SOURCES:
+            for event, op in self.CHANGE_EVENTS[entity]:
+                self.create_change_trigger(entity, event, op)
+
+    # Check whether a table exists in the database
+    def table_exists(self, table_name):
+        self.cursor.execute('''SELECT 1 FROM sqlite_master WHERE name = ?''', (table_name,))
+        return self.cursor.fetchone() is not None
+
+    # Add a new user to the database. The password is stored hashed, which takes a while:
+    # call this off the UI thread.
+    @instrumented
     def add_user(self, user):
+        password = self.password_hasher.hash(user.password) if user.password is not None else None
         self.cursor.execute('''INSERT INTO users (username, password, name, email, favorite_genre)
                                 VALUES (?, ?, ?, ?, ?)''',
-                            (user.username, user.password, user.name, user.email, user.favorite_genre))
+                            (user.username, password, user.name, user.email, user.favorite_genre))
         self.connection.commit()
+        self.forget_user(user.username)
 
-    # Retrieve user information from the database
+    # Retrieve user information from the database; password is the stored hash
+    @instrumented
     def get_user(self, username):
-        self.cursor.execute('''SELECT * FROM users WHERE username = ?''', (username,))
-        user_data = self.cursor.fetchone()
-        if user_data:
-            return User(user_data[0], user_data[1], user_data[2], user_data[3], user_data[4])
-        else:
+        with self.user_cache_lock:
+            user_data = self.user_cache.get(username)
+            if user_data:
+                self.user_cache.move_to_end(username)
+        if not user_data:
+            self.cursor.execute('''SELECT * FROM users WHERE username = ?''', (username,))
+            user_data = self.cursor.fetchone()
+            if not user_data:
+                return None
+            with self.user_cache_lock:
+                self.user_cache[username] = user_data
+                if len(self.user_cache) > self.user_cache_size:
+                    self.user_cache.popitem(last=False)
+        return User(user_data[0], user_data[1], user_data[2], user_data[3], user_data[4])
+
+    # Drop a user's cached row, or every cached row
+    def forget_user(self, username=None):
+        with self.user_cache_lock:
+            if username is None:
+                self.user_cache.clear()
+            else:
+                self.user_cache.pop(username, None)
+
+    # The user if the password is right, else None. A password stored in plaintext, or
+    # hashed with older parameters, is rehashed and replaced on a successful login (except
+    # on a read-only replica). Hashing is deliberately slow: call this off the UI thread.
+    @instrumented
+    def authenticate(self, username, password):
+        user = self.get_user(username)
+        if user is None:
+            return self.password_hasher.verify_nothing(password) or None
+        if not self.password_hasher.verify(password, user.password):
             return None
+        if not self.pool.read_only and self.password_hasher.needs_rehash(user.password):
+            new_hash = self.password_hasher.hash(password)
+            self.cursor.execute('''UPDATE users SET password = ? WHERE username = ? AND password IS ?''',
+                                (new_hash, username, user.password))
+            self.connection.commit()
+            self.forget_user(username)
+            user.password = new_hash
+        return user
 
     # Add a new book to the database
+    @instrumented
     def add_book(self, book, username, read_this_year=False):
-        if read_this_year:
-            table_name = 'books_read_this_year'
-        else:
-            table_name = 'books'
+        status = self.READ if read_this_year else self.OWNED
+        if self.write_behind:
+            self.queue_write(status, book, username)
+            return
 
-        self.cursor.execute(f'''INSERT INTO {table_name} (title, author, genre, year, username)
-                                VALUES (?, ?, ?, ?, ?)''',
-                            (book.title, book.author, book.genre, book.year, username))
-        self.connection.commit()
+        with self.connection:
+            before = self.begin_shelf_write([username])
+            self.insert_book(status, book, username)
+            after = self.shelf_versions(before)
+        self.shelf_written(before, after, {username: [(book.genre, book.author, book.year)]} if status == self.OWNED else {})
+
+    # Insert one book without committing: the catalog row if the book is new, then the user's link
+    def insert_book(self, status, book, username):
+        self.cursor.execute(self.CATALOG_INSERT, self.catalog_row(book))
+        self.cursor.execute(self.LINK_INSERT, self.link_row(book, username, status))
+        book.id = self.cursor.lastrowid
+        if status == self.OWNED:
+            self.resize_shelf(username, 1)
+            if username in self.search_indexes:
+                self.search_indexes[username].add(book)
+
+    # A book already in the catalog keeps its details; a cover given with it replaces the old one
+    CATALOG_INSERT = '''INSERT INTO catalog (book_key, title, author, genre, year, cover)
+                        VALUES (?, COALESCE(?, ''), COALESCE(?, ''), COALESCE(?, ''), COALESCE(?, ''), ?)
+                        ON CONFLICT (book_key) DO UPDATE SET cover = excluded.cover
+                        WHERE excluded.cover IS NOT NULL AND catalog.cover IS NOT excluded.cover'''
+    LINK_INSERT = '''INSERT INTO shelf_books (username, catalog_id, status, read_year)
+                     SELECT ?, id, ?, ? FROM catalog WHERE book_key = ?'''
+
+    @staticmethod
+    def catalog_row(book):
+        return (book_key(book.title, book.author, book.genre, book.year), book.title, book.author, book.genre,
+                book.year, book.cover)
+
+    # Books read this year also record the year they were read in
+    def link_row(self, book, username, status):
+        read_year = date.today().year if status == self.READ else None
+        return (username, status, read_year, book_key(book.title, book.author, book.genre, book.year))
+
+    # Queue a write-behind insert, flushing when the batch is full
+    def queue_write(self, status, book, username):
+        with self.write_lock:
+            self.pending_writes.append((status, book, username))
+            if len(self.pending_writes) >= self.flush_size:
+                self.flush()
+            elif self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    # Write every queued book in a single transaction (one commit for the whole batch).
+    # Reads call this first so a user always sees their own queued writes. durable also
+    # checkpoints the WAL into the database file, which is done on logout and exit.
+    @instrumented
+    def flush(self, durable=False):
+        with self.write_lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            pending, self.pending_writes = self.pending_writes, []
+            if pending:
+                try:
+                    with self.connection:
+                        before = self.begin_shelf_write({username for status, book, username in pending})
+                        for status, book, username in pending:
+                            self.insert_book(status, book, username)
+                        after = self.shelf_versions(before)
+                except Exception:
+                    self.pending_writes = pending + self.pending_writes
+                    raise
+                added = {}
+                for status, book, username in pending:
+                    if status == self.OWNED:
+                        added.setdefault(username, []).append((book.genre, book.author, book.year))
+                self.shelf_written(before, after, added)
+            if durable:
+                self.cursor.execute('PRAGMA wal_checkpoint(FULL)')
+
+    # Add many books in chunked transactions, one commit per batch instead of one per book.
+    # books can be any iterable (including a generator), it is consumed batch_size rows at a time.
+    @instrumented
+    def add_books(self, books, username, read_this_year=False, batch_size=1000, progress=None):
+        status = self.READ if read_this_year else self.OWNED
+        self.flush()
+        books = iter(books)
+        total = 0
+        while True:
+            batch = list(islice(books, batch_size))
+            if not batch:
+                break
+            with self.connection:
+                before = self.begin_shelf_write([username])
+                self.cursor.executemany(self.CATALOG_INSERT, [self.catalog_row(book) for book in batch])
+                self.cursor.executemany(self.LINK_INSERT, [self.link_row(book, username, status) for book in batch])
+                after = self.shelf_versions(before)
+            total += len(batch)
+            if read_this_year:
+                self.shelf_written(before, after, {})
+            else:
+                self.resize_shelf(username, len(batch))
+                self.search_indexes.pop(username, None)
+                self.shelf_written(before, after, {username: [(book.genre, book.author, book.year) for book in batch]})
+            if progress:
+                progress(total)
+        return total
 
     # Retrieve books associated with a particular user from the database
+    @instrumented
     def get_books(self, username):
-        self.cursor.execute('''SELECT * FROM books WHERE username = ?''', (username,))
-        books_data = self.cursor.fetchall()
-        books = []
-        for book_data in books_data:
-            books.append(Book(book_data[0], book_data[1], book_data[2], book_data[3]))
+        self.flush()
+        books = BookCollection()
+        for book_data in self.cursor.execute('''SELECT id, title, author, genre, year FROM books WHERE username = ?''', (username,)):
+            books.append_row(*book_data)
         return books
-    
-    # Remove a book from the database
-    def remove_book(self, book_title, username):
-        self.cursor.execute('''DELETE FROM books WHERE title = ? AND username = ?''', (book_title, username))
-        self.connection.commit()
 
-# Define a class representing a Login/Signup application window
-class LoginSignupApp(QWidget):
-    WINDOW_WIDTH = 550
-    WINDOW_HEIGHT = 350
+    # Stream a user's books as (title, author, genre, year) rows without holding the shelf in
+    # memory. A cursor of its own is read with fetchmany, so other queries can run in between.
+    def iter_book_rows(self, username, batch_size=1000):
+        self.flush()
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('''SELECT title, author, genre, year FROM books WHERE username = ? ORDER BY id''', (username,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cursor.close()
+
+    # Retrieve one page of a user's books in sort order. Paging is keyset based: pass the
+    # sort key of the last book of the previous page as after, as returned by page_key.
+    @instrumented
+    def get_books_page(self, username, sort_by='title', descending=False, after=None, limit=200):
+        if sort_by not in self.SORT_COLUMNS:
+            raise ValueError(f'Cannot sort books by {sort_by}')
+        self.flush()
+        direction = 'DESC' if descending else 'ASC'
+        comparison = '<' if descending else '>'
+        # Books are ordered by the sort column, then catalog id (the order of the catalog's sort
+        # indexes), then shelf id. Reading through the user's links sorts the whole shelf for
+        # every page; walking the catalog's sort index from the previous page's key and probing
+        # idx_shelf_books_username_catalog for each book costs about limit * catalog / shelf
+        # probes instead, which wins once the shelf holds more than sqrt(limit * catalog) books.
+        shelf_size = self.shelf_size(username)
+        self.cursor.execute('''SELECT MAX(id) FROM catalog''')
+        catalog_size = self.cursor.fetchone()[0] or 0
+        if shelf_size * shelf_size < limit * catalog_size:
+            query = '''SELECT id, title, author, genre, year, cover, catalog_id FROM books WHERE username = ?'''
+            params = [username]
+            if after is not None:
+                query += f''' AND ({sort_by}, catalog_id, id) {comparison} (?, ?, ?)'''
+                params.extend(after)
+            query += f''' ORDER BY {sort_by} {direction}, catalog_id {direction}, id {direction} LIMIT ?'''
+            self.cursor.execute(query, params + [limit])
+            rows = self.cursor.fetchall()
+        else:
+            walk = '''SELECT shelf_books.id, title, author, genre, year, cover, catalog.id
+                        FROM catalog CROSS JOIN shelf_books ON shelf_books.catalog_id = catalog.id
+                        WHERE username = ? AND status = 'owned' '''
+            rows = []
+            # The rest of the previous page's sort value first, so the walk starts from its
+            # catalog id instead of scanning every book with that value again
+            if after is not None:
+                self.cursor.execute(f'''{walk} AND {sort_by} = ? AND (catalog.id, shelf_books.id) {comparison} (?, ?)
+                                        ORDER BY catalog.id {direction}, shelf_books.id {direction} LIMIT ?''',
+                                    (username, *after, limit))
+                rows = self.cursor.fetchall()
+            if len(rows) < limit:
+                query, params = walk, [username]
+                if after is not None:
+                    query += f''' AND {sort_by} {comparison} ?'''
+                    params.append(after[0])
+                query += f''' ORDER BY {sort_by} {direction}, catalog.id {direction},
+                                           shelf_books.id {direction} LIMIT ?'''
+                self.cursor.execute(query, params + [limit - len(rows)])
+                rows += self.cursor.fetchall()
+        return [Book(row[1], row[2], row[3], row[4], id=row[0], cover=row[5], catalog_id=row[6]) for row in rows]
+
+    # Number of books the user owns, counted once and then kept by this Database's writes
+    def shelf_size(self, username):
+        size = self.shelf_sizes.get(username)
+        if size is None:
+            self.cursor.execute('''SELECT COUNT(*) FROM shelf_books WHERE username = ? AND status = 'owned' ''',
+                                (username,))
+            size = self.shelf_sizes[username] = self.cursor.fetchone()[0]
+        return size
+
+    def resize_shelf(self, username, change):
+        if username in self.shelf_sizes:
+            self.shelf_sizes[username] += change
+
+    # Set the cover of a shelved book (by its id, as get_books_page returns it), for every
+    # user who has the book; None removes it
+    @instrumented
+    def set_cover(self, book_id, cover):
+        self.flush()
+        self.cursor.execute('''UPDATE catalog SET cover = ?
+                               WHERE id = (SELECT catalog_id FROM shelf_books WHERE id = ?)''', (cover, book_id))
+        self.connection.commit()
+        return self.cursor.rowcount > 0
+
+    # Sort key of a book for get_books_page
+    @staticmethod
+    def page_key(book, sort_by):
+        return (getattr(book, sort_by), book.catalog_id, book.id)
+
+    # Reading goal and number of books read for a year (the current one by default)
+    @instrumented
+    def get_reading_progress(self, username, year=None):
+        self.flush()
+        year = year or date.today().year
+        self.cursor.execute('''SELECT goal, books_read FROM reading_progress WHERE username = ? AND year = ?''',
+                            (username, year))
+        row = self.cursor.fetchone()
+        if not row:
+            return self.DEFAULT_READING_GOAL, 0
+        return row[0] or self.DEFAULT_READING_GOAL, row[1]
+
+    # Set the reading goal for a year (the current one by default)
+    @instrumented
+    def set_reading_goal(self, username, goal, year=None):
+        year = year or date.today().year
+        self.cursor.execute('''INSERT INTO reading_progress (username, year, goal) VALUES (?, ?, ?)
+                               ON CONFLICT (username, year) DO UPDATE SET goal = excluded.goal''',
+                            (username, year, goal))
+        self.connection.commit()
 
-    def __init__(self, db):
-        super().__init__()
-        self.db = db
-        self.init_ui()
-
-    # Initialize the user interface
-    def init_ui(self):
-        self.setWindowTitle('Shelf - Login/Sign up')
-        self.setFixedSize(self.WINDOW_WIDTH, self.WINDOW_HEIGHT)
-
-        self.shelf_app = None
-
-        # Left side - Login/Signup fields
-        login_layout = QVBoxLayout()
-        
-        # Widgets for username and password input
-        self.username_label = QLabel('Username:')
-        self.username_edit = QLineEdit()
-
-        self.password_label = QLabel('Password:')
-        self.password_edit = QLineEdit()
-        self.password_edit.setEchoMode(QLineEdit.Password)
-
-        # Buttons for login and signup
-        self.login_button = QPushButton('Login')
-        self.login_button.clicked.connect(self.login)
-        self.login_button.setFixedSize(100, 50)
-
-        self.signup_button = QPushButton('Sign up')
-        self.signup_button.clicked.connect(self.signup_window)
-        self.signup_button.setFixedSize(100, 50)
-
-        # Adjust spacing and add widgets to layout
-        login_layout.addSpacing(60)
-        login_layout.addWidget(self.username_label)
-        login_layout.addWidget(self.username_edit)
-        login_layout.addWidget(self.password_label)
-        login_layout.addWidget(self.password_edit)
-        login_layout.addSpacing(60)
-
-        button_layout = QHBoxLayout()
-        button_layout.addWidget(self.login_button)
-        button_layout.addWidget(self.signup_button)
-        button_layout.addStretch()
-        login_layout.addLayout(button_layout)
-
-        # Right side - Logo
-        logo_layout = QVBoxLayout()
-        logo_layout.addStretch()
-
-        logo_label = QLabel()
-        pixmap = QPixmap('shelf.app.png')
-        logo_label.setPixmap(pixmap)
-        logo_label.setAlignment(Qt.AlignCenter)
-
-        logo_layout.addWidget(logo_label)
-
-        # Main layout combining left and right sides
-        main_layout = QHBoxLayout()
-        main_layout.addLayout(login_layout)
-        main_layout.addLayout(logo_layout)
-
-        self.setLayout(main_layout)
-
-    # Define a signal for successful login
-    login_successful_signal = pyqtSignal(str)
-
-    # Handle login process
-    def login(self):
-        username = self.username_edit.text()
-        password = self.password_edit.text()
-
-        user = self.db.get_user(username)
-        if user:
-            if user.password == password:
-                self.username_edit.clear()
-                self.password_edit.clear()
-                self.login_successful_signal.emit(username)
+    # The books a user read in a year, most recently added first
+    @instrumented
+    def get_books_read(self, username, year=None, limit=100):
+        self.flush()
+        year = year or date.today().year
+        self.cursor.execute('''SELECT id, title, author, genre, year FROM books_read_this_year
+                               WHERE username = ? AND read_year = ? ORDER BY id DESC LIMIT ?''',
+                            (username, year, limit))
+        return [Book(row[1], row[2], row[3], row[4], id=row[0]) for row in self.cursor.fetchall()]
+
+    # Summary of a user's shelf for the stats panel. The genre, author and decade counts are
+    # computed once and then kept up to date as books are added and removed through this
+    # Database, so only the first call reads the whole shelf; the reading figures are cheap
+    # and read every time. The counts are stamped with the user's shelf version they are
+    # current at, so a write to the shelf from another process or connection (which moves
+    # it) gets them counted again; writes to other shelves, users and covers don't.
+    @instrumented
+    def get_shelf_stats(self, username, today=None, top_authors=10):
+        self.flush()
+        today = today or date.today()
+        version = self.shelf_versions([username])[username]
+        with self.breakdown_lock:
+            cached = self.shelf_breakdowns.get(username)
+        if cached is None or cached[0] != version:
+            # One read transaction, so the counts are exactly those at the version they carry
+            with self.connection:
+                if not self.connection.in_transaction:
+                    self.cursor.execute('BEGIN')
+                cached = (self.shelf_versions([username])[username], self.book_breakdowns(username))
+            with self.breakdown_lock:
+                self.shelf_breakdowns[username] = cached
+        by_count = lambda item: (-item[1], item[0])
+        # Writes on other threads update the Counters in place
+        with self.breakdown_lock:
+            books, genres, authors, decades = cached[1]
+            genres = sorted(genres.items(), key=by_count)
+            authors = heapq.nsmallest(top_authors, authors.items(), key=by_count)
+            decades = sorted(decades.items(), key=lambda item: (item[0] is None, item[0] or 0))
+        goal, books_read = self.get_reading_progress(username, today.year)
+        user = self.get_user(username)
+        favorite_genre = user.favorite_genre if user and user.favorite_genre else ''
+        favorite_genre_read = 0
+        if favorite_genre:
+            self.cursor.execute('''SELECT COUNT(*) FROM books_read_this_year
+                                   WHERE username = ? AND read_year = ? AND genre = ? COLLATE NOCASE''',
+                                (username, today.year, favorite_genre))
+            favorite_genre_read = self.cursor.fetchone()[0]
+        days_in_year = (date(today.year + 1, 1, 1) - date(today.year, 1, 1)).days
+        return ShelfStats(books, genres, authors, decades, goal, books_read, today.timetuple().tm_yday, days_in_year, favorite_genre, favorite_genre_read)
+
+    # Book count and genre, author and decade Counters for a user's shelf, one GROUP BY each
+    def book_breakdowns(self, username):
+        self.cursor.execute('''SELECT COUNT(*) FROM shelf_books WHERE username = ? AND status = 'owned' ''', (username,))
+        books = self.cursor.fetchone()[0]
+        self.cursor.execute('''SELECT COALESCE(genre, ''), COUNT(*) FROM books WHERE username = ? GROUP BY 1''', (username,))
+        genres = Counter(dict(self.cursor.fetchall()))
+        self.cursor.execute('''SELECT COALESCE(author, ''), COUNT(*) FROM books WHERE username = ? GROUP BY 1''', (username,))
+        authors = Counter(dict(self.cursor.fetchall()))
+        self.cursor.execute('''SELECT CASE WHEN year GLOB '[0-9]*' AND year NOT GLOB '*[^0-9]*'
+                                           THEN CAST(year AS INTEGER) / 10 * 10 END, COUNT(*)
+                               FROM books WHERE username = ? GROUP BY 1''', (username,))
+        decades = Counter(dict(self.cursor.fetchall()))
+        return books, genres, authors, decades
+
+    # The shelf version (see create_shelf_versions) of each of the given users
+    def shelf_versions(self, usernames):
+        versions = dict.fromkeys(usernames, 0)
+        for chunk in range(0, len(versions), 500):
+            names = list(versions)[chunk:chunk + 500]
+            self.cursor.execute(f'''SELECT username, version FROM shelf_versions
+                                    WHERE username IN ({', '.join('?' * len(names))})''', names)
+            versions.update(self.cursor.fetchall())
+        return versions
+
+    # Start a write to the given users' shelves that shelf_written will account for. BEGIN
+    # IMMEDIATE takes the write lock first, so the versions returned are the ones it starts from.
+    def begin_shelf_write(self, usernames):
+        if not self.connection.in_transaction:
+            self.cursor.execute('BEGIN IMMEDIATE')
+        return self.shelf_versions(usernames)
+
+    # After a write through this Database moved the users' shelf versions from before to
+    # after, add (sign 1) or take away (sign -1) the books it changed, given per user as
+    # (genre, author, year) rows, from their cached breakdowns. A breakdown that missed some
+    # other write before this one is dropped instead, to be counted again; other users'
+    # breakdowns are left alone.
+    def shelf_written(self, before, after, rows, sign=1):
+        with self.breakdown_lock:
+            for username, version in before.items():
+                cached = self.shelf_breakdowns.pop(username, None)
+                if cached is None or cached[0] != version:
+                    continue
+                books, genres, authors, decades = cached[1]
+                for genre, author, year in rows.get(username, ()):
+                    genres[genre or ''] += sign
+                    authors[author or ''] += sign
+                    decades[publication_decade(year)] += sign
+                    books += sign
+                self.shelf_breakdowns[username] = (after[username], (books, +genres, +authors, +decades))
+
+    # Count a user's books
+    @instrumented
+    def count_books(self, username, read_this_year=False):
+        self.flush()
+        status = self.READ if read_this_year else self.OWNED
+        self.cursor.execute('''SELECT COUNT(*) FROM shelf_books WHERE username = ? AND status = ?''', (username, status))
+        return self.cursor.fetchone()[0]
+
+    # Count users and books across the whole database
+    @instrumented
+    def count_all(self):
+        self.flush()
+        counts = {}
+        for table_name in ('users', 'books', 'books_read_this_year', 'catalog'):
+            self.cursor.execute(f'''SELECT COUNT(*) FROM {table_name}''')
+            counts[table_name] = self.cursor.fetchone()[0]
+        return counts
+
+    # Remove every copy of a book from the user's shelf by its exact title, looked up through
+    # the catalog's title index and then the user's links
+    @instrumented
+    def remove_book(self, book_title, username):
+        self.flush()
+        with self.connection:
+            before = self.begin_shelf_write([username])
+            self.cursor.execute('''SELECT id, genre, author, year FROM books
+                                   WHERE username = ? AND catalog_id IN (SELECT id FROM catalog WHERE title = ?)''',
+                                (username, book_title))
+            rows = self.cursor.fetchall()
+            self.cursor.executemany('''DELETE FROM shelf_books WHERE id = ?''', [row[:1] for row in rows])
+            after = self.shelf_versions(before)
+        self.resize_shelf(username, -len(rows))
+        self.search_indexes.pop(username, None)
+        self.shelf_written(before, after, {username: [row[1:] for row in rows]}, -1)
+        return len(rows)
+
+    # Search a user's books by title, author and genre. Every word is a prefix match and all
+    # words must match; "author:" and "genre:" restrict a word to one field. Best matches first.
+    @instrumented
+    def search_books(self, username, query, limit=50):
+        terms = parse_search_query(query)
+        if not terms:
+            return []
+        self.flush()
+        if not self.fts_enabled:
+            if username not in self.search_indexes:
+                self.search_indexes[username] = TrigramIndex(self.get_books(username))
+            return self.search_indexes[username].search(terms, limit)
+
+        match = ' AND '.join(fts_term(field, term) for field, term in terms)
+        # The catalog's index ranks a common word's matches from every shelf, a second or more
+        # at a million books, before the user's are picked out
+        if self.shelf_size(username) <= self.SEARCH_SHELF_LIMIT:
+            self.index_shelf(username)
+            self.cursor.execute('''SELECT rowid, title, author, genre, year FROM temp.shelf_fts
+                                   WHERE shelf_fts MATCH ? ORDER BY rank LIMIT ?''', (match, limit))
+        else:
+            self.cursor.execute('''SELECT books.id, books.title, books.author, books.genre, books.year
+                                   FROM catalog_fts JOIN books ON books.catalog_id = catalog_fts.rowid
+                                   WHERE catalog_fts MATCH ? AND books.username = ?
+                                   ORDER BY catalog_fts.rank LIMIT ?''', (match, username, limit))
+        return [Book(row[1], row[2], row[3], row[4], id=row[0]) for row in self.cursor.fetchall()]
+
+    # Fill temp.shelf_fts with the user's books, unless it already holds them at their current
+    # shelf version. Temp tables belong to one connection, so each thread keeps the index of
+    # the last shelf it searched. The replica id is part of the stamp because a restore,
+    # which takes a new one, can bring back an older shelf at the same version.
+    def index_shelf(self, username):
+        stamp = (self.replica_id(), username, self.shelf_versions([username])[username])
+        try:
+            self.cursor.execute('''SELECT replica, username, version FROM temp.shelf_fts_version''')
+            if self.cursor.fetchone() == stamp:
                 return
+        except sqlite3.OperationalError:
+            self.cursor.execute('''CREATE VIRTUAL TABLE temp.shelf_fts USING fts5 (
+                                    title, author, genre, year UNINDEXED,
+                                    tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+            self.cursor.execute(f'''INSERT INTO temp.shelf_fts (shelf_fts, rank) VALUES ('rank', '{self.SEARCH_RANK}')''')
+            self.cursor.execute('''CREATE TABLE temp.shelf_fts_version (replica TEXT, username TEXT, version INTEGER)''')
+        with self.connection:
+            self.cursor.execute('''DELETE FROM temp.shelf_fts''')
+            self.cursor.execute('''INSERT INTO temp.shelf_fts (rowid, title, author, genre, year)
+                                   SELECT id, title, author, genre, year FROM books WHERE username = ?''', (username,))
+            self.cursor.execute('''DELETE FROM temp.shelf_fts_version''')
+            self.cursor.execute('''INSERT INTO temp.shelf_fts_version (replica, username, version) VALUES (?, ?, ?)''',
+                                stamp)
+
+    # Define a new item type for a user. Attributes listed in indexed (at most
+    # MAX_INDEXED_ATTRIBUTES) get an index of their own, so find_items filters on them without
+    # reading the JSON of every item.
+    @instrumented
+    def add_item_type(self, username, name, attributes, indexed=()):
+        if name == self.BOOK_TYPE.name:
+            raise ValueError(f'{name} is a built-in item type')
+        for attribute in attributes:
+            if not self.ATTRIBUTE_NAME.match(attribute):
+                raise ValueError(f'Invalid attribute name (use lowercase letters, digits and _): {attribute}')
+        if len(set(indexed)) > self.MAX_INDEXED_ATTRIBUTES:
+            raise ValueError(f'At most {self.MAX_INDEXED_ATTRIBUTES} attributes of an item type can be indexed')
+        with self.connection:
+            self.cursor.execute('''INSERT INTO item_types (username, name, attributes) VALUES (?, ?, ?)''',
+                                (username, name, json.dumps(list(attributes))))
+            item_type = ItemType(name, list(attributes), username, id=self.cursor.lastrowid)
+            for attribute in indexed:
+                if attribute not in attributes:
+                    raise ValueError(f'{name} has no attribute {attribute}')
+                self.index_attribute(item_type.id, attribute)
+        return item_type
+
+    # Index one attribute of one item type: a partial index over that type's items only, on
+    # the same json_extract expression find_items filters with. The items table itself never
+    # changes, so users can't run it into SQLite's column limit.
+    def index_attribute(self, type_id, attribute):
+        self.cursor.execute(f'''CREATE INDEX IF NOT EXISTS idx_items_{type_id}_{attribute}
+                                ON items (username, json_extract(attributes, '$.{attribute}'), title) WHERE type_id = {type_id}''')
+
+    # Look up an item type by name: the built-in book type, or one the user defined
+    @instrumented
+    def get_item_type(self, username, name):
+        if name == self.BOOK_TYPE.name:
+            return self.BOOK_TYPE
+        self.cursor.execute('''SELECT id, name, attributes FROM item_types WHERE username = ? AND name = ?''',
+                            (username, name))
+        row = self.cursor.fetchone()
+        if not row:
+            return None
+        return ItemType(row[1], json.loads(row[2]), username, id=row[0])
+
+    # Every item type available to a user, built-in ones first
+    @instrumented
+    def get_item_types(self, username):
+        self.cursor.execute('''SELECT id, name, attributes FROM item_types WHERE username = ? ORDER BY name''',
+                            (username,))
+        return [self.BOOK_TYPE] + [ItemType(row[1], json.loads(row[2]), username, id=row[0])
+                                   for row in self.cursor.fetchall()]
+
+    # Add an item of one of the user's types
+    @instrumented
+    def add_item(self, username, item):
+        if item.type_name == self.BOOK_TYPE.name:
+            book = Book(item.title, item.attributes.get('author', ''), item.attributes.get('genre', ''),
+                        item.attributes.get('year', ''))
+            self.add_book(book, username)
+            item.id = book.id
+            return item
+        item_type = self.get_item_type(username, item.type_name)
+        if item_type is None:
+            raise ValueError(f'Unknown item type: {item.type_name}')
+        unknown = set(item.attributes) - set(item_type.attributes)
+        if unknown:
+            raise ValueError(f"{item.type_name} has no attribute {', '.join(sorted(unknown))}")
+        self.cursor.execute('''INSERT INTO items (type_id, username, title, attributes) VALUES (?, ?, ?, ?)''',
+                            (item_type.id, username, item.title, json.dumps(item.attributes)))
+        item.id = self.cursor.lastrowid
+        self.connection.commit()
+        return item
+
+    # Items of one type whose attributes equal the values in filters, in title order.
+    # Attributes are matched through json_extract, which uses the type's index where it has one.
+    @instrumented
+    def find_items(self, username, type_name, filters=None, limit=200):
+        filters = filters or {}
+        item_type = self.get_item_type(username, type_name)
+        if item_type is None:
+            raise ValueError(f'Unknown item type: {type_name}')
+        for attribute in filters:
+            if attribute != 'title' and attribute not in item_type.attributes:
+                raise ValueError(f'{type_name} has no attribute {attribute}')
+
+        if item_type is self.BOOK_TYPE:
+            self.flush()
+            query = '''SELECT id, title, author, genre, year FROM books WHERE username = ?'''
+            params = [username]
+            for attribute, value in filters.items():
+                query += f''' AND {attribute} = ?'''
+                params.append(value)
+            self.cursor.execute(query + ''' ORDER BY title LIMIT ?''', params + [limit])
+            return [Item.from_book(Book(row[1], row[2], row[3], row[4], id=row[0])) for row in self.cursor.fetchall()]
+
+        # The type id is written into the query, so the planner can match the type's partial indexes
+        query = f'''SELECT id, title, attributes FROM items WHERE username = ? AND type_id = {item_type.id:d}'''
+        params = [username]
+        for attribute, value in filters.items():
+            if attribute == 'title':
+                query += ''' AND title = ?'''
             else:
-                QMessageBox.warning(self, 'Login Failed', 'Invalid username or password.')
-        else:
-            QMessageBox.warning(self, 'Login Failed', 'User not found.')
-
-    # Open signup window
-    def signup_window(self):
-        self.signup_app = SignupApp(self.db, self)
-        self.signup_app.show()
-
-    # Show main shelf application window
-    def show_shelf_app(self, username):
-        if not self.shelf_app:
-            self.shelf_app = ShelfApp(username, self.db, parent=self)
-            self.shelf_app.logout_signal.connect(self.clear_shelf_app)
+                query += f''' AND json_extract(attributes, '$.{attribute}') = ?'''
+            params.append(value)
+        self.cursor.execute(query + ''' ORDER BY title LIMIT ?''', params + [limit])
+        return [Item(row[1], type_name, json.loads(row[2]), id=row[0]) for row in self.cursor.fetchall()]
+
+    # Remove an item from a user's collections
+    @instrumented
+    def remove_item(self, username, item_id):
+        self.cursor.execute('''DELETE FROM items WHERE id = ? AND username = ?''', (item_id, username))
+        removed = self.cursor.rowcount
+        self.connection.commit()
+        return removed
+
+    # How far this database has seen every replica's changes: its own last sequence number
+    # and the last one applied from each peer. Pass it to a peer's changes_since.
+    @instrumented
+    def sync_vector(self):
+        self.flush()
+        replica = self.replica_id()
+        # This replica's own changes may have been compacted away
+        self.cursor.execute('''SELECT MAX(COALESCE(origin_seq, seq)) FROM changes
+                               WHERE origin = (SELECT id FROM sync_replicas WHERE replica = ?)''', (replica,))
+        latest = self.cursor.fetchone()[0] or 0
+        self.cursor.execute('''SELECT seq FROM sync_pruned WHERE origin = ?''', (replica,))
+        pruned = self.cursor.fetchone()
+        vector = {replica: max(latest, pruned[0] if pruned else 0)}
+        self.cursor.execute('''SELECT origin, seq FROM sync_peers''')
+        vector.update(self.cursor.fetchall())
+        return vector
+
+    def replica_id(self):
+        self.cursor.execute('''SELECT replica FROM sync_state''')
+        return self.cursor.fetchone()[0]
+
+    # The number changes store for a replica id, numbering it the first time it is seen
+    def replica_number(self, replica):
+        self.cursor.execute('''INSERT INTO sync_replicas (replica) VALUES (?) ON CONFLICT (replica) DO NOTHING''',
+                            (replica,))
+        self.cursor.execute('''SELECT id FROM sync_replicas WHERE replica = ?''', (replica,))
+        return self.cursor.fetchone()[0]
+
+    # Remember what a peer held after syncing with it, as its sync_vector
+    def record_peer(self, peer, vector):
+        with self.connection:
+            self.cursor.executemany('''INSERT INTO sync_acks (peer, origin, seq) VALUES (?, ?, ?)
+                                       ON CONFLICT (peer, origin) DO UPDATE SET seq = MAX(seq, excluded.seq)''',
+                                    [(peer, origin, seq) for origin, seq in vector.items()])
+
+    # Delete the changes every known peer already holds, except the latest one for each user
+    # and book, which apply_changes still needs to resolve conflicts. Returns how many were
+    # deleted. A database that has never synced knows no peers and keeps only those. Peers
+    # that don't have the deleted changes yet can no longer sync with this database and have
+    # to start from a backup of it instead. SQLite reuses the freed pages; VACUUM shrinks the
+    # file.
+    @instrumented
+    def compact_changes(self):
+        vector = self.sync_vector()
+        acks = {}
+        self.cursor.execute('''SELECT peer, origin, seq FROM sync_acks''')
+        for peer, origin, seq in self.cursor.fetchall():
+            acks.setdefault(peer, {})[origin] = seq
+        removed = 0
+        with self.connection:
+            for origin, latest in vector.items():
+                held = min((peer_vector.get(origin, 0) for peer_vector in acks.values()), default=latest)
+                if held <= 0:
+                    continue
+                self.cursor.execute('''DELETE FROM changes WHERE origin = (SELECT id FROM sync_replicas WHERE replica = ?)
+                                       AND COALESCE(origin_seq, seq) <= ?
+                                       AND NOT (entity != 'link' AND seq = (SELECT MAX(seq) FROM changes AS later
+                                                WHERE later.entity = changes.entity AND later.key = changes.key
+                                                AND later.entity != 'link'))''', (origin, held))
+                removed += self.cursor.rowcount
+                self.cursor.execute('''INSERT INTO sync_pruned (origin, seq) VALUES (?, ?)
+                                       ON CONFLICT (origin) DO UPDATE SET seq = MAX(seq, excluded.seq)''', (origin, held))
+        return removed
+
+    # Stream the changes a peer with the given sync_vector hasn't seen, in the order they were
+    # made here, as (origin, origin_seq, entity, op, key, data, changed_at) tuples. Raises
+    # ValueError when changes the peer lacks have been compacted away.
+    def changes_since(self, vector):
+        self.flush()
+        self.cursor.execute('''SELECT origin, seq FROM sync_pruned''')
+        for origin, seq in self.cursor.fetchall():
+            if vector.get(origin, 0) < seq:
+                raise ValueError(f'{self.path} no longer holds every change the peer is missing; '
+                                 f'start the peer from a backup of {self.path} instead')
+        streams = []
+        for origin in self.sync_vector():
+            cursor = self.connection.cursor()
+            cursor.execute(f'''SELECT seq, ?, COALESCE(origin_seq, seq), entity, op,
+                                      COALESCE(key, (SELECT hex(book_key) FROM catalog WHERE id = changes.catalog_id)),
+                                      CASE WHEN entity = 'link' THEN {self.LINK_DATA} ELSE data END, changed_at
+                               FROM changes WHERE origin = (SELECT id FROM sync_replicas WHERE replica = ?)
+                               AND COALESCE(origin_seq, seq) > ? ORDER BY COALESCE(origin_seq, seq)''',
+                           (origin, origin, vector.get(origin, 0)))
+            streams.append(cursor)
+        for row in heapq.merge(*streams):
+            yield row[1:]
+
+    # Apply changes from changes_since on a peer, in batches of one transaction each, and
+    # return how many were received. Changes already applied are skipped. Conflicts:
+    # - user and book rows are last writer wins, by change time and then replica id
+    # - a link insert always adds a copy of the book to the shelf, as add_book does
+    # - a link delete removes one matching copy, or nothing if none is left
+    @instrumented
+    def apply_changes(self, changes, batch_size=1000):
+        self.flush()
+        vector = self.sync_vector()
+        changes = iter(changes)
+        received = 0
+        while True:
+            batch = list(islice(changes, batch_size))
+            if not batch:
+                break
+            applied = {}
+            numbers = {}
+            with self.connection:
+                for origin, origin_seq, entity, op, key, data, changed_at in batch:
+                    if origin_seq <= vector.get(origin, 0):
+                        continue
+                    if entity == 'link' or self.is_latest_change(entity, key, changed_at, origin):
+                        if origin not in numbers:
+                            numbers[origin] = self.replica_number(origin)
+                        self.cursor.execute('''UPDATE sync_state SET origin = ?, origin_seq = ?, changed_at = ?''',
+                                            (numbers[origin], origin_seq, changed_at))
+                        self.apply_change(entity, op, key, json.loads(data) if data else None)
+                    vector[origin] = applied[origin] = origin_seq
+                self.cursor.execute('''UPDATE sync_state SET origin = (SELECT id FROM sync_replicas WHERE replica = sync_state.replica),
+                                       origin_seq = NULL, changed_at = NULL''')
+                self.cursor.executemany('''INSERT INTO sync_peers (origin, seq) VALUES (?, ?)
+                                           ON CONFLICT (origin) DO UPDATE SET seq = excluded.seq''', applied.items())
+            received += len(batch)
+        if received:
+            self.search_indexes.clear()
+            self.shelf_sizes.clear()
+            self.forget_user()
+        return received
+
+    # Whether a change made at changed_at on origin is newer than the last one logged here
+    # for the same user or book
+    def is_latest_change(self, entity, key, changed_at, origin):
+        self.cursor.execute('''SELECT changed_at, replica FROM changes JOIN sync_replicas ON sync_replicas.id = origin
+                               WHERE entity = ? AND key = ? AND entity != 'link' ORDER BY seq DESC LIMIT 1''', (entity, key))
+        latest = self.cursor.fetchone()
+        return latest is None or (changed_at, origin) > latest
+
+    def apply_change(self, entity, op, key, row):
+        if entity == 'user' and op == 'upsert':
+            self.cursor.execute('''INSERT INTO users (username, password, name, email, favorite_genre)
+                                   VALUES (:username, :password, :name, :email, :favorite_genre)
+                                   ON CONFLICT (username) DO UPDATE
+                                   SET password = COALESCE(excluded.password, users.password), name = excluded.name, email = excluded.email,
+                                   favorite_genre = excluded.favorite_genre''', row)
+        elif entity == 'user' and op == 'delete':
+            self.cursor.execute('''DELETE FROM users WHERE username = ?''', (key,))
+        elif entity == 'book':
+            self.cursor.execute('''INSERT INTO catalog (book_key, title, author, genre, year)
+                                   VALUES (:book_key, COALESCE(:title, ''), COALESCE(:author, ''), COALESCE(:genre, ''),
+                                           COALESCE(:year, ''))
+                                   ON CONFLICT (book_key) DO UPDATE SET title = excluded.title,
+                                   author = excluded.author, genre = excluded.genre, year = excluded.year''',
+                                dict(row, book_key=bytes.fromhex(key)))
+        elif op == 'insert':
+            self.cursor.execute('''INSERT INTO shelf_books (username, catalog_id, status, read_year)
+                                   SELECT :username, id, :status, :read_year FROM catalog WHERE book_key = :book_key''',
+                                dict(row, book_key=bytes.fromhex(key)))
         else:
-            self.shelf_app.clear_book_list()
-        self.shelf_app.show()
-    
-    # Clear shelf application window
-    def clear_shelf_app(self):
-        self.shelf_app.clear_book_list()
-
-    # Show login/signup window
-    def show_login_signup_window(self):
-        self.show()
-
-# Define a class representing a Signup window
-class SignupApp(QWidget):
-    WINDOW_WIDTH = 400
-    WINDOW_HEIGHT = 400
-
-    def __init__(self, db, parent):
-        super().__init__()
-        self.db = db
-        self.parent = parent
-        self.init_ui()
-
-    # Initialize the user interface
-    def init_ui(self):
-        self.setWindowTitle('Shelf - Sign up')
-        self.setFixedSize(self.WINDOW_WIDTH, self.WINDOW_HEIGHT)
-
-        # Widgets for user information input
-        self.name_label = QLabel('Name:')
-        self.name_edit = QLineEdit()
-
-        self.email_label = QLabel('Email:')
-        self.email_edit = QLineEdit()
-
-        self.username_label = QLabel('Username:')
-        self.username_edit = QLineEdit()
-
-        self.password_label = QLabel('Password:')
-        self.password_edit = QLineEdit()
-        self.password_edit.setEchoMode(QLineEdit.Password)
-
-        self.genre_label = QLabel('Favorite Genre:')
-        self.genre_edit = QLineEdit()
-
-        # Button for signup
-        self.signup_button = QPushButton('Sign up')
-        self.signup_button.clicked.connect(self.signup)
-
-        # Add widgets to layout
-        layout = QVBoxLayout()
-        layout.addWidget(self.name_label)
-        layout.addWidget(self.name_edit)
-        layout.addWidget(self.email_label)
-        layout.addWidget(self.email_edit)
-        layout.addWidget(self.username_label)
-        layout.addWidget(self.username_edit)
-        layout.addWidget(self.password_label)
-        layout.addWidget(self.password_edit)
-        layout.addWidget(self.genre_label)
-        layout.addWidget(self.genre_edit)
-        layout.addWidget(self.signup_button)
-
-        self.setLayout(layout)
-
-    # Handle signup process
-    def signup(self):
-        name = self.name_edit.text()
-        email = self.email_edit.text()
-        username = self.username_edit.text()
-        password = self.password_edit.text()
-        favorite_genre = self.genre_edit.text()
-
-        if not name or not email or not username or not password:
-            QMessageBox.warning(self, 'Sign up Failed', 'Please fill in all the fields.')
-            return
-
-        existing_user = self.db.get_user(username)
-        if existing_user:
-            QMessageBox.warning(self, 'Sign up Failed', 'Username already exists. Please choose a different one.')
-            return
-
-        new_user = User(username, password, name, email, favorite_genre)
-        self.db.add_user(new_user)
-        QMessageBox.information(self, 'Sign up Successful', 'You have successfully signed up!')
-        self.parent.show()
-        self.close()
-
-# Define a class representing the main Shelf application window
-class ShelfApp(QWidget):
-    WINDOW_WIDTH = 800
-    WINDOW_HEIGHT = 600
-
-    # Define a class-level logout signal
-    logout_signal = pyqtSignal()
-
-    def __init__(self, username, db, parent=None):
-        super().__init__(parent)
-        self.username = username
-        self.db = db
-        self.books = self.db.get_books(username)
-        self.books_read_this_year = []
-        self.init_ui()
-
-    # Initialize the user interface
-    def init_ui(self):
-        self.setWindowTitle('Shelf - Book Collection Manager')
-        self.setFixedSize(self.WINDOW_WIDTH, self.WINDOW_HEIGHT)
-
-        # Left side - Book management fields
-        book_layout = QVBoxLayout()
-
-        # Widgets for adding, removing, searching, and listing books
-        self.title_label = QLabel('Title:')
-        self.title_edit = QLineEdit()
-
-        self.author_label = QLabel('Author:')
-        self.author_edit = QLineEdit()
-
-        self.genre_label = QLabel('Genre:')
-        self.genre_edit = QLineEdit()
-
-        self.year_label = QLabel('Year:')
-        self.year_edit = QLineEdit()
-
-        self.add_button = QPushButton('Add Book')
-        self.add_button.clicked.connect(self.add_book)
-
-        self.remove_label = QLabel('Remove Book:')
-        self.remove_edit = QLineEdit()
-
-        self.remove_button = QPushButton('Remove Book')
-        self.remove_button.clicked.connect(self.remove_book)
-
-        self.search_label = QLabel('Search Book:')
-        self.search_edit = QLineEdit()
-
-        self.search_button = QPushButton('Search Book')
-        self.search_button.clicked.connect(self.search_book)
-
-        self.list_button = QPushButton('List all Books')
-        self.list_button.clicked.connect(self.list_books)
-
-        self.quit_button = QPushButton('Log Out')
-        self.quit_button.clicked.connect(self.logout)
-
-        # Add widgets to layout
-        book_layout.addWidget(self.title_label)
-        book_layout.addWidget(self.title_edit)
-        book_layout.addWidget(self.author_label)
-        book_layout.addWidget(self.author_edit)
-        book_layout.addWidget(self.genre_label)
-        book_layout.addWidget(self.genre_edit)
-        book_layout.addWidget(self.year_label)
-        book_layout.addWidget(self.year_edit)
-        book_layout.addWidget(self.add_button)
-        book_layout.addWidget(self.remove_label)
-        book_layout.addWidget(self.remove_edit)
-        book_layout.addWidget(self.remove_button)
-        book_layout.addWidget(self.search_label)
-        book_layout.addWidget(self.search_edit)
-        book_layout.addWidget(self.search_button)
-        book_layout.addWidget(self.list_button)
-        book_layout.addWidget(self.quit_button)
-
-        # Right side - Vertical layout for reading goal, books read this year, and output text
-        right_layout = QVBoxLayout()
-
-        # Input field for adding books read this year
-        input_layout = QVBoxLayout()
-
-        input_label = QLabel('Add Book Read This Year:')
-        self.input_field = QLineEdit()
-        
-        self.add_button = QPushButton('Add')
-        self.add_button.clicked.connect(self.add_book_read_this_year)
-
-        input_layout.addWidget(input_label)
-        input_layout.addWidget(self.input_field)
-        input_layout.addWidget(self.add_button)
-
-        right_layout.addLayout(input_layout)
-
-        # Reading goal and progress bar
-        goal_layout = QVBoxLayout()
-
-        self.goal_label = QLabel('Reading Goal:')
-        self.goal_value = QLabel('50 books')  # Static reading goal value
-
-        self.progress_bar = QProgressBar()
-        self.progress_bar.setValue(30)  # Example value, update dynamically based on user progress
-
-        goal_layout.addWidget(self.goal_label)
-        goal_layout.addWidget(self.goal_value)
-        goal_layout.addWidget(self.progress_bar)
-
-        right_layout.addLayout(goal_layout)
-
-        # Books read this year
-        books_read_layout = QVBoxLayout()
-
-        books_read_label = QLabel('Books Read This Year:')
-        self.books_read_text = QTextEdit()
-
-        books_read_layout.addWidget(books_read_label)
-        books_read_layout.addWidget(self.books_read_text)
-
-        right_layout.addLayout(books_read_layout)
-
-        # Output text
-        output_layout = QVBoxLayout()
-
-        self.output_text = QTextEdit()
-
-        output_layout.addWidget(self.output_text)
-
-        right_layout.addLayout(output_layout)
-
-        # Main layout combining left and right sides
-        main_layout = QHBoxLayout()
-        main_layout.addLayout(book_layout)
-        main_layout.addLayout(right_layout)
-
-        self.setLayout(main_layout)
-
-    # Show books read this year
-    def show_books_read(self):
-        self.books_read_text.clear()
-        for book in self.books_read_this_year:
-            self.books_read_text.append(f"{book.title} by {book.author}")
-
-    # Add a book to books read this year
-    def add_book_read_this_year(self):
-        book_title = self.input_field.text()
-
-        if book_title:
-            book = Book(title=book_title, author='', genre='', year='')
-            self.db.add_book(book, self.username, read_this_year=True)
-            self.books_read_this_year.append(book)
-            current_value = self.progress_bar.value()
-            max_value = self.progress_bar.maximum()
-            if current_value < max_value:
-                self.progress_bar.setValue(current_value + 1)
-            self.input_field.clear()
-
-    # Logout and emit logout signal
-    def logout(self):
-        self.close()
-        self.logout_signal.emit()
-
-    # Clear book list
-    def clear_book_list(self):
-        self.books = []
-        self.output_text.clear()
-
-    # Add a book to the collection
-    def add_book(self):
-        title = self.title_edit.text()
-        author = self.author_edit.text()
-        genre = self.genre_edit.text()
-        year = self.year_edit.text()
-
-        new_book = Book(title, author, genre, year)
-        self.db.add_book(new_book, self.username)
-        self.books.append(new_book)
-        self.output_text.append("Book added successfully!")
-        self.clear_text_fields()
+            self.cursor.execute('''DELETE FROM shelf_books WHERE id = (
+                                       SELECT shelf_books.id FROM shelf_books JOIN catalog ON catalog.id = catalog_id
+                                       WHERE book_key = :book_key AND username = :username AND status = :status
+                                       AND read_year IS :read_year LIMIT 1)''',
+                                dict(row, book_key=bytes.fromhex(key)))
+
+# Method of ShardedDatabase that runs a Database method on the shard of the user it is
+# given; position is where the username comes in its arguments
+def routed_to_shard(name, position):
+    method = getattr(Database, name)
+
+    @functools.wraps(method)
+    def route(self, *args, **kwargs):
+        username = kwargs['username'] if 'username' in kwargs else args[position]
+        with self.shard(username) as db:
+            return method(db, *args, **kwargs)
+    return route
+
+# Optional sharded storage for many users. A directory database (an ordinary shelf.db)
+# holds the users and maps each one to a shard file of their own, where their books,
+# reading progress and collections live, so users write to separate files and never wait
+# on each other's write lock, and no one file grows with the number of users. Shards are
+# full Databases, opened when a user is first used and kept in an LRU of at most max_open;
+# one still in use by another thread is not closed until it has been released. It offers
+# the per-user Database methods, so import_books and export_books work on it unchanged.
+# Whole-file operations (backup, restore, sync) stay on Database, one file at a time.
+class ShardedDatabase:
+    SORT_COLUMNS = Database.SORT_COLUMNS
+    DEFAULT_READING_GOAL = Database.DEFAULT_READING_GOAL
+    page_key = staticmethod(Database.page_key)
+    # Shards get a smaller page cache than a single shelf.db, since many are open at once
+    SHARD_CACHE_SIZE = -2000
+
+    # options (write_behind, flush_size, flush_interval, stats) are passed to every Database
+    def __init__(self, path='shelf.db', shards_directory=None, max_open=64, **options):
+        self.path = path
+        self.shards_directory = shards_directory or os.path.splitext(path)[0] + '-shards'
+        self.max_open = max_open
+        self.options = options
+        self.directory = Database(path, **options)
+        # Covers are content-addressed, so all shards share one store
+        self.covers_directory = self.directory.covers_directory
+        self.shard_names = {}
+        # Open shards by file name, least recently used first: [database, threads using it]
+        self.open_shards = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Users live in the directory, with a copy of their profile (but not their password) in
+    # their shard, so the shard's own queries, like get_shelf_stats, can read it
+    def add_user(self, user):
+        self.directory.add_user(user)
+        with self.shard(user.username) as db:
+            db.add_user(User(user.username, None, user.name, user.email, user.favorite_genre))
 
-    # Remove a book from the collection
-    def remove_book(self):
-        title = self.remove_edit.text()
-        for book in self.books:
-            if book.title == title:
-                self.db.remove_book(title, self.username)
-                self.books.remove(book)
-                self.output_text.append("Book removed successfully!")
-                self.clear_text_fields()
-                return
-        self.output_text.append("Book not found in the collection.")
-        self.clear_text_fields()
-
-    # Search for a book in the collection
-    def search_book(self):
-        title = self.search_edit.text()
-        for book in self.books:
-            if book.title == title:
-                self.output_text.append(f"Title: {book.title}, Author: {book.author}, Genre: {book.genre}, Year: {book.year}")
+    def get_user(self, username):
+        return self.directory.get_user(username)
+
+    def authenticate(self, username, password):
+        return self.directory.authenticate(username, password)
+
+    # File name of a user's shard, assigned from a hash of the username the first time
+    def shard_name(self, username):
+        name = self.shard_names.get(username)
+        if name:
+            return name
+        cursor = self.directory.cursor
+        cursor.execute('''SELECT shard FROM user_shards WHERE username = ?''', (username,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('''SELECT 1 FROM users WHERE username = ?''', (username,))
+            if cursor.fetchone() is None:
+                raise ValueError(f'Unknown user: {username}')
+            digest = hashlib.blake2b(username.encode('utf-8'), digest_size=12).hexdigest()
+            cursor.execute('''INSERT INTO user_shards (username, shard) VALUES (?, ?)
+                              ON CONFLICT (username) DO NOTHING''', (username, f'{digest[:2]}/{digest}.db'))
+            self.directory.connection.commit()
+            cursor.execute('''SELECT shard FROM user_shards WHERE username = ?''', (username,))
+            row = cursor.fetchone()
+        self.shard_names[username] = row[0]
+        return row[0]
+
+    # Use the Database of a user's shard, opening it if needed:
+    #     with sharded.shard(username) as db: ...
+    @contextmanager
+    def shard(self, username):
+        name = self.shard_name(username)
+        db = self.acquire(name)
+        try:
+            yield db
+        finally:
+            self.release(name)
+
+    def acquire(self, name):
+        with self.lock:
+            entry = self.open_shards.get(name)
+            if entry is None:
+                path = os.path.join(self.shards_directory, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                db = Database(path, pool=ConnectionPool(path, cache_size=self.SHARD_CACHE_SIZE,
+                                                        stats=self.options.get('stats')), **self.options)
+                db.covers_directory = self.covers_directory
+                entry = self.open_shards[name] = [db, 0]
+            self.open_shards.move_to_end(name)
+            entry[1] += 1
+            return entry[0]
+
+    # Stop using a shard, closing the least recently used idle shards over max_open
+    def release(self, name):
+        closing = []
+        with self.lock:
+            self.open_shards[name][1] -= 1
+            excess = len(self.open_shards) - self.max_open
+            if excess > 0:
+                for old_name, (db, users) in list(self.open_shards.items()):
+                    if users == 0:
+                        del self.open_shards[old_name]
+                        closing.append(db)
+                        excess -= 1
+                        if excess == 0:
+                            break
+        for db in closing:
+            db.close()
+
+    add_book = routed_to_shard('add_book', 1)
+    add_books = routed_to_shard('add_books', 1)
+    get_books = routed_to_shard('get_books', 0)
+    get_books_page = routed_to_shard('get_books_page', 0)
+    get_reading_progress = routed_to_shard('get_reading_progress', 0)
+    set_reading_goal = routed_to_shard('set_reading_goal', 0)
+    get_books_read = routed_to_shard('get_books_read', 0)
+    get_shelf_stats = routed_to_shard('get_shelf_stats', 0)
+    count_books = routed_to_shard('count_books', 0)
+    remove_book = routed_to_shard('remove_book', 1)
+    search_books = routed_to_shard('search_books', 0)
+    add_item_type = routed_to_shard('add_item_type', 0)
+    get_item_type = routed_to_shard('get_item_type', 0)
+    get_item_types = routed_to_shard('get_item_types', 0)
+    add_item = routed_to_shard('add_item', 0)
+    find_items = routed_to_shard('find_items', 0)
+    remove_item = routed_to_shard('remove_item', 0)
+
+    # A generator, so the shard is held until the rows have been read
+    def iter_book_rows(self, username, batch_size=1000):
+        with self.shard(username) as db:
+            yield from db.iter_book_rows(username, batch_size)
+
+    # Users from the directory and books summed over every shard (catalog counts distinct
+    # books per shard, so a book shelved by two users counts twice)
+    def count_all(self):
+        counts = {'users': self.directory.count_all()['users'], 'books': 0, 'books_read_this_year': 0, 'catalog': 0}
+        self.directory.cursor.execute('''SELECT username FROM user_shards''')
+        for (username,) in self.directory.cursor.fetchall():
+            with self.shard(username) as db:
+                shard_counts = db.count_all()
+            for table_name in ('books', 'books_read_this_year', 'catalog'):
+                counts[table_name] += shard_counts[table_name]
+        return counts
+
+    def flush(self, durable=False):
+        with self.lock:
+            shards = [db for db, _ in self.open_shards.values()]
+        for db in shards:
+            db.flush(durable)
+        self.directory.flush(durable)
+
+    def close(self):
+        with self.lock:
+            shards = [db for db, _ in self.open_shards.values()]
+            self.open_shards.clear()
+        for db in shards:
+            db.close()
+        self.directory.close()
+
+SEARCH_FIELDS = ('title', 'author', 'genre')
+
+# Split a search box query into (field, term) pairs; field is None when the word can match any field
+def parse_search_query(query):
+    terms = []
+    for word in query.lower().split():
+        field, _, term = word.rpartition(':')
+        if field not in SEARCH_FIELDS:
+            field, term = None, word
+        if term:
+            terms.append((field, term))
+    return terms
+
+# Quote a term as an FTS5 prefix query, optionally limited to one column
+def fts_term(field, term):
+    quoted = '"' + term.replace('"', '""') + '"*'
+    if field:
+        return f'{field} : {quoted}'
+    return quoted
+
+# In-process fallback for search_books when FTS5 is unavailable. Each word is indexed by
+# its trigrams with two leading spaces, so any prefix of a word (even one letter) maps to
+# trigrams that word contains and candidates are found without scanning every book.
+class TrigramIndex:
+    def __init__(self, books=()):
+        self.books = {}
+        self.trigrams = {}
+        for book in books:
+            self.add(book)
+
+    @staticmethod
+    def prefix_trigrams(word):
+        padded = '  ' + word
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, book):
+        self.books[book.id] = book
+        for field in SEARCH_FIELDS:
+            for word in (getattr(book, field) or '').lower().split():
+                for trigram in self.prefix_trigrams(word):
+                    self.trigrams.setdefault(trigram, set()).add(book.id)
+
+    def search(self, terms, limit=50):
+        candidates = None
+        for _, term in terms:
+            for trigram in self.prefix_trigrams(term):
+                ids = self.trigrams.get(trigram, set())
+                candidates = ids.copy() if candidates is None else candidates & ids
+        results = []
+        for book_id in candidates or ():
+            book = self.books[book_id]
+            score = 0
+            for field, term in terms:
+                fields = [field] if field else SEARCH_FIELDS
+                matched = [name for name in fields
+                           if any(word.startswith(term) for word in (getattr(book, name) or '').lower().split())]
+                if not matched:
+                    break
+                score += 2 if 'title' in matched else 1
+            else:
+                results.append((-score, book.title, book))
+        results.sort(key=lambda result: result[:2])
+        return [book for _, _, book in results[:limit]]
+
+BOOK_FIELDS = ('title', 'author', 'genre', 'year')
+
+# xz at preset 1 needs under 10 MB to compress; the default preset allocates about 94 MB
+def open_xz(path, mode, **options):
+    if 'w' in mode:
+        options['preset'] = 1
+    return lzma.open(path, mode, **options)
+
+# A .gz, .bz2 or .xz suffix on an import or export path compresses the file with that codec
+BOOK_COMPRESSION = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': open_xz}
+
+# Split a path like shelf.csv.gz into its format extension and compression suffix
+def book_file_format(path):
+    root, extension = os.path.splitext(path.lower())
+    if extension in BOOK_COMPRESSION:
+        return os.path.splitext(root)[1], extension
+    return extension, None
+
+# Open a text file, compressed according to its suffix
+def open_book_file(path, mode):
+    compression = book_file_format(path)[1]
+    if compression:
+        return BOOK_COMPRESSION[compression](path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+# Read books from a CSV file with title, author, genre and year columns, one row at a time
+def read_books_csv(path):
+    with open_book_file(path, 'r') as csv_file:
+        for row in csv.DictReader(csv_file):
+            yield Book(row.get('title') or '', row.get('author') or '', row.get('genre') or '', row.get('year') or '',
+                       cover=row.get('cover') or None)
+
+# Read books from a JSON Lines file, one object per line
+def read_books_jsonl(path):
+    with open_book_file(path, 'r') as jsonl_file:
+        for line in jsonl_file:
+            if line.strip():
+                row = json.loads(line)
+                yield Book(row.get('title') or '', row.get('author') or '', row.get('genre') or '', str(row.get('year') or ''),
+                           cover=row.get('cover') or None)
+
+BOOK_READERS = {'.csv': read_books_csv, '.jsonl': read_books_jsonl}
+
+# Stream a CSV or JSONL catalog into a user's shelf. Works without a GUI; progress(count)
+# is called after every committed batch. An optional cover column names an image file,
+# relative to the catalog file, which is copied into the database's cover store.
+def import_books(db, path, username, read_this_year=False, progress=None):
+    extension = book_file_format(path)[0]
+    if extension not in BOOK_READERS:
+        raise ValueError(f'Unsupported import format: {path}')
+    books = import_covers(db, BOOK_READERS[extension](path), os.path.dirname(os.path.abspath(path)))
+    return db.add_books(books, username, read_this_year=read_this_year, progress=progress)
+
+# Replace the image paths of books being imported by their names in the cover store. A
+# missing or unreadable image is logged and the book is imported without a cover.
+def import_covers(db, books, directory):
+    for book in books:
+        if book.cover:
+            try:
+                book.cover = store_cover(db.covers_directory, os.path.join(directory, book.cover))
+            except OSError as error:
+                logger.warning('Skipping cover of %r: %s', book.title, error)
+                book.cover = None
+        yield book
+
+# Covers are stored content-addressed: an image is named by the hash of its bytes (keeping
+# its extension), so importing the same picture twice stores it once, and a name never
+# changes meaning, which lets thumbnails be cached by it forever.
+
+# Copy an image file into the cover store and return its name there
+def store_cover(covers_directory, image_path):
+    with open(image_path, 'rb') as image_file:
+        data = image_file.read()
+    extension = os.path.splitext(image_path)[1].lower()
+    name = hashlib.blake2b(data, digest_size=16).hexdigest() + extension
+    path = cover_path(covers_directory, name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file_atomically(path, data)
+    return name
+
+# Where a cover is stored; the first two hex digits pick a subdirectory so none grows huge
+def cover_path(covers_directory, name):
+    return os.path.join(covers_directory, name[:2], name)
+
+# Write a file next to path and rename it into place, so readers never see half of it
+def write_file_atomically(path, data):
+    partial = f'{path}.{os.getpid()}.{threading.get_ident()}.partial'
+    with open(partial, 'wb') as output:
+        output.write(data)
+    os.replace(partial, path)
+
+# Set a book's cover from an image file
+def import_cover(db, book, image_path):
+    cover = store_cover(db.covers_directory, image_path)
+    db.set_cover(book.id, cover)
+    book.cover = cover
+    return cover
+
+# Size-bounded, content-addressed on-disk cache of encoded thumbnails. Keys are cover names
+# plus the thumbnail size, so an entry never goes stale and is only ever dropped to make
+# room: once the files add up to more than max_bytes the least recently used are deleted.
+# Recency is kept in the files' modification times, so it survives restarts. Safe to use
+# from several threads; the cache doesn't decode images itself (that needs Qt, see
+# shelf_gui.CoverLoader).
+class ThumbnailCache:
+    def __init__(self, directory, max_bytes=64 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # Entry sizes, least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith('.png'):
+                status = entry.stat()
+                files.append((status.st_mtime, entry.name[:-4], status.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.size += size
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.png')
+
+    # Path of a cached thumbnail, or None, marking it as just used
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.size -= self.entries.pop(key, 0)
+            return None
+        return path
+
+    # Store an encoded (PNG) thumbnail and evict the least recently used ones over the limit
+    def put(self, key, data):
+        path = self.path(key)
+        write_file_atomically(path, data)
+        evicted = []
+        with self.lock:
+            self.size += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.size -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except FileNotFoundError:
+                pass
+        return path
+
+# The writers below take (title, author, genre, year) rows, as Database.iter_book_rows
+# yields them, and write them out as they arrive.
+
+# Write books to a CSV file
+def write_books_csv(rows, path):
+    with open_book_file(path, 'w') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(BOOK_FIELDS)
+        writer.writerows(rows)
+
+# Write books to a JSON Lines file. Each object is filled into a template field by field,
+# which is twice as fast as encoding a dict per row.
+def write_books_jsonl(rows, path):
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    line = '{' + ', '.join(f'"{field}": %s' for field in BOOK_FIELDS) + '}\n'
+    with open_book_file(path, 'w') as jsonl_file:
+        for row in rows:
+            jsonl_file.write(line % tuple(map(encode, row)))
+
+# Write books as Arrow record batches of batch_size rows, so only one batch is in memory.
+# pyarrow is optional: the columnar formats are unavailable without it.
+def write_books_arrow(rows, path, parquet=False, batch_size=65536):
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError(f'Exporting to {path} needs pyarrow (pip install pyarrow)') from None
+    schema = pyarrow.schema([(field, pyarrow.string()) for field in BOOK_FIELDS])
+    if parquet:
+        writer = pyarrow.parquet.ParquetWriter(path, schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_file(path, schema, options=pyarrow.ipc.IpcWriteOptions(compression='zstd'))
+    with writer:
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
                 return
-        self.output_text.append("Book not found in the collection.")
-        self.clear_text_fields()
-
-    # List all books in the collection
-    def list_books(self):
-        if not self.books:
-            self.output_text.append("No books in the collection.")
-            return
-        self.output_text.append("Listing all books:")
-        for book in self.books:
-            self.output_text.append(f"Title: {book.title}, Author: {book.author}, Genre: {book.genre}, Year: {book.year}")
-
-    # Clear input fields
-    def clear_text_fields(self):
-        self.title_edit.clear()
-        self.author_edit.clear()
-        self.genre_edit.clear()
-        self.year_edit.clear()
-        self.remove_edit.clear()
-        self.search_edit.clear()
-
-# Define a class representing the main application
-class ShelfApplication(QApplication):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.db = Database()
-        self.login_signup_app = LoginSignupApp(self.db)
-        self.login_signup_app.show()
-        self.login_signup_app.login_successful_signal.connect(self.show_shelf_app)
-
-    # Show main shelf application window
-    def show_shelf_app(self, username):
-        self.shelf_app = ShelfApp(username, self.db)
-        self.shelf_app.logout_signal.connect(self.show_login_signup_window)
-        self.shelf_app.show()
-
-    # Show login/signup window
-    def show_login_signup_window(self):
-        self.login_signup_app.show()
+            writer.write_batch(pyarrow.record_batch([list(column) for column in zip(*batch)], schema=schema))
+
+def write_books_parquet(rows, path):
+    write_books_arrow(rows, path, parquet=True)
+
+BOOK_WRITERS = {'.csv': write_books_csv, '.jsonl': write_books_jsonl, '.arrow': write_books_arrow,
+                '.parquet': write_books_parquet}
+
+# Export a user's shelf, returning how many books were written. The format comes from the
+# extension (.csv, .jsonl, .arrow, .parquet) and CSV or JSONL can be compressed with a
+# .gz, .bz2 or .xz suffix. Rows are streamed, so memory use does not grow with the shelf.
+def export_books(db, path, username):
+    extension, compression = book_file_format(path)
+    if extension not in BOOK_WRITERS or (compression and extension not in BOOK_READERS):
+        raise ValueError(f'Unsupported export format: {path}')
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    BOOK_WRITERS[extension](counted(db.iter_book_rows(username)), path)
+    return count
+
+# Bring two databases up to date with each other, returning how many changes each received
+def sync_databases(db, peer):
+    received = db.apply_changes(peer.changes_since(db.sync_vector()))
+    sent = peer.apply_changes(db.changes_since(peer.sync_vector()))
+    db.record_peer(peer.replica_id(), peer.sync_vector())
+    peer.record_peer(db.replica_id(), db.sync_vector())
+    return received, sent
+
+# Check a backup file without modifying it: it must open read-only, pass SQLite's integrity
+# check and hold Shelf's users table. Returns its schema version, size and user count.
+def verify_backup(path):
+    if not os.path.isfile(path):
+        raise ValueError(f'No backup at {path}')
+    try:
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            problems = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+            if problems != ['ok']:
+                raise ValueError(f'{path} is damaged: ' + '; '.join(problems[:5]))
+            schema_version = connection.execute('PRAGMA user_version').fetchone()[0]
+            users = connection.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        finally:
+            connection.close()
+    except sqlite3.DatabaseError as error:
+        raise ValueError(f'{path} is not a Shelf backup: {error}') from None
+    return {'schema_version': schema_version, 'size': os.path.getsize(path), 'users': users}
+
+# Timestamped snapshots of a Database in one directory, keeping the newest keep of them.
+# start() takes one every interval seconds on a background timer thread, the same way
+# write-behind flushes are scheduled; failures are logged and the schedule carries on.
+class SnapshotScheduler:
+    PREFIX = 'shelf-'
+    SUFFIX = '.db'
+
+    def __init__(self, db, directory, keep=7, interval=3600.0):
+        self.db = db
+        self.directory = directory
+        self.keep = keep
+        self.interval = interval
+        self.timer = None
+        self.lock = threading.Lock()
+
+    # Snapshot paths, oldest first (their names sort by time)
+    def snapshots(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if name.startswith(self.PREFIX) and name.endswith(self.SUFFIX))
+
+    # Take a snapshot now and drop the ones past the retention limit
+    def take(self, progress=None):
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, self.PREFIX + time.strftime('%Y%m%d-%H%M%S') + self.SUFFIX)
+            if os.path.exists(path):
+                return path
+            self.db.backup(path, progress=progress)
+            for old_path in self.snapshots()[:-self.keep]:
+                os.remove(old_path)
+            return path
+
+    def start(self):
+        with self.lock:
+            self.schedule()
+
+    def schedule(self):
+        self.timer = threading.Timer(self.interval, self.run)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def stop(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+    def run(self):
+        try:
+            logger.info('Snapshot written to %s', self.take())
+        except (OSError, ValueError, sqlite3.Error):
+            logger.exception('Scheduled snapshot failed')
+        with self.lock:
+            if self.timer is not None:
+                self.schedule()
+
+# Keeps a read-only replica of a Database up to date: every interval seconds the database
+# is copied to path with Database.backup, which builds the copy next to path, checks it and
+# renames it into place, so readers only ever see a whole snapshot
+class ReplicaPublisher(SnapshotScheduler):
+    def __init__(self, db, path, interval=60.0):
+        super().__init__(db, os.path.dirname(os.path.abspath(path)), keep=1, interval=interval)
+        self.path = path
+
+    def take(self, progress=None):
+        with self.lock:
+            return self.db.backup(self.path, progress=progress)
+
+# A Database over a replica published by ReplicaPublisher (or any Database.backup copy),
+# for reporting jobs and kiosks. The file is opened immutable and read only, with a large
+# mmap_size, so queries read pages straight from the OS page cache, take no locks and
+# never touch the primary's WAL: any number of reader processes run side by side without
+# slowing its writers or each other. Writes fail with sqlite3.OperationalError.
+# refresh() checks whether a new snapshot has been renamed into place and, if so, moves
+# new queries over to it; with refresh_interval it does so on a timer. Queries already
+# running finish on the old snapshot, whose connections are closed a refresh later.
+class ReplicaDatabase(Database):
+    # SQLite caps this at its compile-time maximum (2 GB by default)
+    MMAP_SIZE = 2 ** 40
+
+    def __init__(self, path='shelf-replica.db', refresh_interval=None, stats=None, mmap_size=MMAP_SIZE):
+        self.mmap_size = mmap_size
+        self.refresh_interval = refresh_interval
+        self.snapshot = self.snapshot_id(path)
+        self.retired_pool = None
+        self.refresh_timer = None
+        self.refresh_lock = threading.Lock()
+        super().__init__(path, pool=self.open_pool(path, stats), stats=stats)
+        self.check_schema()
+        if refresh_interval:
+            self.schedule_refresh()
+
+    def open_pool(self, path, stats):
+        return ConnectionPool(path, mmap_size=self.mmap_size, stats=stats, read_only=True)
+
+    # Identifies the file currently at path, which changes when a new snapshot replaces it
+    @staticmethod
+    def snapshot_id(path):
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            raise ValueError(f'No replica at {path}') from None
+        return (status.st_ino, status.st_mtime_ns, status.st_size)
+
+    # Migrations can't run on a replica, so it must come from this version of Shelf
+    def check_schema(self):
+        version = self.cursor.execute('PRAGMA user_version').fetchone()[0]
+        if version != len(self.migrations()):
+            raise ValueError(f'{self.path} has schema version {version}, expected {len(self.migrations())}: '
+                             'publish it again with this version of Shelf')
+
+    # Switch to a newer snapshot if one has been published; returns whether it did
+    def refresh(self):
+        with self.refresh_lock:
+            snapshot = self.snapshot_id(self.path)
+            if snapshot == self.snapshot:
+                return False
+            old_pool, self.pool = self.pool, self.open_pool(self.path, self.stats)
+            try:
+                self.check_schema()
+            except ValueError:
+                self.pool.close()
+                self.pool = old_pool
+                raise
+            self.snapshot = snapshot
+            if self.retired_pool is not None:
+                self.retired_pool.close()
+            self.retired_pool = old_pool
+            self.fts_enabled = self.table_exists('catalog_fts')
+            self.search_indexes.clear()
+            self.shelf_breakdowns.clear()
+            self.shelf_sizes.clear()
+            self.forget_user()
+            return True
+
+    def schedule_refresh(self):
+        self.refresh_timer = threading.Timer(self.refresh_interval, self.run_refresh)
+        self.refresh_timer.daemon = True
+        self.refresh_timer.start()
+
+    def run_refresh(self):
+        try:
+            if self.refresh():
+                logger.info('Replica %s refreshed', self.path)
+        except (OSError, ValueError, sqlite3.Error):
+            logger.exception('Replica refresh failed')
+        with self.refresh_lock:
+            if self.refresh_timer is not None:
+                self.schedule_refresh()
+
+    def close(self):
+        with self.refresh_lock:
+            if self.refresh_timer is not None:
+                self.refresh_timer.cancel()
+                self.refresh_timer = None
+            if self.retired_pool is not None:
+                self.retired_pool.close()
+                self.retired_pool = None
+        self.pool.close()
+
+# The windows are defined in shelf_gui.py, which imports PyQt5. Looking one of them up
+# here (Shelf.ShelfApp, from Shelf import ShelfApp, ...) loads that module on first use.
+GUI_NAMES = ('DatabaseExecutor', 'DatabaseTask', 'ImageTask', 'CoverLoader', 'BookTableModel', 'LoginSignupApp', 'SignupApp', 'StatsPanel',
+             'ShelfApp', 'ShelfApplication')
+
+def __getattr__(name):
+    if name in GUI_NAMES:
+        import shelf_gui
+        return getattr(shelf_gui, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app = ShelfApplication(sys.argv)
+    # shelf_cli and shelf_gui import Shelf; let them find this module instead of running it again
+    sys.modules.setdefault('Shelf', sys.modules[__name__])
+    # Any command line arguments select the headless interface; none starts the GUI
+    if len(sys.argv) > 1:
+        import shelf_cli
+        sys.exit(shelf_cli.main(sys.argv[1:]))
+    import shelf_gui
+    app = shelf_gui.ShelfApplication(sys.argv)
     sys.exit(app.exec_())
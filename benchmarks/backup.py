@@ -0,0 +1,67 @@
+'''Online backup benchmark.
+
+Fills a fresh database, then backs it up with different step sizes while a writer process
+keeps adding books, and reports how long each backup took and the worst write latency the
+writer saw meanwhile. A step of -1 copies everything in one step. Run from the repository root:
+
+    python benchmarks/backup.py --books 200000 --pages -1 64 1024
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Event, Process, Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Book, Database, User
+
+USER = 'reader'
+
+def synthetic_books(count):
+    for i in range(count):
+        yield Book(f'Title number {i}', f'Author {i % 5000}', 'Genre', str(1900 + i % 125))
+
+# Add one book per commit until stopped, reporting the slowest commit and the count
+def writer(path, started, stop, results):
+    db = Database(path)
+    worst, count = 0.0, 0
+    started.set()
+    while not stop.is_set():
+        start = time.perf_counter()
+        db.add_book(Book(f'Written {count}', 'Author', 'Genre', '2000'), USER)
+        worst = max(worst, time.perf_counter() - start)
+        count += 1
+    db.close()
+    results.put((worst * 1000, count))
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure online backups under concurrent writes')
+    parser.add_argument('--books', type=int, default=200000)
+    parser.add_argument('--pages', type=int, nargs='+', default=[-1, 64, 1024], help='pages copied per step')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'backup.db')
+        db = Database(path)
+        db.add_user(User(USER, 'password'))
+        db.add_books(synthetic_books(args.books), USER)
+        print(f'database: {os.path.getsize(path) / 2 ** 20:.1f} MB')
+
+        print('pages/step  backup s  worst write ms  writes')
+        for pages in args.pages:
+            started, stop, results = Event(), Event(), Queue()
+            process = Process(target=writer, args=(path, started, stop, results))
+            process.start()
+            started.wait()
+            start = time.perf_counter()
+            db.backup(os.path.join(directory, f'copy{pages}.db'), pages=pages)
+            elapsed = time.perf_counter() - start
+            stop.set()
+            worst, count = results.get()
+            process.join()
+            print(f'{pages:10d}  {elapsed:8.2f}  {worst:14.1f}  {count:6d}')
+        db.close()
+
+if __name__ == '__main__':
+    main()
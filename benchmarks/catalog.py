@@ -0,0 +1,113 @@
+'''Size and speed benchmark for the shared book catalog.
+
+Builds a database with the per-user books tables that predate the catalog, where many
+users own copies of the same popular books, measures its file size and a few reads, then
+opens it with Database (which migrates it to the deduplicated catalog) and measures again.
+Run from the repository root:
+
+    python benchmarks/catalog.py --users 1000 --books-per-user 200 --titles 5000
+'''
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Database, User
+
+GENRES = ['Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'History', 'Biography', 'Horror', 'Poetry']
+
+# A database stopped at the schema before the shared catalog
+class LegacyDatabase(Database):
+    def migrations(self):
+        migrations = super().migrations()
+        return migrations[:migrations.index(self.create_catalog)]
+
+# Every user owns books_per_user titles, drawn so that a few titles are very popular
+def populate(db, users, books_per_user, titles):
+    random.seed(0)
+    year = date.today().year
+    weights = [1 / (rank + 1) for rank in range(titles)]
+    for i in range(users):
+        username = f'user{i}'
+        db.add_user(User(username, 'password'))
+        picks = set(random.choices(range(titles), weights=weights, k=books_per_user))
+        rows = [(f'Title {n}', f'Author {n % 997}', GENRES[n % len(GENRES)], str(1900 + n % 125), username)
+                for n in picks]
+        db.cursor.executemany('''INSERT INTO books (title, author, genre, year, username) VALUES (?, ?, ?, ?, ?)''',
+                              rows)
+        db.cursor.executemany('''INSERT INTO books_read_this_year (title, author, genre, year, username, read_year)
+                                 VALUES (?, ?, ?, ?, ?, ?)''', [row + (year,) for row in rows[:books_per_user // 10]])
+    db.connection.commit()
+
+def file_size(db, path):
+    db.cursor.execute('VACUUM')
+    db.cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return os.path.getsize(path) / 2 ** 20
+
+def timed(function, users, repeats=200):
+    samples = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        function(f'user{i % users}')
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+# The reads as Database ran them against the per-user tables
+def measure_legacy(db, users):
+    def query(sql):
+        return lambda username: db.cursor.execute(sql, (username,)).fetchall()
+    return {
+        'get_books': timed(query('''SELECT rowid, title, author, genre, year FROM books WHERE username = ?'''), users),
+        'get_books_page': timed(query('''SELECT rowid, title, author, genre, year FROM books WHERE username = ?
+                                         ORDER BY author, rowid LIMIT 200'''), users),
+        'count_books': timed(query('''SELECT COUNT(*) FROM books WHERE username = ?'''), users),
+        'search_books': timed(query('''SELECT books.rowid, books.title, books.author, books.genre, books.year
+                                       FROM books_fts JOIN books ON books.rowid = books_fts.rowid
+                                       WHERE books_fts MATCH '"title"* AND "4"*' AND username = ?
+                                       ORDER BY bm25(books_fts, 10.0, 5.0, 1.0) LIMIT 50'''), users),
+    }
+
+def measure(db, users):
+    return {
+        'get_books': timed(lambda username: db.get_books(username), users),
+        'get_books_page': timed(lambda username: db.get_books_page(username, 'author'), users),
+        'count_books': timed(lambda username: db.count_books(username), users),
+        'search_books': timed(lambda username: db.search_books(username, 'title 4'), users),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-user book tables with the shared catalog')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--books-per-user', type=int, default=200)
+    parser.add_argument('--titles', type=int, default=5000, help='distinct books across all users')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'catalog.db')
+        db = LegacyDatabase(path)
+        populate(db, args.users, args.books_per_user, args.titles)
+        legacy_size = file_size(db, path)
+        legacy = measure_legacy(db, args.users)
+        db.close()
+
+        start = time.perf_counter()
+        db = Database(path)
+        migration_time = time.perf_counter() - start
+        catalog_size = file_size(db, path)
+        catalog = measure(db, args.users)
+        counts = db.count_all()
+        db.close()
+
+    print(f"{counts['books']} owned books, {counts['catalog']} distinct in the catalog, "
+          f'migrated in {migration_time:.1f} s')
+    print(f'file size        {legacy_size:10.1f} MB -> {catalog_size:10.1f} MB')
+    for name in legacy:
+        print(f'{name:<16} {legacy[name]:10.3f} ms -> {catalog[name]:10.3f} ms')
+
+if __name__ == '__main__':
+    main()
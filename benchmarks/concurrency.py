@@ -0,0 +1,83 @@
+'''Stress test for concurrent access to one shelf database.
+
+Starts reader and writer processes against a fresh database, each with its own
+Database (and so its own ConnectionPool), and reports throughput and lock errors
+as the number of processes grows. Run from the repository root:
+
+    python benchmarks/concurrency.py --seconds 5 --workers 1 2 4 8
+'''
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Book, Database, User
+
+USERS = 50
+
+# Insert books one commit at a time until the deadline
+def writer(path, worker_id, deadline):
+    db = Database(path)
+    operations, errors = 0, 0
+    while time.time() < deadline:
+        try:
+            db.add_book(Book(f'Book {worker_id}-{operations}', 'Author', 'Genre', '2000'), f'user{operations % USERS}')
+            operations += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    db.close()
+    return 'write', operations, errors
+
+# Read users and their books until the deadline
+def reader(path, worker_id, deadline):
+    db = Database(path)
+    operations, errors = 0, 0
+    while time.time() < deadline:
+        try:
+            username = f'user{(worker_id + operations) % USERS}'
+            db.get_user(username)
+            db.get_books_page(username, limit=50)
+            operations += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    db.close()
+    return 'read', operations, errors
+
+def run(path, workers, seconds):
+    deadline = time.time() + seconds
+    jobs = [(writer if i % 2 else reader, i) for i in range(workers * 2)]
+    with Pool(len(jobs)) as pool:
+        results = [pool.apply_async(job, (path, worker_id, deadline)) for job, worker_id in jobs]
+        results = [result.get() for result in results]
+    totals = {'read': 0, 'write': 0, 'errors': 0}
+    for kind, operations, errors in results:
+        totals[kind] += operations
+        totals['errors'] += errors
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent reader/writer stress test for Database')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='reader/writer pairs to run at once')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stress.db')
+        db = Database(path)
+        for i in range(USERS):
+            db.add_user(User(f'user{i}', 'password'))
+        db.close()
+
+        print('pairs  reads/s  writes/s  lock errors')
+        for workers in args.workers:
+            totals = run(path, workers, args.seconds)
+            print(f"{workers:5d}  {totals['read'] / args.seconds:7.0f}  {totals['write'] / args.seconds:8.0f}"
+                  f"  {totals['errors']:11d}")
+
+if __name__ == '__main__':
+    main()
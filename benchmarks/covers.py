@@ -0,0 +1,94 @@
+'''Cover thumbnail benchmark.
+
+Gives a shelf of books large JPEG covers and scrolls a BookTableModel over it, asking for
+every row's thumbnail the way the table view does. Reports how long the scroll pass itself
+took (it must never wait on decoding) and how long the thumbnails took to arrive when they
+were decoded from the covers, read back from the on-disk cache, and already in memory.
+Needs PyQt5; runs without a display. Run from the repository root:
+
+    python benchmarks/covers.py --books 2000 --covers 500
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PyQt5.QtCore import QModelIndex, Qt
+from PyQt5.QtGui import QColor, QImage, QPainter, QPixmapCache
+from PyQt5.QtWidgets import QApplication
+from Shelf import Book, Database, User, store_cover
+from shelf_gui import BookTableModel, CoverLoader, DatabaseExecutor
+
+USER = 'reader'
+
+def synthetic_books(count, covers):
+    for i in range(count):
+        yield Book(f'Title number {i}', f'Author {i % 5000}', 'Genre', str(1900 + i % 125),
+                   cover=covers[i % len(covers)])
+
+# Write distinct JPEG covers the size of a scanned book cover and store them
+def make_covers(db, directory, count, width=1200, height=1800):
+    covers = []
+    for i in range(count):
+        image = QImage(width, height, QImage.Format_RGB32)
+        image.fill(QColor.fromHsv(i * 37 % 360, 160, 200))
+        painter = QPainter(image)
+        painter.drawText(image.rect(), Qt.AlignCenter, f'Cover {i}')
+        painter.end()
+        path = os.path.join(directory, f'cover{i}.jpg')
+        image.save(path, 'JPEG', 85)
+        covers.append(store_cover(db.covers_directory, path))
+    return covers
+
+# Ask for every row's thumbnail, then wait for the ones that were missing. Returns the
+# slowest single data() call, the whole pass and the time until all thumbnails were in.
+def scroll(app, model, loader):
+    waiting = set(book.cover for book in model.books)
+    loader.cover_loaded.connect(waiting.discard)
+    start = time.perf_counter()
+    worst = 0.0
+    for row in range(model.rowCount()):
+        call = time.perf_counter()
+        if model.data(model.index(row, 0), Qt.DecorationRole) is not None:
+            waiting.discard(model.books[row].cover)
+        worst = max(worst, time.perf_counter() - call)
+    scrolled = time.perf_counter() - start
+    while waiting:
+        app.processEvents()
+    loader.cover_loaded.disconnect(waiting.discard)
+    return worst * 1000, scrolled * 1000, (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='Time cover thumbnails while scrolling a shelf')
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--covers', type=int, default=500, help='distinct cover images')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'covers.db'))
+        db.add_user(User(USER, 'password'))
+        covers = make_covers(db, directory, args.covers)
+        db.add_books(synthetic_books(args.books, covers), USER)
+
+        executor = DatabaseExecutor(db)
+        print('thumbnails from   worst data() ms  scroll ms  all loaded ms')
+        for source in ('cover images', 'disk cache', 'memory'):
+            if source != 'memory':
+                QPixmapCache.clear()
+            loader = CoverLoader(db)
+            model = BookTableModel(executor, USER, covers=loader)
+            while model.canFetchMore(QModelIndex()):
+                model.fetchMore(QModelIndex())
+                app.processEvents()
+            worst, scrolled, loaded = scroll(app, model, loader)
+            print(f'{source:<16}  {worst:15.3f}  {scrolled:9.1f}  {loaded:13.1f}')
+            loader.shutdown()
+        executor.shutdown()
+        db.close()
+
+if __name__ == '__main__':
+    main()
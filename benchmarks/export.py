@@ -0,0 +1,61 @@
+'''Memory and speed benchmark for streaming exports.
+
+Fills a fresh database with one large shelf, then exports it to every format and reports
+the time taken, the file size and the peak Python memory traced during the export, next
+to loading the same shelf with get_books. Run from the repository root:
+
+    python benchmarks/export.py --books 1000000 --formats csv jsonl csv.gz parquet
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Book, Database, User, export_books
+
+GENRES = ['Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'History', 'Biography', 'Horror', 'Poetry']
+USER = 'reader'
+
+def synthetic_books(count):
+    for i in range(count):
+        yield Book(f'Title number {i}', f'Author {i % 5000}', GENRES[i % len(GENRES)], str(1900 + i % 125))
+
+# Run function under tracemalloc, returning its result, seconds taken and peak MB
+def traced(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure memory used by streaming exports')
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--formats', nargs='+', default=['csv', 'jsonl', 'csv.gz', 'jsonl.xz', 'parquet'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'export.db'))
+        db.add_user(User(USER, 'password'))
+        db.add_books(synthetic_books(args.books), USER)
+
+        print('export              seconds    file MB    peak MB')
+        _, elapsed, peak = traced(lambda: len(db.get_books(USER)))
+        print(f"{'get_books':<16} {elapsed:10.2f} {'':>10} {peak:10.1f}")
+        for extension in args.formats:
+            path = os.path.join(directory, f'{USER}.{extension}')
+            try:
+                _, elapsed, peak = traced(lambda: export_books(db, path, USER))
+            except ValueError as error:
+                print(f'{extension:<16} skipped: {error}')
+                continue
+            print(f'{extension:<16} {elapsed:10.2f} {os.path.getsize(path) / 2 ** 20:10.1f} {peak:10.1f}')
+        db.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''Login throughput benchmark.
+
+Creates users whose passwords are stored in plaintext, as they were before hashing, and
+logs every one of them in from a number of threads: the first round checks the plaintext
+and rehashes it, the second checks the stored hash (with the user row cached), and a
+round of unknown usernames shows that failed logins cost the same. Also times get_user
+with and without the user cache. Run from the repository root:
+
+    python benchmarks/login.py --users 200 --threads 1 4
+    python benchmarks/login.py --scheme pbkdf2_sha256 --iterations 600000
+'''
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Database, PasswordHasher
+
+# Insert users the way older versions stored them, bypassing add_user's hashing
+def add_plaintext_users(db, count):
+    db.cursor.executemany('''INSERT INTO users (username, password, name, email, favorite_genre)
+                             VALUES (?, ?, '', '', '')''', [(f'user{i}', f'password{i}') for i in range(count)])
+    db.connection.commit()
+
+# Log users in from threads, returning logins per second and how many succeeded
+def login_round(db, usernames, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        users = list(pool.map(lambda username: db.authenticate(username, 'password' + username[4:]), usernames))
+    return len(usernames) / (time.perf_counter() - start), sum(user is not None for user in users)
+
+def get_user_us(db, count, cached):
+    samples = []
+    for i in range(count):
+        if cached:
+            db.get_user(f'user{i}')
+        else:
+            db.forget_user()
+        start = time.perf_counter()
+        db.get_user(f'user{i}')
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure logins per second')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--scheme', choices=PasswordHasher.SCHEMES)
+    parser.add_argument('--n', type=int, default=2 ** 14, help='scrypt cost')
+    parser.add_argument('--iterations', type=int, default=600000, help='PBKDF2 iterations')
+    args = parser.parse_args()
+
+    hasher = PasswordHasher(args.scheme, n=args.n, iterations=args.iterations)
+    print(f'{hasher.scheme} {hasher.parameters}, at most {hasher.max_concurrent} hashes at once')
+    print('threads  round                logins/s  succeeded')
+    with tempfile.TemporaryDirectory() as directory:
+        for threads in args.threads:
+            db = Database(os.path.join(directory, f'login{threads}.db'), password_hasher=hasher)
+            add_plaintext_users(db, args.users)
+            usernames = [f'user{i}' for i in range(args.users)]
+            for name, names in (('plaintext + rehash', usernames), ('hashed', usernames),
+                                ('unknown user', [f'nobody{i}' for i in range(args.users)])):
+                rate, succeeded = login_round(db, names, threads)
+                print(f'{threads:7d}  {name:<19} {rate:9.1f}  {succeeded:9d}')
+            db.close()
+
+        db = Database(os.path.join(directory, 'lookup.db'), password_hasher=hasher)
+        add_plaintext_users(db, args.users)
+        print(f'get_user uncached {get_user_us(db, args.users, False):.1f} us, '
+              f'cached {get_user_us(db, args.users, True):.1f} us')
+        db.close()
+
+if __name__ == '__main__':
+    main()
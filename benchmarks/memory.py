@@ -0,0 +1,65 @@
+'''Memory benchmark for in-memory book shelves.
+
+Compares a list of dict-backed book objects (how ShelfApp used to hold a shelf),
+a list of slotted Book objects and a BookCollection for the same synthetic rows.
+Run from the repository root:
+
+    python benchmarks/memory.py --books 100000 500000
+'''
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Book, BookCollection
+
+# The original Book class, with a __dict__ per instance
+class PlainBook:
+    def __init__(self, title, author, genre, year, id=None):
+        self.title = title
+        self.author = author
+        self.genre = genre
+        self.year = year
+        self.id = id
+
+GENRES = ['Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'History', 'Biography', 'Horror', 'Poetry']
+
+# Rows as sqlite3 returns them: fresh string objects for every field of every row
+def rows(count):
+    for i in range(count):
+        yield (i + 1, f'Title number {i}', ''.join(['Author ', str(i % 2000)]),
+               ''.join([GENRES[i % len(GENRES)]]), str(1900 + i % 125))
+
+def measure(build, count):
+    tracemalloc.start()
+    shelf = build(count)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del shelf
+    return size
+
+def plain_list(count):
+    return [PlainBook(title, author, genre, year, id=id) for id, title, author, genre, year in rows(count)]
+
+def slotted_list(count):
+    return [Book(title, author, genre, year, id=id) for id, title, author, genre, year in rows(count)]
+
+def collection(count):
+    books = BookCollection()
+    for row in rows(count):
+        books.append_row(*row)
+    return books
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare memory used by in-memory shelf representations')
+    parser.add_argument('--books', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    print('books       plain list     Book list  BookCollection')
+    for count in args.books:
+        sizes = [measure(build, count) / 2 ** 20 for build in (plain_list, slotted_list, collection)]
+        print(f'{count:9d}  {sizes[0]:10.1f} MB  {sizes[1]:9.1f} MB  {sizes[2]:11.1f} MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''Read throughput on the primary database against a read-only replica.
+
+Fills a database, publishes a replica of it, then runs reader processes (each paging
+through a shelf and searching it) for a fixed time while a writer process keeps adding
+books to the primary. Readers either open the primary itself or the replica. Reports the
+reads per second of all readers together and the writer's commits per second, for each
+number of readers. Run from the repository root:
+
+    python benchmarks/replica.py --books 200000 --readers 1 2 4 --seconds 3
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Barrier, Event, Process, Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Book, Database, ReplicaDatabase, ReplicaPublisher, User
+
+USER = 'reader'
+SEARCHES = ['title 12345', 'author 4242', 'title 99999']
+
+def synthetic_books(count):
+    for i in range(count):
+        yield Book(f'Title {i}', f'Author {i % 5000}', 'Genre', str(1900 + i % 125))
+
+# One read: the first page of the shelf in title order, then a search
+def read_once(db, i):
+    db.get_books_page(USER, 'title', limit=50)
+    db.search_books(USER, SEARCHES[i % len(SEARCHES)], limit=20)
+
+def reader(path, replica, seconds, barrier, results):
+    db = ReplicaDatabase(path) if replica else Database(path)
+    read_once(db, 0)
+    barrier.wait()
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        read_once(db, count)
+        count += 1
+    db.close()
+    results.put(count)
+
+def writer(path, stop, results):
+    db = Database(path)
+    count = 0
+    while not stop.is_set():
+        db.add_book(Book(f'Written {count}', 'Author', 'Genre', '2000'), USER)
+        count += 1
+    db.close()
+    results.put(count)
+
+def run(primary, replica_path, replica, readers, seconds):
+    barrier, stop, read_results, write_results = Barrier(readers + 1), Event(), Queue(), Queue()
+    path = replica_path if replica else primary
+    processes = [Process(target=reader, args=(path, replica, seconds, barrier, read_results)) for _ in range(readers)]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    start = time.perf_counter()
+    writing = Process(target=writer, args=(primary, stop, write_results))
+    writing.start()
+    reads = sum(read_results.get() for _ in processes)
+    stop.set()
+    writes = write_results.get()
+    elapsed = time.perf_counter() - start
+    for process in processes + [writing]:
+        process.join()
+    return reads / seconds, writes / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare readers on the primary with readers on a replica')
+    parser.add_argument('--books', type=int, default=200000)
+    parser.add_argument('--readers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        primary = os.path.join(directory, 'primary.db')
+        replica_path = os.path.join(directory, 'replica.db')
+        db = Database(primary)
+        db.add_user(User(USER, 'password'))
+        db.add_books(synthetic_books(args.books), USER)
+        start = time.perf_counter()
+        ReplicaPublisher(db, replica_path).take()
+        print(f'{os.cpu_count()} CPUs, replica published in {time.perf_counter() - start:.2f} s')
+        db.close()
+
+        print('readers  on        reads/s  writer commits/s')
+        for readers in args.readers:
+            for replica in (False, True):
+                reads, writes = run(primary, replica_path, replica, readers, args.seconds)
+                print(f"{readers:7d}  {'replica' if replica else 'primary':<8} {reads:8.0f}  {writes:16.0f}")
+
+if __name__ == '__main__':
+    main()
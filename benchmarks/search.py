@@ -0,0 +1,68 @@
+'''Benchmark for Database.search_books.
+
+Fills a fresh database with one large shelf (every book in the catalog) and one small one
+holding a sample of the same books, then times searches for a word in every title, a
+common word, a rare one and two words together on each shelf. The small shelf's first
+search includes building its index. Run from the repository root:
+
+    python benchmarks/search.py --books 1000000 --small 2000
+'''
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Book, Database, User
+
+GENRES = ['Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'History', 'Biography', 'Horror', 'Poetry']
+WORDS = ['river', 'garden', 'shadow', 'winter', 'glass', 'empire', 'silent', 'crown', 'harbor', 'ember',
+         'stone', 'north', 'letters', 'orchard', 'tide', 'hollow', 'lantern', 'quiet', 'iron', 'meadow']
+QUERIES = ['title', 'river', 'zephyr', 'river garden']
+
+def synthetic_books(count):
+    random.seed(0)
+    for i in range(count):
+        words = random.sample(WORDS, 2)
+        # One title in 10000 has a rare word
+        if i % 10000 == 0:
+            words.append('zephyr')
+        yield Book(f"{' '.join(words).title()} title {i}", f'Author {i % 5000}', GENRES[i % len(GENRES)],
+                   str(1800 + i % 225))
+
+def timed(function, repeats=5):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description='Time searches on a large and a small shelf')
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--small', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'search.db'))
+        db.add_user(User('collector', 'password'))
+        db.add_user(User('reader', 'password'))
+        db.add_books(synthetic_books(args.books), 'collector')
+        step = max(1, args.books // args.small)
+        db.add_books((book for i, book in enumerate(synthetic_books(args.books)) if i % step == 0), 'reader')
+
+        start = time.perf_counter()
+        db.search_books('reader', 'river')
+        print(f"{'reader first search':<28} {(time.perf_counter() - start) * 1000:10.1f} ms")
+        for username in ('collector', 'reader'):
+            for query in QUERIES:
+                milliseconds = timed(lambda: db.search_books(username, query))
+                print(f"{f'{username} {query!r}':<28} {milliseconds:10.1f} ms")
+        db.close()
+
+if __name__ == '__main__':
+    main()
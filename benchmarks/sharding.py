@@ -0,0 +1,69 @@
+'''Write throughput of a single shelf.db against a sharded database.
+
+Starts one writer process per active user, each adding books one commit at a time for a
+fixed time, and reports the total commits per second with all users in one shelf.db and
+with each user in a shard of a ShardedDatabase. In one file the writers take turns on its
+write lock; sharded, each has a file of its own. Run from the repository root:
+
+    python benchmarks/sharding.py --users 1 2 4 8 --seconds 3
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Barrier, Process, Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Book, Database, ShardedDatabase, User
+
+def open_database(path, sharded):
+    return ShardedDatabase(path) if sharded else Database(path)
+
+# Add books for one user, a commit each, until the time is up; report the number written
+def writer(path, sharded, username, seconds, barrier, results):
+    db = open_database(path, sharded)
+    # Open the user's shard before the clock starts
+    db.count_books(username)
+    barrier.wait()
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        db.add_book(Book(f'Written {count}', 'Author', 'Genre', '2000'), username)
+        count += 1
+    db.close()
+    results.put(count)
+
+def throughput(directory, sharded, users, seconds):
+    path = os.path.join(directory, f"{'sharded' if sharded else 'single'}{users}.db")
+    db = open_database(path, sharded)
+    for i in range(users):
+        db.add_user(User(f'user{i}', 'password'))
+    db.close()
+
+    barrier, results = Barrier(users), Queue()
+    processes = [Process(target=writer, args=(path, sharded, f'user{i}', seconds, barrier, results))
+                 for i in range(users)]
+    for process in processes:
+        process.start()
+    total = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return total / seconds
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare write throughput of one file and per-user shards')
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 2, 4, 8], help='concurrently active users')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f'{os.cpu_count()} CPUs')
+        print('users  single file commits/s  sharded commits/s')
+        for users in args.users:
+            single = throughput(directory, False, users, args.seconds)
+            sharded = throughput(directory, True, users, args.seconds)
+            print(f'{users:5d}  {single:21.0f}  {sharded:17.0f}')
+
+if __name__ == '__main__':
+    main()
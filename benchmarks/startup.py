@@ -0,0 +1,44 @@
+'''Cold-start benchmark for the headless and GUI entry points.
+
+Times fresh interpreter runs of importing Shelf, running a CLI command and importing the
+GUI module, and checks that the headless paths never load PyQt5. Run from the repository root:
+
+    python benchmarks/startup.py --repeats 10
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(arguments, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, cwd=REPOSITORY, check=True, capture_output=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure Shelf cold-start time')
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'startup.db')
+        cases = [
+            ('python (baseline)', ['-c', 'pass']),
+            ('import Shelf', ['-c', 'import Shelf, sys; assert "PyQt5" not in sys.modules']),
+            ('Shelf.py stats', ['Shelf.py', '--db', db_path, 'stats']),
+            ('shelf_cli.py stats', ['shelf_cli.py', '--db', db_path, 'stats']),
+            ('import shelf_gui', ['-c', 'import shelf_gui']),
+        ]
+        for name, arguments in cases:
+            print(f'{name:<20} {run(arguments, args.repeats):8.1f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''Benchmark for the shelf stats panel.
+
+Fills a fresh database with one large shelf and times Database.get_shelf_stats: the first
+call (which counts genres, authors and decades), a cached call, and a call after a book is
+added through it, after another user adds a book through a second Database on the same
+file, and after a book is added to the shelf through that second Database.
+Run from the repository root:
+
+    python benchmarks/stats.py --books 1000000
+'''
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Book, Database, User
+
+GENRES = ['Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'History', 'Biography', 'Horror', 'Poetry']
+USER = 'reader'
+
+def synthetic_books(count):
+    for i in range(count):
+        yield Book(f'Title number {i}', f'Author {i % 5000}', GENRES[i % len(GENRES)], str(1800 + i % 225))
+
+def timed(function, repeats=5):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the shelf stats panel queries')
+    parser.add_argument('--books', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'stats.db'))
+        db.add_user(User(USER, 'password', favorite_genre='Mystery'))
+        db.add_books(synthetic_books(args.books), USER)
+
+        print(f"{'sql counts':<22} {timed(lambda: db.book_breakdowns(USER)):10.1f} ms")
+
+        db.shelf_breakdowns.clear()
+        start = time.perf_counter()
+        db.get_shelf_stats(USER)
+        print(f"{'first get_shelf_stats':<22} {(time.perf_counter() - start) * 1000:10.1f} ms")
+        print(f"{'cached get_shelf_stats':<22} {timed(lambda: db.get_shelf_stats(USER), 100):10.3f} ms")
+        db.add_book(Book('One more', 'Author', 'Mystery', '2024'), USER)
+        start = time.perf_counter()
+        stats = db.get_shelf_stats(USER)
+        print(f"{'after add_book':<22} {(time.perf_counter() - start) * 1000:10.1f} ms  ({stats.books} books)")
+        other = Database(db.path)
+        other.add_user(User('someone else', 'password'))
+        other.add_book(Book('Their book', 'Author', 'Mystery', '2024'), 'someone else')
+        start = time.perf_counter()
+        stats = db.get_shelf_stats(USER)
+        print(f"{'after another user':<22} {(time.perf_counter() - start) * 1000:10.1f} ms  ({stats.books} books)")
+        other.add_book(Book('One from elsewhere', 'Author', 'Mystery', '2024'), USER)
+        other.close()
+        start = time.perf_counter()
+        stats = db.get_shelf_stats(USER)
+        print(f"{'after another writer':<22} {(time.perf_counter() - start) * 1000:10.1f} ms  ({stats.books} books)")
+        db.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+'''Headless benchmark suite for the Database and ShelfApp hot paths.
+
+For every shelf size a fresh database is generated: the benchmarked user owns
+that many books and the same number again is spread over the other users. Each
+operation is timed several times and the results are written as JSON together
+with the current git commit, so two runs can be compared. Widget paths use
+Qt's offscreen platform, so no display is needed. Run from the repository root:
+
+    python benchmarks/suite.py --sizes 1000 100000 1000000 --output results.json
+    python benchmarks/suite.py --sizes 1000 --compare results.json
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+from Shelf import Book, Database, DatabaseExecutor, PasswordHasher, ShelfApp, User
+from PyQt5.QtWidgets import QApplication
+
+GENRES = ['Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'History', 'Biography', 'Horror', 'Poetry']
+WORDS = ['shadow', 'river', 'empire', 'garden', 'winter', 'silver', 'night', 'house', 'storm', 'glass']
+SEARCHES = ['riv', 'winter garden', 'author:author1', 'genre:myst', 'silver night 42']
+USER = 'reader'
+
+# Synthetic books with some repetition in every field, like a real catalog
+def synthetic_books(count, offset=0):
+    for i in range(offset, offset + count):
+        title = f'{WORDS[i % 10].title()} {WORDS[(i // 10) % 10]} {i}'
+        yield Book(title, f'Author{i % 5000}', GENRES[i % len(GENRES)], str(1900 + i % 125))
+
+def populate(db, size, users):
+    for i in range(users):
+        db.add_user(User(f'user{i}', 'password'))
+    db.add_user(User(USER, 'password'))
+    db.add_books(synthetic_books(size), USER)
+    per_user = max(1, size // users)
+    for i in range(users):
+        db.add_books(synthetic_books(per_user, offset=i * per_user), f'user{i}')
+
+# Run function repeats times and summarize the timings in milliseconds
+def timed(function, repeats):
+    samples = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        function(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'repeats': repeats, 'median_ms': statistics.median(samples), 'mean_ms': statistics.mean(samples),
+            'min_ms': min(samples), 'max_ms': max(samples)}
+
+def wait_until(app, condition, timeout=600):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+
+def benchmark_database(db, size):
+    results = {}
+    results['add_book'] = timed(lambda i: db.add_book(Book(f'Benchmark {i}', 'Author', 'Genre', '2000'), USER), 200)
+    results['remove_book'] = timed(lambda i: db.remove_book(f'Benchmark {i}', USER), 200)
+    results['get_user'] = timed(lambda i: db.get_user(f'user{i % 100}'), 1000)
+    results['get_books'] = timed(lambda i: db.get_books(USER), 3 if size >= 1000000 else 10)
+    results['get_books_page'] = timed(lambda i: db.get_books_page(USER, Database.SORT_COLUMNS[i % 3]), 100)
+    results['search_books'] = timed(lambda i: db.search_books(USER, SEARCHES[i % len(SEARCHES)]), 100)
+    return results
+
+def benchmark_widgets(app, db):
+    results = {}
+    executor = DatabaseExecutor(db)
+    windows = []
+
+    def open_window(i):
+        window = ShelfApp(USER, db, executor)
+        # Done once everything the window loads at startup has arrived
+        wait_until(app, lambda: not executor.tasks)
+        windows.append(window)
+    results['shelf_app_open'] = timed(open_window, 3)
+
+    window = windows[-1]
+    window.resize(window.WINDOW_WIDTH, window.WINDOW_HEIGHT)
+
+    def list_books(i):
+        window.list_books()
+        wait_until(app, lambda: not window.book_model.loading)
+        window.book_table.grab()
+    results['list_books'] = timed(list_books, 20)
+
+    def scroll(i):
+        window.book_model.fetchMore(window.book_table.rootIndex())
+        wait_until(app, lambda: not window.book_model.loading)
+        window.book_table.scrollToBottom()
+        window.book_table.grab()
+    results['list_scroll_page'] = timed(scroll, 20)
+
+    executor.shutdown()
+    for window in windows:
+        window.deleteLater()
+    app.processEvents()
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Print the median of every operation against a previous results file
+def compare(previous, current, threshold):
+    print(f"\nCompared with {previous.get('commit')}:")
+    for size, operations in current['sizes'].items():
+        for name, result in operations.items():
+            before = previous['sizes'].get(size, {}).get(name)
+            if not before:
+                continue
+            ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+            flag = '  REGRESSION' if ratio > 1 + threshold else ''
+            print(f"{size:>9} {name:<18} {before['median_ms']:10.3f} -> {result['median_ms']:10.3f} ms  x{ratio:.2f}{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Database and ShelfApp hot paths')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--users', type=int, default=1000, help='other users sharing the database')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='slowdown reported as a regression')
+    parser.add_argument('--no-gui', action='store_true', help='skip the widget benchmarks')
+    args = parser.parse_args()
+
+    app = None if args.no_gui else QApplication(sys.argv[:1])
+    report = {'commit': git_commit(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(), 'platform': platform.platform(), 'sizes': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            # Password hashing isn't measured here, so make adding a thousand users quick
+            db = Database(os.path.join(directory, f'bench_{size}.db'),
+                          password_hasher=PasswordHasher('pbkdf2_sha256', iterations=1))
+            start = time.perf_counter()
+            populate(db, size, args.users)
+            print(f'{size} books: generated in {time.perf_counter() - start:.1f} s')
+            results = benchmark_database(db, size)
+            if app:
+                results.update(benchmark_widgets(app, db))
+            for name, result in results.items():
+                print(f"  {name:<18} median {result['median_ms']:10.3f} ms")
+            report['sizes'][str(size)] = results
+            db.close()
+
+    with open(args.output, 'w') as results_file:
+        json.dump(report, results_file, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(json.load(previous_file), report, args.threshold)
+
+if __name__ == '__main__':
+    main()
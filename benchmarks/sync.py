@@ -0,0 +1,74 @@
+'''Two-database harness for change-log sync.
+
+Fills one database with a large shelf, syncs it into an empty one, then changes a few rows
+on each side and syncs again. Checks that the second sync moves exactly the changes made
+since the first and that both databases end up with the same shelves. Run from the
+repository root:
+
+    python benchmarks/sync.py --books 1000000 --changes 100
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Book, Database, User, sync_databases
+
+USERS = 10
+
+def synthetic_books(count, offset=0):
+    for i in range(offset, offset + count):
+        yield Book(f'Title number {i}', f'Author {i % 5000}', 'Genre', str(1900 + i % 125))
+
+# Changes logged for writes made on this database itself
+def local_changes(db):
+    db.cursor.execute('''SELECT COUNT(*) FROM changes JOIN sync_state ON changes.origin = sync_state.origin''')
+    return db.cursor.fetchone()[0]
+
+def shelves(db):
+    return [sorted(db.iter_book_rows(f'user{i}')) for i in range(USERS)]
+
+def timed_sync(db, peer):
+    start = time.perf_counter()
+    received, sent = sync_databases(db, peer)
+    return received, sent, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that sync moves only the changed rows')
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--changes', type=int, default=100, help='rows changed on each side before the second sync')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        first = Database(os.path.join(directory, 'first.db'))
+        second = Database(os.path.join(directory, 'second.db'))
+        per_user = args.books // USERS
+        for i in range(USERS):
+            first.add_user(User(f'user{i}', 'password'))
+            first.add_books(synthetic_books(per_user, offset=i * per_user), f'user{i}')
+
+        received, sent, elapsed = timed_sync(second, first)
+        print(f'initial sync: {received} changes in {elapsed:.1f} s')
+
+        # Remove books on one side and add books read this year on the other
+        before = local_changes(first), local_changes(second)
+        for i in range(args.changes):
+            user = i % USERS
+            first.remove_book(f'Title number {user * per_user + i}', f'user{user}')
+        second.add_books(synthetic_books(args.changes), 'user0', read_this_year=True)
+        made = local_changes(first) - before[0], local_changes(second) - before[1]
+
+        received, sent, elapsed = timed_sync(second, first)
+        print(f'after {args.changes} rows changed on each side: received {received} (made {made[0]}), '
+              f'sent {sent} (made {made[1]}) in {elapsed * 1000:.1f} ms')
+        assert (received, sent) == made, 'sync moved changes that were already shared'
+        assert shelves(first) == shelves(second), 'shelves differ after sync'
+        assert timed_sync(second, first)[:2] == (0, 0), 'a repeated sync moved changes'
+        print('shelves match')
+        first.close()
+        second.close()
+
+if __name__ == '__main__':
+    main()
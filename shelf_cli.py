@@ -0,0 +1,197 @@
+import sys
+import time
+import argparse
+from Shelf import Database, ReplicaDatabase, ReplicaPublisher, ShardedDatabase, SnapshotScheduler, import_books, export_books, sync_databases, verify_backup
+
+'''Headless command line for Shelf: import, export, stats, search, backups and sync of shelf.db
+without loading Qt. Run it as python shelf_cli.py <command> ..., or as python Shelf.py <command> ...'''
+
+# Import a CSV or JSONL catalog
+def run_import(db, args):
+    def report(count):
+        print(f'\rImported {count} books...', end='', file=sys.stderr, flush=True)
+
+    count = import_books(db, args.file, args.user, read_this_year=args.read_this_year, progress=report)
+    print(file=sys.stderr)
+    print(f'Imported {count} books for {args.user}.')
+
+# Export a user's books
+def run_export(db, args):
+    count = export_books(db, args.file, args.user)
+    print(f'Exported {count} books for {args.user} to {args.file}.')
+
+# Print book counts for one user or the whole database
+def run_stats(db, args):
+    if args.user:
+        stats = db.get_shelf_stats(args.user)
+        print(f'Books: {stats.books}')
+        print(f'Books read this year: {stats.books_read} of a goal of {stats.goal} '
+              f'({stats.expected_by_now():.0f} expected by today)')
+        print('Top genres: ' + ', '.join(f'{genre or "(none)"} {count}' for genre, count in stats.genres[:5]))
+        print('Top authors: ' + ', '.join(f'{author or "(none)"} {count}' for author, count in stats.authors[:5]))
+        return
+    counts = db.count_all()
+    print(f"Users: {counts['users']}")
+    print(f"Books: {counts['books']} ({counts['catalog']} distinct)")
+    print(f"Books read this year: {counts['books_read_this_year']}")
+
+# Search a user's books
+def run_search(db, args):
+    books = db.search_books(args.user, args.query, limit=args.limit)
+    if not books:
+        print('Book not found in the collection.')
+        return
+    for book in books:
+        print(f'Title: {book.title}, Author: {book.author}, Genre: {book.genre}, Year: {book.year}')
+
+def report_percent(percent):
+    print(f'\r{percent}%', end='', file=sys.stderr, flush=True)
+
+# Copy the live database to a file
+def run_backup(db, args):
+    db.backup(args.file, progress=report_percent)
+    print(file=sys.stderr)
+    print(f'Backed up {db.path} to {args.file}.')
+
+# Take a timestamped snapshot, keeping the newest --keep in the directory
+def run_snapshot(db, args):
+    path = SnapshotScheduler(db, args.directory, keep=args.keep).take(progress=report_percent)
+    print(file=sys.stderr)
+    print(f'Snapshot written to {path}.')
+
+# Check a backup file
+def run_verify(db, args):
+    summary = verify_backup(args.file)
+    print(f"{args.file} is intact: schema version {summary['schema_version']}, {summary['users']} users, "
+          f"{summary['size'] / 2 ** 20:.1f} MB")
+
+# Replace the database with a backup
+def run_restore(db, args):
+    summary = db.restore(args.file, progress=report_percent)
+    print(file=sys.stderr)
+    print(f"Restored {db.path} from {args.file} ({summary['users']} users).")
+
+# Publish a read-only replica once, or every --interval seconds until interrupted
+def run_publish(db, args):
+    publisher = ReplicaPublisher(db, args.file, interval=args.interval or 60.0)
+    publisher.take()
+    print(f'Published {db.path} to {args.file}.')
+    if not args.interval:
+        return
+    publisher.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        publisher.stop()
+
+# Exchange changes with another shelf database
+def run_sync(db, args):
+    peer = Database(args.peer)
+    try:
+        received, sent = sync_databases(db, peer)
+    finally:
+        peer.close()
+    print(f'Received {received} changes from {args.peer} and sent {sent}.')
+
+# Delete the sync changes every known peer already has
+def run_compact(db, args):
+    removed = db.compact_changes()
+    if args.vacuum:
+        db.connection.execute('VACUUM')
+    print(f'Removed {removed} changes from {db.path}.')
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='shelf', description='Manage Shelf book collections from the command line.')
+    parser.add_argument('--db', default='shelf.db', help='database file (default: shelf.db)')
+    parser.add_argument('--sharded', action='store_true',
+                        help='--db is the directory of a sharded database, with each user\'s books in a shard file')
+    parser.add_argument('--replica', action='store_true',
+                        help='--db is a read-only replica written by the publish command')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help='import books from a .csv or .jsonl file (optionally .gz, .bz2 or .xz)')
+    import_parser.add_argument('file')
+    import_parser.add_argument('--user', required=True)
+    import_parser.add_argument('--read-this-year', action='store_true', help='add to books read this year')
+    import_parser.set_defaults(run=run_import)
+
+    export_parser = commands.add_parser('export', help='export books to a .csv, .jsonl, .arrow or .parquet file (.csv.gz etc. to compress)')
+    export_parser.add_argument('file')
+    export_parser.add_argument('--user', required=True)
+    export_parser.set_defaults(run=run_export)
+
+    stats_parser = commands.add_parser('stats', help='show book counts')
+    stats_parser.add_argument('--user')
+    stats_parser.set_defaults(run=run_stats)
+
+    search_parser = commands.add_parser('search', help='search a user\'s books')
+    search_parser.add_argument('query')
+    search_parser.add_argument('--user', required=True)
+    search_parser.add_argument('--limit', type=int, default=50)
+    search_parser.set_defaults(run=run_search)
+
+    backup_parser = commands.add_parser('backup', help='copy the database to a file while it is in use')
+    backup_parser.add_argument('file')
+    backup_parser.set_defaults(run=run_backup)
+
+    snapshot_parser = commands.add_parser('snapshot', help='write a timestamped backup into a directory')
+    snapshot_parser.add_argument('directory')
+    snapshot_parser.add_argument('--keep', type=int, default=7, help='snapshots to keep (default: 7)')
+    snapshot_parser.set_defaults(run=run_snapshot)
+
+    verify_parser = commands.add_parser('verify', help='check a backup file')
+    verify_parser.add_argument('file')
+    verify_parser.set_defaults(run=run_verify)
+
+    restore_parser = commands.add_parser('restore', help='replace the database with a backup')
+    restore_parser.add_argument('file')
+    restore_parser.set_defaults(run=run_restore)
+
+    sync_parser = commands.add_parser('sync', help='exchange changes with another shelf database')
+    sync_parser.add_argument('peer')
+    sync_parser.set_defaults(run=run_sync)
+
+    compact_parser = commands.add_parser('compact', help='delete sync changes every known peer already has')
+    compact_parser.add_argument('--vacuum', action='store_true', help='then shrink the file (rewrites the whole database)')
+    compact_parser.set_defaults(run=run_compact)
+
+    publish_parser = commands.add_parser('publish', help='write a read-only replica for reporting and kiosk readers')
+    publish_parser.add_argument('file')
+    publish_parser.add_argument('--interval', type=float, help='keep publishing every INTERVAL seconds')
+    publish_parser.set_defaults(run=run_publish)
+    return parser
+
+# Commands that work through per-user Database methods, and so on a sharded database too
+SHARDED_COMMANDS = ('import', 'export', 'stats', 'search')
+# Commands that only read, and so work on a replica
+REPLICA_COMMANDS = ('export', 'stats', 'search', 'backup', 'publish')
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.sharded and args.command not in SHARDED_COMMANDS:
+        parser.error(f'{args.command} works on one database file and cannot be used with --sharded')
+    if args.replica and (args.sharded or args.command not in REPLICA_COMMANDS):
+        parser.error(f'{args.command} cannot be used with --replica, which is read only')
+    try:
+        if args.sharded:
+            db = ShardedDatabase(args.db)
+        elif args.replica:
+            db = ReplicaDatabase(args.db)
+        else:
+            db = Database(args.db, migration_progress=lambda message: print(message, file=sys.stderr))
+    except ValueError as error:
+        print(f'shelf: {error}', file=sys.stderr)
+        return 1
+    try:
+        args.run(db, args)
+    except (OSError, ValueError) as error:
+        print(f'shelf: {error}', file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
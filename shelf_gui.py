@@ -0,0 +1,1099 @@
+import os
+import sys
+import threading
+import traceback
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, Qt, QAbstractTableModel, QBuffer, QEventLoop, QIODevice, QModelIndex, QObject, QRunnable, QSize, QThreadPool
+from PyQt5.QtGui import QImage, QImageReader, QPixmap, QPixmapCache
+from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QApplication, QWidget, QLabel, QLineEdit, QPushButton, QMessageBox, QTextEdit, QProgressBar, QFileDialog, QProgressDialog, QTableView, QAbstractItemView, QSpinBox
+from Shelf import User, Book, Database, QueryStats, ReplicaDatabase, SnapshotScheduler, ThumbnailCache, cover_path, import_books, import_cover, export_books, profiled
+
+'''The Shelf.app windows. Shelf.py holds everything that doesn't need Qt, and this module is only
+imported when the GUI is started (or one of its classes is looked up on the Shelf module),
+so headless use never pays for loading PyQt5.'''
+
+# Runs Database work on a thread pool so the widgets never wait on SQLite. Each pool
+# thread gets its own connection from the Database's ConnectionPool, and results are
+# handed back on the GUI thread through signals.
+class DatabaseExecutor(QObject):
+    task_finished = pyqtSignal(int, object, object)
+    task_progress = pyqtSignal(int, object)
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.pool = QThreadPool(self)
+        # Keep pool threads alive so their connections are reused
+        self.pool.setExpiryTimeout(-1)
+        self.tasks = {}
+        self.latest_tasks = {}
+        self.next_task_id = 0
+        self.task_finished.connect(self.deliver)
+        self.task_progress.connect(self.deliver_progress)
+
+    # Run function(db, *args) on the pool. callback(result) or error(exception) is then called
+    # on the GUI thread. Submitting a task with the same key as a pending one makes the older
+    # task stale: it is skipped if it hasn't started and its result is dropped if it has.
+    # When progress is given, function is also passed progress=... and its reports arrive there.
+    def submit(self, function, *args, callback=None, error=None, progress=None, key=None):
+        self.next_task_id += 1
+        task_id = self.next_task_id
+        self.tasks[task_id] = (key, callback, error, progress)
+        if key is not None:
+            self.latest_tasks[key] = task_id
+        self.pool.start(DatabaseTask(self, task_id, function, args, progress is not None))
+        return task_id
+
+    # Drop the pending task submitted under key, if any
+    def cancel(self, key):
+        self.latest_tasks.pop(key, None)
+
+    def is_stale(self, task_id):
+        key = self.tasks.get(task_id, (None,))[0]
+        return key is not None and self.latest_tasks.get(key) != task_id
+
+    @pyqtSlot(int, object, object)
+    def deliver(self, task_id, result, exception):
+        stale = self.is_stale(task_id)
+        key, callback, error, _ = self.tasks.pop(task_id)
+        if stale:
+            return
+        if key is not None:
+            del self.latest_tasks[key]
+        if exception is None:
+            if callback:
+                callback(result)
+        elif error:
+            error(exception)
+        else:
+            traceback.print_exception(type(exception), exception, exception.__traceback__)
+
+    @pyqtSlot(int, object)
+    def deliver_progress(self, task_id, value):
+        if task_id in self.tasks and not self.is_stale(task_id):
+            self.tasks[task_id][3](value)
+
+    # Wait for running tasks to finish
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+
+# A unit of work queued by DatabaseExecutor.submit
+class DatabaseTask(QRunnable):
+    def __init__(self, executor, task_id, function, args, reports_progress):
+        super().__init__()
+        self.executor = executor
+        self.task_id = task_id
+        self.function = function
+        self.args = args
+        self.reports_progress = reports_progress
+
+    def run(self):
+        result, exception = None, None
+        if not self.executor.is_stale(self.task_id):
+            try:
+                kwargs = {}
+                if self.reports_progress:
+                    kwargs['progress'] = lambda value: self.executor.task_progress.emit(self.task_id, value)
+                result = self.function(self.executor.db, *self.args, **kwargs)
+            except Exception as e:
+                exception = e
+        self.executor.task_finished.emit(self.task_id, result, exception)
+
+# Decode an image file, scaled down to fit size if given. Large JPEGs are decoded at the
+# reduced size directly rather than decoded in full and then scaled. Returns a null QImage
+# when the file is missing or unreadable.
+def read_image(path, size=None):
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    source = reader.size()
+    if size is not None and source.isValid() and (source.width() > size.width() or source.height() > size.height()):
+        reader.setScaledSize(source.scaled(size, Qt.KeepAspectRatio))
+    return reader.read()
+
+# Runs read() on a pool thread and emits signal(key, image) with the QImage it returns.
+# Only QImage is used off the GUI thread; QPixmaps are made from it once it arrives.
+class ImageTask(QRunnable):
+    def __init__(self, signal, key, read):
+        super().__init__()
+        self.signal = signal
+        self.key = key
+        self.read = read
+
+    def run(self):
+        try:
+            image = self.read()
+        except Exception:
+            traceback.print_exc()
+            image = QImage()
+        self.signal.emit(self.key, image)
+
+# Cover thumbnails for the book table. pixmap(cover) answers from QPixmapCache when it can;
+# otherwise it returns None and has a worker pool fetch the thumbnail, from the on-disk
+# ThumbnailCache or by decoding the stored image, and cover_loaded(cover) is emitted once
+# the pixmap is cached. Scrolling only ever reads pixmaps already in memory.
+class CoverLoader(QObject):
+    THUMBNAIL_SIZE = QSize(32, 48)
+    # Memory for decoded pixmaps, shared with the rest of the application (in KB)
+    PIXMAP_CACHE_KB = 32 * 1024
+
+    cover_loaded = pyqtSignal(str)
+    image_decoded = pyqtSignal(str, QImage)
+
+    def __init__(self, db, parent=None, size=THUMBNAIL_SIZE):
+        super().__init__(parent)
+        self.covers_directory = db.covers_directory
+        self.thumbnails = ThumbnailCache(os.path.join(db.covers_directory, 'thumbnails'))
+        self.size = size
+        self.pool = QThreadPool(self)
+        # Cover names by the pixmap keys being decoded, and keys that failed to decode
+        self.pending = {}
+        self.failed = set()
+        QPixmapCache.setCacheLimit(max(QPixmapCache.cacheLimit(), self.PIXMAP_CACHE_KB))
+        self.image_decoded.connect(self.deliver)
+
+    def key(self, cover):
+        return f'{cover}-{self.size.width()}x{self.size.height()}'
+
+    # The cover's thumbnail if it is in memory, else None (and it is loaded in the background)
+    def pixmap(self, cover):
+        key = self.key(cover)
+        pixmap = QPixmapCache.find(key)
+        if pixmap is not None and not pixmap.isNull():
+            return pixmap
+        if key not in self.pending and key not in self.failed:
+            self.pending[key] = cover
+            self.pool.start(ImageTask(self.image_decoded, key, lambda: self.decode(cover, key)))
+        return None
+
+    # Runs on the pool: read the cached thumbnail, or make and cache one from the cover
+    def decode(self, cover, key):
+        path = self.thumbnails.get(key)
+        if path:
+            image = QImage(path)
+            if not image.isNull():
+                return image
+        image = read_image(cover_path(self.covers_directory, cover), self.size)
+        if not image.isNull():
+            buffer = QBuffer()
+            buffer.open(QIODevice.WriteOnly)
+            image.save(buffer, 'PNG')
+            self.thumbnails.put(key, bytes(buffer.data()))
+        return image
+
+    @pyqtSlot(str, QImage)
+    def deliver(self, key, image):
+        cover = self.pending.pop(key, None)
+        if image.isNull():
+            self.failed.add(key)
+            return
+        QPixmapCache.insert(key, QPixmap.fromImage(image))
+        if cover is not None:
+            self.cover_loaded.emit(cover)
+
+    # Drop queued decodes and wait for running ones
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+
+# Table model over a user's books that loads pages lazily as the view scrolls, so
+# only the rows that have been scrolled into view are ever fetched and formatted.
+# Pages are queried on the executor's threads and inserted when they arrive; page_loaded
+# is emitted after each one.
+class BookTableModel(QAbstractTableModel):
+    COLUMNS = ('title', 'author', 'genre', 'year')
+    HEADERS = ('Title', 'Author', 'Genre', 'Year')
+    PAGE_SIZE = 200
+
+    page_loaded = pyqtSignal()
+
+    # covers, a CoverLoader, shows cover thumbnails next to the titles
+    def __init__(self, executor, username, parent=None, covers=None):
+        super().__init__(parent)
+        self.executor = executor
+        self.db = executor.db
+        self.username = username
+        # Pages of an older sort or refresh are dropped when they arrive
+        self.page_task = ('books page', id(self))
+        self.covers = covers
+        if covers is not None:
+            covers.cover_loaded.connect(self.cover_loaded)
+        self.sort_by = 'title'
+        self.descending = False
+        self.books = []
+        self.exhausted = False
+        self.loading = False
+
+    # Drop all loaded pages, and the page being loaded
+    def clear(self):
+        self.executor.cancel(self.page_task)
+        self.beginResetModel()
+        self.books = []
+        self.exhausted = False
+        self.loading = False
+        self.endResetModel()
+
+    # Start again from the first page
+    def refresh(self):
+        self.clear()
+        self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.books)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DecorationRole and index.column() == 0 and self.covers is not None:
+            cover = self.books[index.row()].cover
+            return self.covers.pixmap(cover) if cover else None
+        if role != Qt.DisplayRole:
+            return None
+        return getattr(self.books[index.row()], self.COLUMNS[index.column()])
+
+    # A thumbnail arrived: repaint the title column (the view only redraws visible rows)
+    def cover_loaded(self, cover):
+        if self.books:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.books) - 1, 0), [Qt.DecorationRole])
+
+    # A book's cover was set
+    def cover_changed(self, row):
+        self.dataChanged.emit(self.index(row, 0), self.index(row, 0), [Qt.DecorationRole])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and not self.exhausted
+
+    # Ask for the next page; the view may call this again before it arrives
+    def fetchMore(self, parent):
+        if parent.isValid() or self.exhausted or self.loading:
+            return
+        self.loading = True
+        after = Database.page_key(self.books[-1], self.sort_by) if self.books else None
+        self.executor.submit(Database.get_books_page, self.username, self.sort_by, self.descending, after,
+                             self.PAGE_SIZE, key=self.page_task, callback=self.insert_page, error=self.page_failed)
+
+    def insert_page(self, page):
+        self.loading = False
+        if len(page) < self.PAGE_SIZE:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.books), len(self.books) + len(page) - 1)
+            self.books.extend(page)
+            self.endInsertRows()
+        self.page_loaded.emit()
+
+    # Stop fetching rather than retry a failing query on every scroll
+    def page_failed(self, exception):
+        self.loading = False
+        self.exhausted = True
+        traceback.print_exception(type(exception), exception, exception.__traceback__)
+        self.page_loaded.emit()
+
+    # Sorting is done in SQL; columns without an index keep the current order
+    def sort(self, column, order=Qt.AscendingOrder):
+        sort_by = self.COLUMNS[column]
+        if sort_by not in self.db.SORT_COLUMNS:
+            return
+        self.sort_by = sort_by
+        self.descending = order == Qt.DescendingOrder
+        self.refresh()
+
+# Define a class representing a Login/Signup application window
+class LoginSignupApp(QWidget):
+    WINDOW_WIDTH = 550
+    WINDOW_HEIGHT = 350
+
+    def __init__(self, db, executor):
+        super().__init__()
+        self.db = db
+        self.executor = executor
+        self.init_ui()
+
+    # Initialize the user interface
+    def init_ui(self):
+        self.setWindowTitle('Shelf - Login/Sign up')
+        self.setFixedSize(self.WINDOW_WIDTH, self.WINDOW_HEIGHT)
+
+        self.shelf_app = None
+
+        # Left side - Login/Signup fields
+        login_layout = QVBoxLayout()
+        
+        # Widgets for username and password input
+        self.username_label = QLabel('Username:')
+        self.username_edit = QLineEdit()
+
+        self.password_label = QLabel('Password:')
+        self.password_edit = QLineEdit()
+        self.password_edit.setEchoMode(QLineEdit.Password)
+
+        # Buttons for login and signup
+        self.login_button = QPushButton('Login')
+        self.login_button.clicked.connect(self.login)
+        self.login_button.setFixedSize(100, 50)
+
+        self.signup_button = QPushButton('Sign up')
+        self.signup_button.clicked.connect(self.signup_window)
+        self.signup_button.setFixedSize(100, 50)
+
+        # Adjust spacing and add widgets to layout
+        login_layout.addSpacing(60)
+        login_layout.addWidget(self.username_label)
+        login_layout.addWidget(self.username_edit)
+        login_layout.addWidget(self.password_label)
+        login_layout.addWidget(self.password_edit)
+        login_layout.addSpacing(60)
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.login_button)
+        button_layout.addWidget(self.signup_button)
+        button_layout.addStretch()
+        login_layout.addLayout(button_layout)
+
+        # Right side - Logo
+        logo_layout = QVBoxLayout()
+        logo_layout.addStretch()
+
+        # The logo is decoded on a pool thread and shown when it is ready
+        self.logo_label = QLabel()
+        self.logo_label.setAlignment(Qt.AlignCenter)
+        self.logo_loaded.connect(self.show_logo)
+        QThreadPool.globalInstance().start(ImageTask(self.logo_loaded, 'shelf.app.png', lambda: read_image('shelf.app.png')))
+
+        logo_layout.addWidget(self.logo_label)
+
+        # Main layout combining left and right sides
+        main_layout = QHBoxLayout()
+        main_layout.addLayout(login_layout)
+        main_layout.addLayout(logo_layout)
+
+        self.setLayout(main_layout)
+
+    # Define a signal for successful login
+    login_successful_signal = pyqtSignal(str)
+    logo_loaded = pyqtSignal(str, QImage)
+
+    @pyqtSlot(str, QImage)
+    def show_logo(self, path, image):
+        if not image.isNull():
+            self.logo_label.setPixmap(QPixmap.fromImage(image))
+
+    # Handle login process
+    @profiled
+    def login(self):
+        username = self.username_edit.text()
+        password = self.password_edit.text()
+
+        self.login_button.setEnabled(False)
+        # The password hash is checked on the executor, it takes tens of milliseconds
+        self.executor.submit(Database.authenticate, username, password, key='login',
+                             callback=lambda user: self.finish_login(username, user),
+                             error=self.login_error)
+
+    # Open the shelf if the password was right. Unknown users get the same message as
+    # wrong passwords, so the login window doesn't reveal which usernames exist.
+    def finish_login(self, username, user):
+        self.login_button.setEnabled(True)
+        if user:
+            self.username_edit.clear()
+            self.password_edit.clear()
+            self.login_successful_signal.emit(username)
+        else:
+            QMessageBox.warning(self, 'Login Failed', 'Invalid username or password.')
+
+    # Report a database error during login
+    def login_error(self, error):
+        self.login_button.setEnabled(True)
+        QMessageBox.warning(self, 'Login Failed', str(error))
+
+    # Open signup window
+    def signup_window(self):
+        self.signup_app = SignupApp(self.db, self.executor, self)
+        self.signup_app.show()
+
+    # Show main shelf application window
+    def show_shelf_app(self, username):
+        if not self.shelf_app:
+            self.shelf_app = ShelfApp(username, self.db, self.executor, parent=self)
+            self.shelf_app.logout_signal.connect(self.clear_shelf_app)
+        else:
+            self.shelf_app.clear_book_list()
+        self.shelf_app.show()
+    
+    # Clear shelf application window
+    def clear_shelf_app(self):
+        self.shelf_app.clear_book_list()
+
+    # Show login/signup window
+    def show_login_signup_window(self):
+        self.show()
+
+# Define a class representing a Signup window
+class SignupApp(QWidget):
+    WINDOW_WIDTH = 400
+    WINDOW_HEIGHT = 400
+
+    def __init__(self, db, executor, parent):
+        super().__init__()
+        self.db = db
+        self.executor = executor
+        self.parent = parent
+        self.init_ui()
+
+    # Initialize the user interface
+    def init_ui(self):
+        self.setWindowTitle('Shelf - Sign up')
+        self.setFixedSize(self.WINDOW_WIDTH, self.WINDOW_HEIGHT)
+
+        # Widgets for user information input
+        self.name_label = QLabel('Name:')
+        self.name_edit = QLineEdit()
+
+        self.email_label = QLabel('Email:')
+        self.email_edit = QLineEdit()
+
+        self.username_label = QLabel('Username:')
+        self.username_edit = QLineEdit()
+
+        self.password_label = QLabel('Password:')
+        self.password_edit = QLineEdit()
+        self.password_edit.setEchoMode(QLineEdit.Password)
+
+        self.genre_label = QLabel('Favorite Genre:')
+        self.genre_edit = QLineEdit()
+
+        # Button for signup
+        self.signup_button = QPushButton('Sign up')
+        self.signup_button.clicked.connect(self.signup)
+
+        # Add widgets to layout
+        layout = QVBoxLayout()
+        layout.addWidget(self.name_label)
+        layout.addWidget(self.name_edit)
+        layout.addWidget(self.email_label)
+        layout.addWidget(self.email_edit)
+        layout.addWidget(self.username_label)
+        layout.addWidget(self.username_edit)
+        layout.addWidget(self.password_label)
+        layout.addWidget(self.password_edit)
+        layout.addWidget(self.genre_label)
+        layout.addWidget(self.genre_edit)
+        layout.addWidget(self.signup_button)
+
+        self.setLayout(layout)
+
+    # Handle signup process
+    def signup(self):
+        name = self.name_edit.text()
+        email = self.email_edit.text()
+        username = self.username_edit.text()
+        password = self.password_edit.text()
+        favorite_genre = self.genre_edit.text()
+
+        if not name or not email or not username or not password:
+            QMessageBox.warning(self, 'Sign up Failed', 'Please fill in all the fields.')
+            return
+
+        new_user = User(username, password, name, email, favorite_genre)
+        self.signup_button.setEnabled(False)
+        self.executor.submit(Database.get_user, username, key='signup',
+                             callback=lambda existing_user: self.create_user(new_user, existing_user),
+                             error=self.signup_error)
+
+    # Add the new user unless the username is already taken
+    def create_user(self, new_user, existing_user):
+        if existing_user:
+            self.signup_button.setEnabled(True)
+            QMessageBox.warning(self, 'Sign up Failed', 'Username already exists. Please choose a different one.')
+            return
+        self.executor.submit(Database.add_user, new_user, callback=self.finish_signup, error=self.signup_error)
+
+    # Return to the login window after a successful signup
+    def finish_signup(self, _):
+        QMessageBox.information(self, 'Sign up Successful', 'You have successfully signed up!')
+        self.parent.show()
+        self.close()
+
+    # Report a database error during signup
+    def signup_error(self, error):
+        self.signup_button.setEnabled(True)
+        QMessageBox.warning(self, 'Sign up Failed', str(error))
+
+# Genre, author and decade breakdowns of a shelf and the reading pace, loaded in the
+# background from Database.get_shelf_stats (cached there, so reopening is instant)
+class StatsPanel(QWidget):
+    BAR_WIDTH = 30
+
+    def __init__(self, username, executor, parent=None):
+        super().__init__(parent)
+        self.username = username
+        self.executor = executor
+        self.setWindowTitle(f'Shelf - Stats for {username}')
+        self.resize(520, 600)
+        self.summary_label = QLabel('Loading...')
+        self.summary_label.setWordWrap(True)
+        self.details_text = QTextEdit()
+        self.details_text.setReadOnly(True)
+        layout = QVBoxLayout()
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.details_text)
+        self.setLayout(layout)
+
+    def refresh(self):
+        self.executor.submit(Database.get_shelf_stats, self.username, key=('shelf stats', self.username),
+                             callback=self.show_stats, error=lambda error: self.summary_label.setText(f'Error: {error}'))
+
+    def show_stats(self, stats):
+        expected = stats.expected_by_now()
+        pace = 'ahead of' if stats.books_read >= expected else 'behind'
+        summary = [f'{stats.books} books on the shelf.',
+                   f'Read {stats.books_read} of {stats.goal} this year: {pace} the {expected:.0f} the goal calls for '
+                   f'by today, on course for {stats.projected():.0f} by the end of the year.']
+        if stats.favorite_genre:
+            count, rank = stats.favorite_genre_books()
+            place = f'#{rank} of {len(stats.genres)} genres' if rank else 'not on the shelf yet'
+            summary.append(f'Favorite genre {stats.favorite_genre}: {count} books ({place}), '
+                           f'{stats.favorite_genre_read} read this year.')
+        self.summary_label.setText('\n'.join(summary))
+
+        lines = []
+        for heading, counts in (('Genres', stats.genres), ('Top authors', stats.authors),
+                                ('Publication decades', [(f'{decade}s' if decade is not None else 'Unknown', count)
+                                                         for decade, count in stats.decades])):
+            lines.append(heading)
+            largest = max((count for _, count in counts), default=0)
+            for name, count in counts:
+                bar = '#' * max(1, round(self.BAR_WIDTH * count / largest))
+                lines.append(f'  {name or "(none)":<24.24} {count:>8}  {bar}')
+            lines.append('')
+        self.details_text.setPlainText('\n'.join(lines))
+
+# Define a class representing the main Shelf application window
+class ShelfApp(QWidget):
+    WINDOW_WIDTH = 800
+    WINDOW_HEIGHT = 600
+
+    # Define a class-level logout signal
+    logout_signal = pyqtSignal()
+
+    def __init__(self, username, db, executor, parent=None, covers=None):
+        super().__init__(parent)
+        self.username = username
+        self.db = db
+        self.executor = executor
+        self.covers = covers if covers is not None else CoverLoader(db, self)
+        self.books_read_this_year = []
+        self.reading_goal = Database.DEFAULT_READING_GOAL
+        self.books_read_count = 0
+        self.stats_panel = None
+        self.init_ui()
+        self.load_reading_progress()
+        # Count genres, authors and decades now, so the stats panel opens without waiting
+        self.executor.submit(Database.get_shelf_stats, self.username, error=self.show_error)
+
+    # Load this year's goal, count and most recent books read in the background
+    def load_reading_progress(self):
+        self.executor.submit(Database.get_reading_progress, self.username, key=('progress', self.username),
+                             callback=self.set_reading_progress, error=self.show_error)
+        self.executor.submit(Database.get_books_read, self.username, key=('books read', self.username),
+                             callback=self.set_books_read, error=self.show_error)
+
+    def set_reading_progress(self, progress):
+        self.reading_goal, self.books_read_count = progress
+        self.show_reading_progress()
+
+    def set_books_read(self, books):
+        self.books_read_this_year = books
+        self.show_books_read()
+
+    # Show the goal and fill the progress bar from the stored counters
+    def show_reading_progress(self):
+        self.goal_value.setText(f'{self.reading_goal} books')
+        self.goal_edit.setValue(self.reading_goal)
+        self.progress_bar.setMaximum(self.reading_goal)
+        self.progress_bar.setValue(min(self.books_read_count, self.reading_goal))
+        self.progress_bar.setFormat(f'{self.books_read_count} / {self.reading_goal}')
+
+    # Save a new reading goal for this year
+    def set_reading_goal(self):
+        goal = self.goal_edit.value()
+        self.executor.submit(Database.set_reading_goal, self.username, goal,
+                             callback=lambda _: self.reading_goal_saved(goal), error=self.show_error)
+
+    def reading_goal_saved(self, goal):
+        self.reading_goal = goal
+        self.show_reading_progress()
+
+    # Open the stats panel, refreshed every time it is shown
+    @profiled
+    def show_stats(self):
+        if self.stats_panel is None:
+            self.stats_panel = StatsPanel(self.username, self.executor)
+        self.stats_panel.refresh()
+        self.stats_panel.show()
+        self.stats_panel.raise_()
+
+    # Report a failed database operation
+    def show_error(self, error):
+        self.output_text.append(f"Error: {error}")
+
+    # Initialize the user interface
+    def init_ui(self):
+        self.setWindowTitle('Shelf - Book Collection Manager')
+        self.setFixedSize(self.WINDOW_WIDTH, self.WINDOW_HEIGHT)
+
+        # Left side - Book management fields
+        book_layout = QVBoxLayout()
+
+        # Widgets for adding, removing, searching, and listing books
+        self.title_label = QLabel('Title:')
+        self.title_edit = QLineEdit()
+
+        self.author_label = QLabel('Author:')
+        self.author_edit = QLineEdit()
+
+        self.genre_label = QLabel('Genre:')
+        self.genre_edit = QLineEdit()
+
+        self.year_label = QLabel('Year:')
+        self.year_edit = QLineEdit()
+
+        self.add_button = QPushButton('Add Book')
+        self.add_button.clicked.connect(self.add_book)
+
+        self.remove_label = QLabel('Remove Book:')
+        self.remove_edit = QLineEdit()
+
+        self.remove_button = QPushButton('Remove Book')
+        self.remove_button.clicked.connect(self.remove_book)
+
+        self.search_label = QLabel('Search Book:')
+        self.search_edit = QLineEdit()
+
+        self.search_button = QPushButton('Search Book')
+        self.search_button.clicked.connect(self.search_book)
+
+        self.list_button = QPushButton('List all Books')
+        self.list_button.clicked.connect(self.list_books)
+
+        self.import_button = QPushButton('Import Books')
+        self.import_button.clicked.connect(self.import_books)
+
+        self.export_button = QPushButton('Export Books')
+        self.export_button.clicked.connect(self.export_books)
+
+        self.stats_button = QPushButton('Shelf Stats')
+        self.stats_button.clicked.connect(self.show_stats)
+
+        self.backup_button = QPushButton('Back Up')
+        self.backup_button.clicked.connect(self.backup_database)
+
+        self.cover_button = QPushButton('Set Cover')
+        self.cover_button.clicked.connect(self.set_cover)
+
+        self.quit_button = QPushButton('Log Out')
+        self.quit_button.clicked.connect(self.logout)
+
+        # Add widgets to layout
+        book_layout.addWidget(self.title_label)
+        book_layout.addWidget(self.title_edit)
+        book_layout.addWidget(self.author_label)
+        book_layout.addWidget(self.author_edit)
+        book_layout.addWidget(self.genre_label)
+        book_layout.addWidget(self.genre_edit)
+        book_layout.addWidget(self.year_label)
+        book_layout.addWidget(self.year_edit)
+        book_layout.addWidget(self.add_button)
+        book_layout.addWidget(self.remove_label)
+        book_layout.addWidget(self.remove_edit)
+        book_layout.addWidget(self.remove_button)
+        book_layout.addWidget(self.search_label)
+        book_layout.addWidget(self.search_edit)
+        book_layout.addWidget(self.search_button)
+        book_layout.addWidget(self.list_button)
+        book_layout.addWidget(self.import_button)
+        book_layout.addWidget(self.export_button)
+        book_layout.addWidget(self.stats_button)
+        book_layout.addWidget(self.backup_button)
+        book_layout.addWidget(self.cover_button)
+        book_layout.addWidget(self.quit_button)
+
+        # Right side - Vertical layout for reading goal, books read this year, and output text
+        right_layout = QVBoxLayout()
+
+        # Input field for adding books read this year
+        input_layout = QVBoxLayout()
+
+        input_label = QLabel('Add Book Read This Year:')
+        self.input_field = QLineEdit()
+        
+        self.add_button = QPushButton('Add')
+        self.add_button.clicked.connect(self.add_book_read_this_year)
+
+        input_layout.addWidget(input_label)
+        input_layout.addWidget(self.input_field)
+        input_layout.addWidget(self.add_button)
+
+        right_layout.addLayout(input_layout)
+
+        # Reading goal and progress bar
+        goal_layout = QVBoxLayout()
+
+        self.goal_label = QLabel('Reading Goal:')
+        self.goal_value = QLabel(f'{self.reading_goal} books')
+
+        goal_edit_layout = QHBoxLayout()
+        self.goal_edit = QSpinBox()
+        self.goal_edit.setRange(1, 10000)
+        self.goal_edit.setValue(self.reading_goal)
+        self.goal_button = QPushButton('Set Goal')
+        self.goal_button.clicked.connect(self.set_reading_goal)
+        goal_edit_layout.addWidget(self.goal_edit)
+        goal_edit_layout.addWidget(self.goal_button)
+
+        self.progress_bar = QProgressBar()
+
+        goal_layout.addWidget(self.goal_label)
+        goal_layout.addWidget(self.goal_value)
+        goal_layout.addLayout(goal_edit_layout)
+        goal_layout.addWidget(self.progress_bar)
+
+        right_layout.addLayout(goal_layout)
+
+        # Books read this year
+        books_read_layout = QVBoxLayout()
+
+        books_read_label = QLabel('Books Read This Year:')
+        self.books_read_text = QTextEdit()
+
+        books_read_layout.addWidget(books_read_label)
+        books_read_layout.addWidget(self.books_read_text)
+
+        right_layout.addLayout(books_read_layout)
+
+        # Output text
+        output_layout = QVBoxLayout()
+
+        self.book_model = BookTableModel(self.executor, self.username, self, covers=self.covers)
+        self.book_model.page_loaded.connect(self.books_listed)
+        self.listing = False
+        self.book_table = QTableView()
+        self.book_table.setModel(self.book_model)
+        self.book_table.setIconSize(self.covers.size)
+        self.book_table.verticalHeader().setDefaultSectionSize(self.covers.size.height() + 4)
+        self.book_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.book_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.book_table.verticalHeader().setVisible(False)
+        self.book_table.horizontalHeader().setSortIndicator(0, Qt.AscendingOrder)
+        self.book_table.setSortingEnabled(True)
+
+        self.output_text = QTextEdit()
+
+        output_layout.addWidget(self.book_table)
+        output_layout.addWidget(self.output_text)
+
+        right_layout.addLayout(output_layout)
+
+        # Main layout combining left and right sides
+        main_layout = QHBoxLayout()
+        main_layout.addLayout(book_layout)
+        main_layout.addLayout(right_layout)
+
+        self.setLayout(main_layout)
+
+    # Show books read this year, most recent first
+    def show_books_read(self):
+        self.books_read_text.clear()
+        for book in self.books_read_this_year:
+            self.books_read_text.append(f"{book.title} by {book.author}")
+        hidden = self.books_read_count - len(self.books_read_this_year)
+        if hidden > 0:
+            self.books_read_text.append(f"... and {hidden} more")
+
+    # Add a book to books read this year
+    @profiled
+    def add_book_read_this_year(self):
+        book_title = self.input_field.text()
+
+        if book_title:
+            book = Book(title=book_title, author='', genre='', year='')
+            self.executor.submit(Database.add_book, book, self.username, True,
+                                 callback=lambda _: self.book_read_added(book), error=self.show_error)
+            self.input_field.clear()
+
+    def book_read_added(self, book):
+        self.books_read_this_year.insert(0, book)
+        self.books_read_count += 1
+        self.show_books_read()
+        self.show_reading_progress()
+
+    # Logout and emit logout signal
+    def logout(self):
+        self.executor.submit(Database.flush, True, error=self.show_error)
+        if self.stats_panel is not None:
+            self.stats_panel.close()
+        self.close()
+        self.logout_signal.emit()
+
+    # Clear book list
+    def clear_book_list(self):
+        self.book_model.clear()
+        self.output_text.clear()
+
+    # Add a book to the collection
+    @profiled
+    def add_book(self):
+        title = self.title_edit.text()
+        author = self.author_edit.text()
+        genre = self.genre_edit.text()
+        year = self.year_edit.text()
+
+        new_book = Book(title, author, genre, year)
+        self.executor.submit(Database.add_book, new_book, self.username,
+                             callback=lambda _: self.output_text.append("Book added successfully!"),
+                             error=self.show_error)
+        self.clear_text_fields()
+
+    # Remove a book from the collection
+    @profiled
+    def remove_book(self):
+        title = self.remove_edit.text()
+        self.executor.submit(Database.remove_book, title, self.username,
+                             callback=self.book_removed, error=self.show_error)
+        self.clear_text_fields()
+
+    def book_removed(self, removed):
+        if not removed:
+            self.output_text.append("Book not found in the collection.")
+            return
+        self.output_text.append("Book removed successfully!")
+
+    # Search for a book in the collection. A newer search makes a pending one stale.
+    @profiled
+    def search_book(self):
+        query = self.search_edit.text()
+        self.executor.submit(Database.search_books, self.username, query, key=('search', self.username),
+                             callback=self.show_search_results, error=self.show_error)
+
+    def show_search_results(self, books):
+        if not books:
+            self.output_text.append("Book not found in the collection.")
+            self.clear_text_fields()
+            return
+        for book in books:
+            self.output_text.append(f"Title: {book.title}, Author: {book.author}, Genre: {book.genre}, Year: {book.year}")
+
+    # List all books in the collection
+    @profiled
+    def list_books(self):
+        self.listing = True
+        self.book_model.refresh()
+
+    # The first page of a listing arrived
+    def books_listed(self):
+        if not self.listing:
+            return
+        self.listing = False
+        if not self.book_model.rowCount():
+            self.output_text.append("No books in the collection.")
+
+    # Import books from a CSV or JSONL file
+    @profiled
+    def import_books(self):
+        path, _ = QFileDialog.getOpenFileName(self, 'Import Books', '', 'Book catalogs (*.csv *.jsonl *.gz *.bz2 *.xz)')
+        if not path:
+            return
+
+        self.import_button.setEnabled(False)
+        self.progress_dialog = QProgressDialog('Importing books...', None, 0, 0, self)
+        self.progress_dialog.setWindowModality(Qt.WindowModal)
+        self.progress_dialog.show()
+        self.executor.submit(import_books, path, self.username,
+                             callback=self.import_finished, error=self.import_failed,
+                             progress=lambda count: self.progress_dialog.setLabelText(f'Imported {count} books...'))
+
+    def import_finished(self, count):
+        self.progress_dialog.close()
+        self.import_button.setEnabled(True)
+        self.output_text.append(f"Imported {count} books.")
+
+    def import_failed(self, error):
+        self.progress_dialog.close()
+        self.import_button.setEnabled(True)
+        QMessageBox.warning(self, 'Import Failed', str(error))
+
+    # Export the shelf to a CSV, JSONL, Arrow or Parquet file, optionally compressed
+    @profiled
+    def export_books(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Export Books', f'{self.username}.csv',
+                                              'Book catalogs (*.csv *.jsonl *.arrow *.parquet *.gz *.bz2 *.xz)')
+        if not path:
+            return
+
+        self.export_button.setEnabled(False)
+        self.executor.submit(export_books, path, self.username,
+                             callback=lambda count: self.export_finished(count, path), error=self.export_failed)
+
+    def export_finished(self, count, path):
+        self.export_button.setEnabled(True)
+        self.output_text.append(f"Exported {count} books to {path}.")
+
+    def export_failed(self, error):
+        self.export_button.setEnabled(True)
+        QMessageBox.warning(self, 'Export Failed', str(error))
+
+    # Copy the database to a file on the executor; the window stays usable meanwhile
+    @profiled
+    def backup_database(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Back Up Shelf', 'shelf-backup.db', 'SQLite databases (*.db)')
+        if not path:
+            return
+
+        self.backup_button.setEnabled(False)
+        self.executor.submit(Database.backup, path,
+                             callback=self.backup_finished, error=self.backup_failed,
+                             progress=lambda percent: self.backup_button.setText(f'Backing Up {percent}%'))
+
+    def backup_finished(self, path):
+        self.backup_button.setText('Back Up')
+        self.backup_button.setEnabled(True)
+        self.output_text.append(f"Backed up to {path}.")
+
+    def backup_failed(self, error):
+        self.backup_button.setText('Back Up')
+        self.backup_button.setEnabled(True)
+        QMessageBox.warning(self, 'Backup Failed', str(error))
+
+    # Set the cover of the book selected in the table from an image file. The file is hashed
+    # and copied on the executor, and its thumbnail is decoded by the cover loader.
+    @profiled
+    def set_cover(self):
+        row = self.book_table.currentIndex().row()
+        if row < 0 or row >= len(self.book_model.books):
+            self.output_text.append("Select a book in the table first.")
+            return
+        path, _ = QFileDialog.getOpenFileName(self, 'Choose Cover', '', 'Images (*.png *.jpg *.jpeg *.gif *.bmp *.webp)')
+        if not path:
+            return
+
+        book = self.book_model.books[row]
+        self.executor.submit(import_cover, Book(book.title, book.author, book.genre, book.year, id=book.id), path,
+                             callback=lambda cover: self.cover_set(book, cover), error=self.show_error)
+
+    def cover_set(self, book, cover):
+        book.cover = cover
+        if book in self.book_model.books:
+            self.book_model.cover_changed(self.book_model.books.index(book))
+        self.output_text.append(f"Set the cover of {book.title}.")
+
+    # Clear input fields
+    def clear_text_fields(self):
+        self.title_edit.clear()
+        self.author_edit.clear()
+        self.genre_edit.clear()
+        self.year_edit.clear()
+        self.remove_edit.clear()
+        self.search_edit.clear()
+
+# Opens the database on a worker thread while the GUI keeps running. Opening an old shelf.db
+# upgrades its schema, which takes many seconds for a large one; its progress messages are
+# shown in a dialog, which only appears when there is an upgrade to report.
+class DatabaseOpener(QObject):
+    progress = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    # open_database(migration_progress) returns the Database
+    def __init__(self, open_database, parent=None):
+        super().__init__(parent)
+        self.open_database = open_database
+        self.db = None
+        self.error = None
+        self.dialog = None
+        self.progress.connect(self.show_progress)
+
+    # Open the database, handling GUI events until it is ready
+    def open(self):
+        loop = QEventLoop()
+        self.finished.connect(loop.quit)
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        loop.exec_()
+        thread.join()
+        if self.dialog is not None:
+            self.dialog.close()
+        if self.error is not None:
+            raise self.error
+        return self.db
+
+    def run(self):
+        try:
+            self.db = self.open_database(self.progress.emit)
+        except Exception as e:
+            self.error = e
+        self.finished.emit()
+
+    def show_progress(self, message):
+        if self.dialog is None:
+            self.dialog = QProgressDialog(message, None, 0, 0)
+            self.dialog.setWindowTitle('Upgrading Shelf')
+            self.dialog.show()
+        self.dialog.setLabelText(message)
+
+# Define a class representing the main application
+class ShelfApplication(QApplication):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # SHELF_STATS=<file> records query statistics and writes them there on exit
+        self.stats_path = os.environ.get('SHELF_STATS')
+        stats = QueryStats() if self.stats_path else None
+        # SHELF_REPLICA=<file> opens a replica published with shelf_cli.py publish, read only,
+        # for kiosk displays; it picks up newly published snapshots every minute
+        if os.environ.get('SHELF_REPLICA'):
+            self.db = ReplicaDatabase(os.environ['SHELF_REPLICA'], refresh_interval=60.0, stats=stats)
+        else:
+            self.db = DatabaseOpener(lambda progress: Database(write_behind=True, stats=stats,
+                                                               migration_progress=progress)).open()
+        self.executor = DatabaseExecutor(self.db, self)
+        self.covers = CoverLoader(self.db, self)
+        # SHELF_BACKUP_DIR=<directory> takes a snapshot there every SHELF_BACKUP_INTERVAL seconds
+        # (an hour by default), keeping the newest SHELF_BACKUP_KEEP (7 by default)
+        self.snapshots = None
+        if os.environ.get('SHELF_BACKUP_DIR'):
+            self.snapshots = SnapshotScheduler(self.db, os.environ['SHELF_BACKUP_DIR'],
+                                               keep=int(os.environ.get('SHELF_BACKUP_KEEP', 7)),
+                                               interval=float(os.environ.get('SHELF_BACKUP_INTERVAL', 3600)))
+            self.snapshots.start()
+            self.aboutToQuit.connect(self.snapshots.stop)
+        self.aboutToQuit.connect(self.covers.shutdown)
+        self.aboutToQuit.connect(self.executor.shutdown)
+        self.aboutToQuit.connect(self.db.close)
+        if self.stats_path:
+            self.aboutToQuit.connect(lambda: self.db.stats.write(self.stats_path))
+        self.login_signup_app = LoginSignupApp(self.db, self.executor)
+        self.login_signup_app.show()
+        self.login_signup_app.login_successful_signal.connect(self.show_shelf_app)
+
+    # Show main shelf application window
+    def show_shelf_app(self, username):
+        self.shelf_app = ShelfApp(username, self.db, self.executor, covers=self.covers)
+        self.shelf_app.logout_signal.connect(self.show_login_signup_window)
+        self.shelf_app.show()
+
+    # Show login/signup window
+    def show_login_signup_window(self):
+        self.login_signup_app.show()
+
+if __name__ == '__main__':
+    app = ShelfApplication(sys.argv)
+    sys.exit(app.exec_())
@@ -0,0 +1,43 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Shelf import Database, PasswordHasher
+
+# Hashing isn't what these tests are about, so keep it cheap
+FAST_HASHER = PasswordHasher('pbkdf2_sha256', iterations=1)
+
+# Open databases in the test's temporary directory by name; all are closed afterwards
+@pytest.fixture
+def open_db(tmp_path):
+    opened = []
+
+    def open_database(name='shelf.db', **kwargs):
+        kwargs.setdefault('password_hasher', FAST_HASHER)
+        db = Database(str(tmp_path / name), **kwargs)
+        opened.append(db)
+        return db
+    yield open_database
+    for db in opened:
+        db.close()
+
+@pytest.fixture
+def db(open_db):
+    return open_db()
+
+# A shelf.db as the first version of Shelf left it, before any migration ran
+def create_baseline(path, users=(), books=(), books_read=()):
+    connection = sqlite3.connect(path)
+    connection.execute('''CREATE TABLE users (username TEXT PRIMARY KEY, password TEXT, name TEXT, email TEXT,
+                                             favorite_genre TEXT)''')
+    for table_name, rows in (('books', books), ('books_read_this_year', books_read)):
+        connection.execute(f'''CREATE TABLE {table_name} (title TEXT, author TEXT, genre TEXT, year TEXT, username TEXT,
+                                                         FOREIGN KEY (username) REFERENCES users(username))''')
+        connection.executemany(f'''INSERT INTO {table_name} VALUES (?, ?, ?, ?, ?)''', rows)
+    connection.executemany('''INSERT INTO users VALUES (?, ?, '', '', '')''', users)
+    connection.commit()
+    connection.close()
+    return path
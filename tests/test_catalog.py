@@ -0,0 +1,36 @@
+from conftest import create_baseline
+from Shelf import Book, User
+
+def shelf(db, username):
+    return [(book.title, book.author, book.genre, book.year) for book in db.get_books(username)]
+
+def test_books_differing_in_case_genre_or_year_stay_separate(db):
+    db.add_user(User('alice', 'secret'))
+    db.add_user(User('bob', 'secret'))
+    db.add_book(Book('The Hobbit', 'Tolkien', 'Fantasy', '1937'), 'alice')
+    db.add_book(Book('the hobbit', 'tolkien', 'Kids', '1999'), 'bob')
+    db.add_book(Book('The Hobbit', 'Tolkien', 'Fantasy', '1937'), 'bob')
+    assert shelf(db, 'alice') == [('The Hobbit', 'Tolkien', 'Fantasy', '1937')]
+    assert sorted(shelf(db, 'bob')) == [('The Hobbit', 'Tolkien', 'Fantasy', '1937'),
+                                        ('the hobbit', 'tolkien', 'Kids', '1999')]
+    # The identical copy is shared
+    assert db.count_all()['catalog'] == 2
+
+def test_remove_book_matches_the_exact_title(db):
+    db.add_user(User('bob', 'secret'))
+    db.add_book(Book('the hobbit', 'tolkien', 'Kids', '1999'), 'bob')
+    db.add_book(Book('The Hobbit', 'Tolkien', 'Fantasy', '1937'), 'bob')
+    assert db.remove_book('the hobbit', 'bob') == 1
+    assert shelf(db, 'bob') == [('The Hobbit', 'Tolkien', 'Fantasy', '1937')]
+    assert db.remove_book('THE  HOBBIT ', 'bob') == 0
+    assert db.remove_book('The Hobbit', 'bob') == 1
+    assert db.count_books('bob') == 0
+
+def test_migration_keeps_each_users_details(open_db, tmp_path):
+    create_baseline(str(tmp_path / 'shelf.db'), users=[('alice', 'a'), ('bob', 'b')],
+                    books=[('The Hobbit', 'Tolkien', 'Fantasy', '1937', 'alice'),
+                           ('the hobbit', 'tolkien', 'Kids', '1999', 'bob')])
+    db = open_db('shelf.db')
+    assert shelf(db, 'alice') == [('The Hobbit', 'Tolkien', 'Fantasy', '1937')]
+    assert shelf(db, 'bob') == [('the hobbit', 'tolkien', 'Kids', '1999')]
+    assert db.remove_book('the hobbit', 'bob') == 1
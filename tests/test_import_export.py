@@ -0,0 +1,74 @@
+import sys
+
+import pytest
+
+from Shelf import Book, User, export_books, import_books
+
+BOOKS = [Book('Dune', 'Frank Herbert', 'Science Fiction', '1965'),
+         Book('Quotes "and", commas', 'Åsa Larsson', 'Mystery', '2003'),
+         Book('Line\nbreak', 'Author', '', ''),
+         Book('日本の本', '作者', 'Poetry', '1999')]
+MAGIC = {'.gz': b'\x1f\x8b', '.bz2': b'BZh', '.xz': b'\xfd7zXZ'}
+
+@pytest.fixture
+def shelves(db):
+    for username in ('alice', 'bob'):
+        db.add_user(User(username, 'secret'))
+    db.add_books(BOOKS, 'alice')
+    return db
+
+def shelf(db, username):
+    return [(book.title, book.author, book.genre, book.year) for book in db.get_books(username)]
+
+@pytest.mark.parametrize('compression', ['', '.gz', '.bz2', '.xz'])
+@pytest.mark.parametrize('extension', ['.csv', '.jsonl'])
+def test_export_and_import_round_trip(shelves, tmp_path, extension, compression):
+    path = str(tmp_path / f'books{extension}{compression}')
+    assert export_books(shelves, path, 'alice') == len(BOOKS)
+    if compression:
+        with open(path, 'rb') as exported:
+            assert exported.read(len(MAGIC[compression])) == MAGIC[compression]
+    counts = []
+    assert import_books(shelves, path, 'bob', progress=counts.append) == len(BOOKS)
+    assert counts == [len(BOOKS)]
+    assert shelf(shelves, 'bob') == shelf(shelves, 'alice')
+
+def test_books_read_are_imported_as_read(shelves, tmp_path):
+    path = str(tmp_path / 'books.csv')
+    export_books(shelves, path, 'alice')
+    import_books(shelves, path, 'bob', read_this_year=True)
+    assert shelves.count_books('bob') == 0
+    assert shelves.count_books('bob', read_this_year=True) == len(BOOKS)
+
+def test_jsonl_years_may_be_numbers(shelves, tmp_path):
+    path = tmp_path / 'books.jsonl'
+    path.write_text('{"title": "Emma", "author": "Jane Austen", "year": 1815}\n\n', encoding='utf-8')
+    assert import_books(shelves, str(path), 'bob') == 1
+    assert shelf(shelves, 'bob') == [('Emma', 'Jane Austen', '', '1815')]
+
+@pytest.mark.parametrize('name', ['books.txt', 'books.arrow.gz', 'books.parquet.xz'])
+def test_unsupported_formats_are_refused(shelves, tmp_path, name):
+    with pytest.raises(ValueError):
+        export_books(shelves, str(tmp_path / name), 'alice')
+
+@pytest.mark.parametrize('name', ['books.txt', 'books.arrow', 'books.parquet'])
+def test_unsupported_imports_are_refused(shelves, tmp_path, name):
+    (tmp_path / name).write_bytes(b'')
+    with pytest.raises(ValueError):
+        import_books(shelves, str(tmp_path / name), 'bob')
+
+@pytest.mark.parametrize('name', ['books.arrow', 'books.parquet'])
+def test_columnar_exports_need_pyarrow(shelves, tmp_path, monkeypatch, name):
+    # A None entry makes the import fail as if pyarrow were not installed
+    for module in ('pyarrow', 'pyarrow.ipc', 'pyarrow.parquet'):
+        monkeypatch.setitem(sys.modules, module, None)
+    with pytest.raises(ValueError, match='pyarrow'):
+        export_books(shelves, str(tmp_path / name), 'alice')
+
+def test_arrow_export(shelves, tmp_path):
+    ipc = pytest.importorskip('pyarrow.ipc')
+    path = str(tmp_path / 'books.arrow')
+    assert export_books(shelves, path, 'alice') == len(BOOKS)
+    with ipc.open_file(path) as reader:
+        table = reader.read_all()
+    assert [tuple(row.values()) for row in table.to_pylist()] == shelf(shelves, 'alice')
@@ -0,0 +1,52 @@
+import pytest
+
+from Shelf import Item, User
+
+def item_columns(db):
+    return [row[1] for row in db.cursor.execute('PRAGMA table_xinfo(items)')]
+
+def query_plan(db, type_id):
+    db.cursor.execute(f'''EXPLAIN QUERY PLAN SELECT id FROM items WHERE username = ? AND type_id = {type_id}
+                          AND json_extract(attributes, '$.artist') = ? ORDER BY title''', ('alice', 'x'))
+    return ' '.join(row[3] for row in db.cursor.fetchall())
+
+@pytest.fixture
+def alice(db):
+    db.add_user(User('alice', 'secret'))
+    return db
+
+def test_indexed_attributes_leave_the_items_table_alone(alice):
+    columns = item_columns(alice)
+    vinyl = alice.add_item_type('alice', 'vinyl', ['artist', 'label'], indexed=['artist'])
+    for i in range(5):
+        alice.add_item('alice', Item(f'Record {i}', 'vinyl', {'artist': f'Artist {i % 2}', 'label': 'Label'}))
+    assert item_columns(alice) == columns
+    assert f'idx_items_{vinyl.id}_artist' in query_plan(alice, vinyl.id)
+    found = alice.find_items('alice', 'vinyl', {'artist': 'Artist 1'})
+    assert [item.title for item in found] == ['Record 1', 'Record 3']
+
+def test_indexes_belong_to_their_item_type(alice):
+    vinyl = alice.add_item_type('alice', 'vinyl', ['artist'], indexed=['artist'])
+    tapes = alice.add_item_type('alice', 'tapes', ['artist'])
+    assert f'idx_items_{vinyl.id}_artist' not in query_plan(alice, tapes.id)
+    alice.add_item('alice', Item('Tape', 'tapes', {'artist': 'Someone'}))
+    assert [item.title for item in alice.find_items('alice', 'tapes', {'artist': 'Someone'})] == ['Tape']
+
+def test_indexed_attributes_are_limited(alice):
+    attributes = [f'field_{i}' for i in range(alice.MAX_INDEXED_ATTRIBUTES + 1)]
+    with pytest.raises(ValueError):
+        alice.add_item_type('alice', 'games', attributes, indexed=attributes)
+
+def test_migration_moves_generated_columns_to_type_indexes(alice):
+    vinyl = alice.add_item_type('alice', 'vinyl', ['artist'])
+    alice.add_item('alice', Item('Record', 'vinyl', {'artist': 'Artist'}))
+    columns = item_columns(alice)
+    with alice.connection:
+        alice.cursor.execute('''ALTER TABLE items ADD COLUMN attr_artist
+                                GENERATED ALWAYS AS (json_extract(attributes, '$.artist')) VIRTUAL''')
+        alice.cursor.execute('''CREATE INDEX idx_items_attr_artist ON items (username, type_id, attr_artist)''')
+    with alice.connection:
+        alice.index_attributes_per_type()
+    assert item_columns(alice) == columns
+    assert f'idx_items_{vinyl.id}_artist' in query_plan(alice, vinyl.id)
+    assert [item.title for item in alice.find_items('alice', 'vinyl', {'artist': 'Artist'})] == ['Record']
@@ -0,0 +1,52 @@
+from conftest import create_baseline
+from Shelf import Book, User, sync_databases
+
+def baseline(tmp_path):
+    return create_baseline(str(tmp_path / 'shelf.db'), users=[('alice', 'a-secret'), ('bob', 'b-secret')],
+                           books=[('Dune', 'Herbert', 'Science Fiction', '1965', 'alice'),
+                                  ('Emma', 'Austen', 'Romance', '1815', 'alice'),
+                                  ('Dune', 'Herbert', 'Science Fiction', '1965', 'bob'),
+                                  ('Untitled', None, None, None, 'bob')],
+                           books_read=[('Emma', 'Austen', 'Romance', '1815', 'alice')])
+
+def test_baseline_database_is_upgraded(open_db, tmp_path):
+    baseline(tmp_path)
+    messages = []
+    db = open_db('shelf.db', migration_progress=messages.append)
+    assert db.cursor.execute('PRAGMA user_version').fetchone()[0] == len(db.migrations())
+    assert len(messages) >= len(db.migrations())
+
+    assert sorted((book.title, book.author, book.year) for book in db.get_books('alice')) == \
+        [('Dune', 'Herbert', '1965'), ('Emma', 'Austen', '1815')]
+    assert sorted(book.title for book in db.get_books('bob')) == ['Dune', 'Untitled']
+    # One catalog row per distinct book, shared between shelves
+    assert db.cursor.execute('SELECT COUNT(*) FROM catalog').fetchone()[0] == 3
+    assert [book.title for book in db.get_books_read('alice')] == ['Emma']
+    assert db.get_reading_progress('alice')[1] == 1
+    assert [book.title for book in db.search_books('bob', 'herb')] == ['Dune']
+    assert [book.title for book in db.get_books_page('alice', 'year')] == ['Emma', 'Dune']
+    assert db.get_shelf_stats('bob').books == 2
+
+    # Plaintext passwords still log in, and are hashed on the way
+    assert db.authenticate('alice', 'a-secret') is not None
+    assert db.get_user('alice').password.startswith('pbkdf2_sha256$')
+
+def test_upgraded_database_is_not_upgraded_again(open_db, tmp_path):
+    baseline(tmp_path)
+    open_db('shelf.db').close()
+    messages = []
+    db = open_db('shelf.db', migration_progress=messages.append)
+    assert messages == []
+    assert db.count_books('alice') == 2
+
+def test_upgraded_database_syncs(open_db, tmp_path):
+    baseline(tmp_path)
+    db, peer = open_db('shelf.db'), open_db('peer.db')
+    db.add_book(Book('Persuasion', 'Austen', 'Romance', '1817'), 'alice')
+    sync_databases(db, peer)
+    # Rows from before the change log are logged by its migration, so a peer gets everything
+    assert sorted(book.title for book in peer.get_books('alice')) == ['Dune', 'Emma', 'Persuasion']
+    assert [book.title for book in peer.get_books_read('alice')] == ['Emma']
+    peer.add_user(User('carol', 'secret'))
+    sync_databases(db, peer)
+    assert db.authenticate('carol', 'secret') is not None
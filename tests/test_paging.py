@@ -0,0 +1,89 @@
+import pytest
+
+from conftest import create_baseline
+from Shelf import Book, Database, User
+
+# Every book of a shelf, page by page
+def all_pages(db, username, sort_by, descending, limit):
+    books, after = [], None
+    while True:
+        page = db.get_books_page(username, sort_by, descending, after, limit)
+        books.extend(page)
+        if len(page) < limit:
+            return books
+        after = Database.page_key(page[-1], sort_by)
+
+def expected(db, username, sort_by, descending):
+    books = db.get_books(username)
+    db.cursor.execute('''SELECT id, catalog_id FROM books WHERE username = ?''', (username,))
+    catalog_ids = dict(db.cursor.fetchall())
+    keys = sorted(((getattr(book, sort_by), catalog_ids[book.id], book.id) for book in books), reverse=descending)
+    return [key[2] for key in keys]
+
+@pytest.fixture
+def shelves(db):
+    for username in ('reader', 'collector'):
+        db.add_user(User(username, 'secret'))
+    # Few distinct years and repeated titles, so pages end in the middle of ties, and a
+    # book shelved twice, so ties remain even within one catalog row
+    books = [Book(f'Title {i % 7}', f'Author {i % 5}', 'Genre', str(1990 + i % 3)) for i in range(40)]
+    db.add_books(books, 'reader')
+    db.add_book(books[0], 'reader')
+    db.add_books((Book(f'Other {i}', 'Author', 'Genre', '2000') for i in range(300)), 'collector')
+    return db
+
+@pytest.mark.parametrize('sort_by', Database.SORT_COLUMNS)
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('limit', [1, 3, 7, 41, 42, 100])
+def test_pages_cover_the_shelf_in_order(shelves, sort_by, descending, limit):
+    for username in ('reader', 'collector'):
+        ids = [book.id for book in all_pages(shelves, username, sort_by, descending, limit)]
+        assert ids == expected(shelves, username, sort_by, descending)
+
+def test_nothing_comes_after_the_last_book(shelves):
+    first = shelves.get_books_page('reader', 'title', limit=1)[0]
+    last = shelves.get_books_page('reader', 'title', descending=True, limit=1)[0]
+    assert shelves.get_books_page('reader', 'title', after=Database.page_key(last, 'title')) == []
+    assert shelves.get_books_page('reader', 'title', descending=True, after=Database.page_key(first, 'title')) == []
+
+def test_added_and_removed_books_change_the_plan_size(shelves):
+    size = shelves.shelf_size('reader')
+    shelves.add_book(Book('New', 'Author', 'Genre', '2001'), 'reader')
+    assert shelves.remove_book('Title 0', 'reader') == 7
+    assert shelves.shelf_size('reader') == size - 6
+    shelves.shelf_sizes.clear()
+    assert shelves.shelf_size('reader') == size - 6
+
+# Missing fields page like any other value, through both plans: a shelf that is all of the
+# catalog is walked through the catalog, a small one among many other books through its links
+@pytest.mark.parametrize('others', [0, 500])
+@pytest.mark.parametrize('sort_by', Database.SORT_COLUMNS)
+def test_books_with_missing_fields_are_paged(db, sort_by, others):
+    db.add_user(User('reader', 'secret'))
+    db.add_user(User('other', 'secret'))
+    db.add_books((Book(f'Other {i}', 'Author', 'Genre', '2000') for i in range(others)), 'other')
+    db.add_books([Book('T0', None, 'Genre', None), Book('T1', 'Author', None, '1999'),
+                  Book('T2', None, None, None), Book(None, 'Author', 'Genre', '2001')], 'reader')
+    db.add_book(Book('T4', 'Author', 'Genre', '2002'), 'reader')
+    for descending in (False, True):
+        ids = [book.id for book in all_pages(db, 'reader', sort_by, descending, 1)]
+        assert ids == expected(db, 'reader', sort_by, descending)
+        assert len(ids) == 5
+
+def test_missing_fields_from_peers_and_old_rows_are_stored_empty(db):
+    db.add_user(User('reader', 'secret'))
+    db.add_books([Book('T0', 'Author', 'Genre', '2000')], 'reader')
+    with db.connection:
+        db.apply_change('book', 'upsert', 'ab' * 16, {'title': 'T1', 'author': None, 'genre': None, 'year': None})
+        db.cursor.execute('''UPDATE catalog SET year = NULL WHERE title = 'T0' ''')
+        db.fill_catalog_nulls()
+    db.cursor.execute('''SELECT COUNT(*) FROM catalog WHERE title IS NULL OR author IS NULL OR genre IS NULL
+                         OR year IS NULL''')
+    assert db.cursor.fetchone()[0] == 0
+
+def test_migrated_books_with_missing_fields_are_paged(open_db, tmp_path):
+    create_baseline(str(tmp_path / 'shelf.db'), users=[('bob', 'secret')],
+                    books=[('Dune', 'Herbert', 'Science Fiction', '1965', 'bob'), ('Untitled', None, None, None, 'bob')])
+    db = open_db('shelf.db')
+    for sort_by in Database.SORT_COLUMNS:
+        assert sorted(book.title for book in all_pages(db, 'bob', sort_by, False, 1)) == ['Dune', 'Untitled']
@@ -0,0 +1,83 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from Shelf import Book, ReplicaDatabase, ReplicaPublisher, User
+
+@pytest.fixture
+def primary(db):
+    db.add_user(User('alice', 'secret'))
+    db.add_books((Book(f'Book {i}', 'Author', 'Genre', '2000') for i in range(3)), 'alice')
+    return db
+
+@pytest.fixture
+def published(primary, tmp_path):
+    publisher = ReplicaPublisher(primary, str(tmp_path / 'replica.db'))
+    publisher.take()
+    return publisher
+
+@pytest.fixture
+def open_replica():
+    replicas = []
+
+    def open_replica(path):
+        replica = ReplicaDatabase(path)
+        replicas.append(replica)
+        return replica
+    yield open_replica
+    for replica in replicas:
+        replica.close()
+
+def titles(db):
+    return sorted(book.title for book in db.get_books('alice'))
+
+def test_refresh_moves_to_the_newest_snapshot(primary, published, open_replica):
+    replica = open_replica(published.path)
+    assert titles(replica) == ['Book 0', 'Book 1', 'Book 2']
+    assert replica.get_shelf_stats('alice').books == 3
+    assert replica.refresh() is False
+
+    primary.add_book(Book('Book 3', 'Author', 'Genre', '2000'), 'alice')
+    published.take()
+    # Until refreshed, queries keep reading the snapshot they started on
+    assert len(titles(replica)) == 3
+    assert replica.refresh() is True
+    assert titles(replica) == ['Book 0', 'Book 1', 'Book 2', 'Book 3']
+    assert replica.get_shelf_stats('alice').books == 4
+    assert [book.title for book in replica.search_books('alice', 'book 3')] == ['Book 3']
+
+def set_schema_version(path, version):
+    connection = sqlite3.connect(path)
+    connection.execute(f'PRAGMA user_version = {version}')
+    connection.commit()
+    connection.close()
+
+def test_replicas_of_another_schema_version_are_refused(published, open_replica, tmp_path):
+    old = str(tmp_path / 'old.db')
+    shutil.copy(published.path, old)
+    set_schema_version(old, 3)
+    with pytest.raises(ValueError):
+        open_replica(old)
+
+    # A refresh onto such a snapshot fails and keeps the current one
+    replica = open_replica(published.path)
+    shutil.copy(old, published.path + '.tmp')
+    shutil.move(published.path + '.tmp', published.path)
+    with pytest.raises(ValueError):
+        replica.refresh()
+    assert len(titles(replica)) == 3
+
+def test_missing_replicas_are_refused(open_replica, tmp_path):
+    with pytest.raises(ValueError):
+        open_replica(str(tmp_path / 'nowhere.db'))
+
+def test_writes_fail_on_a_replica(published, open_replica):
+    replica = open_replica(published.path)
+    with pytest.raises(sqlite3.OperationalError):
+        replica.add_book(Book('Book 3', 'Author', 'Genre', '2000'), 'alice')
+    with pytest.raises(sqlite3.OperationalError):
+        replica.add_user(User('bob', 'secret'))
+    with pytest.raises(sqlite3.OperationalError):
+        replica.remove_book('Book 0', 'alice')
+    assert len(titles(replica)) == 3
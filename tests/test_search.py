@@ -0,0 +1,50 @@
+import pytest
+
+from Shelf import Book, Database, User
+
+@pytest.fixture
+def shelves(db):
+    for username in ('alice', 'bob'):
+        db.add_user(User(username, 'secret'))
+    db.add_books([Book('River Song', 'Ann Lee', 'Poetry', '2001'),
+                  Book('Garden Walks', 'River Hart', 'Nature', '1999'),
+                  Book('Deep Water', 'Sam Cole', 'River Fiction', '2010'),
+                  Book('Mountains', 'Sam Cole', 'Travel', '1987')], 'alice')
+    db.add_books([Book('River Song', 'Ann Lee', 'Poetry', '2001'),
+                  Book('Riverside', 'Bo Tan', 'Mystery', '2005')], 'bob')
+    return db
+
+@pytest.fixture(params=['shelf index', 'catalog index'])
+def search(request, shelves, monkeypatch):
+    if request.param == 'catalog index':
+        monkeypatch.setattr(Database, 'SEARCH_SHELF_LIMIT', 0)
+    return lambda username, query: [book.title for book in shelves.search_books(username, query)]
+
+def test_matches_are_ranked_title_then_author_then_genre(search):
+    assert search('alice', 'river') == ['River Song', 'Garden Walks', 'Deep Water']
+    assert search('bob', 'river') == ['Riverside', 'River Song']
+
+def test_fields_and_prefixes(search):
+    assert sorted(search('alice', 'author:sam')) == ['Deep Water', 'Mountains']
+    assert search('alice', 'sam genre:trav') == ['Mountains']
+    assert search('alice', 'mountainsx') == []
+
+def test_writes_reach_the_shelf_index(shelves):
+    assert [book.title for book in shelves.search_books('bob', 'song')] == ['River Song']
+    shelves.add_book(Book('Song of Songs', 'Ike Turner', 'Soul', '1966'), 'bob')
+    shelves.remove_book('River Song', 'bob')
+    assert [book.title for book in shelves.search_books('bob', 'song')] == ['Song of Songs']
+    assert [book.title for book in shelves.search_books('alice', 'deep')] == ['Deep Water']
+
+def test_writes_from_another_database_reach_the_shelf_index(shelves, open_db):
+    assert [book.title for book in shelves.search_books('bob', 'walks')] == []
+    open_db('shelf.db').add_book(Book('Garden Walks', 'River Hart', 'Nature', '1999'), 'bob')
+    assert [book.title for book in shelves.search_books('bob', 'walks')] == ['Garden Walks']
+
+def test_restore_rebuilds_the_shelf_index(shelves, tmp_path):
+    shelves.backup(str(tmp_path / 'backup.db'))
+    shelves.add_book(Book('Song of Songs', 'Ike Turner', 'Soul', '1966'), 'bob')
+    assert [book.title for book in shelves.search_books('bob', 'ike')] == ['Song of Songs']
+    shelves.restore(str(tmp_path / 'backup.db'))
+    shelves.add_book(Book('Wide Sky', 'Ike Turner', 'Soul', '1970'), 'bob')
+    assert [book.title for book in shelves.search_books('bob', 'ike')] == ['Wide Sky']
@@ -0,0 +1,90 @@
+import os
+import threading
+
+import pytest
+
+from conftest import FAST_HASHER
+from Shelf import Book, Database, ShardedDatabase, User
+
+@pytest.fixture
+def sharded(tmp_path):
+    db = ShardedDatabase(str(tmp_path / 'shelf.db'), max_open=1, password_hasher=FAST_HASHER)
+    for username in ('alice', 'bob'):
+        db.add_user(User(username, 'secret', name=username.title()))
+    yield db
+    db.close()
+
+def add_books(db, username, count):
+    db.add_books((Book(f'{username} {i}', 'Author', 'Genre', '2000') for i in range(count)), username)
+
+def test_each_user_has_a_shard_of_their_own(sharded):
+    add_books(sharded, 'alice', 3)
+    add_books(sharded, 'bob', 2)
+    assert sharded.shard_name('alice') != sharded.shard_name('bob')
+    assert sharded.count_books('alice') == 3
+    assert [book.title for book in sharded.get_books('bob')] == ['bob 0', 'bob 1']
+    # The books are in the user's shard file, and only there
+    for username, count in (('alice', 3), ('bob', 2)):
+        shard = Database(os.path.join(sharded.shards_directory, sharded.shard_name(username)), password_hasher=FAST_HASHER)
+        try:
+            assert shard.count_all()['books'] == count
+        finally:
+            shard.close()
+    assert sharded.authenticate('alice', 'secret') is not None
+    with pytest.raises(ValueError):
+        sharded.count_books('carol')
+
+def test_shard_names_survive_reopening(sharded, tmp_path):
+    name = sharded.shard_name('alice')
+    add_books(sharded, 'alice', 1)
+    sharded.close()
+    reopened = ShardedDatabase(str(tmp_path / 'shelf.db'), password_hasher=FAST_HASHER)
+    try:
+        assert reopened.shard_name('alice') == name
+        assert reopened.count_books('alice') == 1
+    finally:
+        reopened.close()
+
+def test_idle_shards_over_max_open_are_closed(sharded):
+    sharded.count_books('alice')
+    sharded.count_books('bob')
+    assert list(sharded.open_shards) == [sharded.shard_name('bob')]
+
+def test_a_shard_in_use_is_not_closed(sharded):
+    holding, done = threading.Event(), threading.Event()
+    counts = []
+
+    def hold_alice():
+        with sharded.shard('alice') as db:
+            holding.set()
+            done.wait(5)
+            # Still open, although bob's shard took it over max_open meanwhile
+            db.add_book(Book('Late', 'Author', 'Genre', '2000'), 'alice')
+            counts.append(db.count_books('alice'))
+    thread = threading.Thread(target=hold_alice)
+    thread.start()
+    holding.wait(5)
+    try:
+        add_books(sharded, 'bob', 2)
+        # Over max_open, the idle shard is closed and the one in use is kept
+        assert list(sharded.open_shards) == [sharded.shard_name('alice')]
+    finally:
+        done.set()
+        thread.join()
+    assert counts == [1]
+    # Once idle, the least recently used shard goes as soon as another is released
+    sharded.count_books('bob')
+    assert list(sharded.open_shards) == [sharded.shard_name('bob')]
+    assert sharded.count_books('alice') == 1
+
+def test_count_all_sums_the_shards(sharded):
+    add_books(sharded, 'alice', 3)
+    add_books(sharded, 'bob', 2)
+    sharded.add_book(Book('alice 0', 'Author', 'Genre', '2000'), 'bob')
+    sharded.add_book(Book('Read', 'Author', 'Genre', '2000'), 'bob', read_this_year=True)
+    counts = sharded.count_all()
+    assert counts['users'] == 2
+    assert counts['books'] == 6
+    assert counts['books_read_this_year'] == 1
+    # A book on two shelves is in both shards' catalogs
+    assert counts['catalog'] == 7
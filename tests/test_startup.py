@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def imported_modules(tmp_path, *arguments):
+    result = subprocess.run([sys.executable, '-X', 'importtime', *arguments, '--db', str(tmp_path / 'shelf.db'), 'stats'],
+                            cwd=REPOSITORY, check=True, capture_output=True, text=True)
+    return [line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines() if line.startswith('import time:')]
+
+def test_shelf_py_runs_its_module_once(tmp_path):
+    modules = imported_modules(tmp_path, 'Shelf.py')
+    assert 'shelf_cli' in modules
+    assert 'Shelf' not in modules
+    assert 'PyQt5' not in modules
+
+def test_cli_does_not_load_qt(tmp_path):
+    modules = imported_modules(tmp_path, 'shelf_cli.py')
+    assert 'Shelf' in modules
+    assert 'PyQt5' not in modules
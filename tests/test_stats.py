@@ -0,0 +1,75 @@
+import threading
+
+from Shelf import Book, User
+
+def add_books(db, username, prefix, count, genre='Mystery'):
+    db.add_books((Book(f'{prefix} {i}', f'Author {i % 3}', genre, str(1990 + i)) for i in range(count)), username)
+
+def breakdown(stats):
+    return stats.books, stats.genres, stats.authors, stats.decades
+
+def assert_counted_afresh(db, username):
+    stats = db.get_shelf_stats(username)
+    db.shelf_breakdowns.clear()
+    assert breakdown(db.get_shelf_stats(username)) == breakdown(stats)
+    return stats
+
+def test_writes_through_the_database_keep_the_counts(db):
+    db.add_user(User('alice', 'secret'))
+    add_books(db, 'alice', 'Book', 20)
+    db.get_shelf_stats('alice')
+    db.add_book(Book('One more', 'Author 9', 'Horror', '1850'), 'alice')
+    db.remove_book('Book 3', 'alice')
+    stats = assert_counted_afresh(db, 'alice')
+    assert stats.books == 20
+    assert ('Horror', 1) in stats.genres
+
+def test_writes_from_another_database_are_counted(open_db):
+    db = open_db('shelf.db')
+    db.add_user(User('alice', 'secret'))
+    add_books(db, 'alice', 'Book', 10)
+    assert db.get_shelf_stats('alice').books == 10
+
+    other = open_db('shelf.db')
+    add_books(other, 'alice', 'Elsewhere', 5, genre='Poetry')
+    other.remove_book('Book 0', 'alice')
+    stats = db.get_shelf_stats('alice')
+    assert stats.books == 14
+    assert ('Poetry', 5) in stats.genres
+    assert_counted_afresh(db, 'alice')
+
+def test_writes_from_many_threads_keep_the_counts(db):
+    db.add_user(User('alice', 'secret'))
+    db.get_shelf_stats('alice')
+
+    def write(thread):
+        for i in range(20):
+            db.add_book(Book(f'Thread {thread} book {i}', f'Author {i}', 'Mystery', '2001'), 'alice')
+            db.get_shelf_stats('alice')
+    threads = [threading.Thread(target=write, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert assert_counted_afresh(db, 'alice').books == 80
+
+def test_writes_elsewhere_keep_the_counts(open_db, monkeypatch):
+    db = open_db('shelf.db')
+    db.add_user(User('alice', 'secret'))
+    add_books(db, 'alice', 'Book', 10)
+    db.get_shelf_stats('alice')
+
+    other = open_db('shelf.db')
+    other.add_user(User('bob', 'secret'))
+    add_books(other, 'bob', 'Other', 5)
+    db.set_cover(db.get_books('alice')[0].id, 'cover.jpg')
+    monkeypatch.setattr(db, 'book_breakdowns', None)
+    assert db.get_shelf_stats('alice').books == 10
+
+def test_edited_books_are_counted(db):
+    db.add_user(User('alice', 'secret'))
+    add_books(db, 'alice', 'Book', 10)
+    db.get_shelf_stats('alice')
+    db.cursor.execute('''UPDATE catalog SET genre = 'Poetry' WHERE title = 'Book 1' ''')
+    db.connection.commit()
+    assert ('Poetry', 1) in db.get_shelf_stats('alice').genres
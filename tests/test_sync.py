@@ -0,0 +1,160 @@
+import time
+
+import pytest
+
+from conftest import FAST_HASHER
+from Shelf import Book, Database, User, sync_databases
+
+def titles(db, username):
+    return sorted(book.title for book in db.get_books(username))
+
+def add_books(db, username, prefix, count):
+    db.add_books((Book(f'{prefix} {i}', 'Author', 'Genre', '2000') for i in range(count)), username)
+
+def test_restore_takes_a_new_replica_id(open_db, tmp_path):
+    a, b = open_db('a.db'), open_db('b.db')
+    a.add_user(User('alice', 'secret'))
+    add_books(a, 'alice', 'Before', 5)
+    backup = a.backup(str(tmp_path / 'backup.db'))
+    add_books(a, 'alice', 'After', 3)
+    sync_databases(a, b)
+    vector = a.sync_vector()
+
+    a.restore(backup)
+    assert set(a.sync_vector()) - set(vector)
+    add_books(a, 'alice', 'Restored', 10)
+    received, sent = sync_databases(b, a)
+    assert sent > 0
+    assert titles(b, 'alice') == titles(a, 'alice')
+    # Changes made after the backup come back from the peer that has them
+    assert [title for title in titles(a, 'alice') if title.startswith('After')] == ['After 0', 'After 1', 'After 2']
+    assert len(titles(a, 'alice')) == 18
+
+def change_count(db):
+    db.cursor.execute('SELECT COUNT(*) FROM changes')
+    return db.cursor.fetchone()[0]
+
+def test_compaction_keeps_what_peers_still_need(open_db):
+    a, b = open_db('a.db'), open_db('b.db')
+    a.add_user(User('alice', 'secret'))
+    add_books(a, 'alice', 'First', 20)
+    sync_databases(a, b)
+    before = change_count(a)
+    assert a.compact_changes() > 0
+    assert change_count(a) < before
+
+    add_books(a, 'alice', 'Second', 5)
+    add_books(b, 'alice', 'Other', 2)
+    sync_databases(a, b)
+    assert titles(a, 'alice') == titles(b, 'alice')
+    assert len(titles(b, 'alice')) == 27
+
+def test_compaction_keeps_the_replicas_own_position(open_db):
+    a = open_db('a.db')
+    a.add_user(User('alice', 'secret'))
+    add_books(a, 'alice', 'Book', 10)
+    vector = a.sync_vector()
+    a.compact_changes()
+    assert a.sync_vector() == vector
+    add_books(a, 'alice', 'More', 1)
+    assert a.sync_vector()[a.replica_id()] > vector[a.replica_id()]
+
+def test_peers_missing_compacted_changes_start_from_a_backup(open_db, tmp_path):
+    a, b = open_db('a.db'), open_db('b.db')
+    a.add_user(User('alice', 'secret'))
+    add_books(a, 'alice', 'Book', 10)
+    a.compact_changes()
+    with pytest.raises(ValueError):
+        sync_databases(a, b)
+
+    b.restore(a.backup(str(tmp_path / 'backup.db')))
+    add_books(a, 'alice', 'More', 3)
+    sync_databases(a, b)
+    assert titles(a, 'alice') == titles(b, 'alice')
+    assert len(titles(b, 'alice')) == 13
+
+def profile(db, username):
+    user = db.get_user(username)
+    return user.name, user.email
+
+def test_sync_round_trip(open_db):
+    a, b = open_db('a.db'), open_db('b.db')
+    a.add_user(User('alice', 'secret', name='Alice'))
+    add_books(a, 'alice', 'Book', 5)
+    a.add_book(Book('Read', 'Author', 'Genre', '2001'), 'alice', read_this_year=True)
+    assert sync_databases(a, b) == (0, change_count(a))
+    b.add_user(User('bob', 'secret'))
+    add_books(b, 'bob', 'Bob', 2)
+    b.remove_book('Book 0', 'alice')
+
+    received, sent = sync_databases(a, b)
+    assert received > 0 and sent == 0
+    for db in (a, b):
+        assert titles(db, 'alice') == ['Book 1', 'Book 2', 'Book 3', 'Book 4']
+        assert titles(db, 'bob') == ['Bob 0', 'Bob 1']
+        assert [book.title for book in db.get_books_read('alice')] == ['Read']
+        assert db.authenticate('bob', 'secret') is not None
+    # Nothing is sent twice
+    assert sync_databases(a, b) == (0, 0)
+
+def test_conflicting_changes_keep_the_latest(open_db):
+    a, b = open_db('a.db'), open_db('b.db')
+    a.add_user(User('alice', 'secret', name='Alice', email='alice@example.com'))
+    sync_databases(a, b)
+    with a.connection:
+        a.cursor.execute('''UPDATE users SET name = 'Alice A' WHERE username = 'alice' ''')
+    time.sleep(0.01)
+    with b.connection:
+        b.cursor.execute('''UPDATE users SET name = 'Alice B', email = 'b@example.com' WHERE username = 'alice' ''')
+    a.forget_user()
+    b.forget_user()
+
+    sync_databases(a, b)
+    assert profile(a, 'alice') == profile(b, 'alice') == ('Alice B', 'b@example.com')
+    # Both sides agree the other way round too
+    sync_databases(b, a)
+    assert profile(a, 'alice') == profile(b, 'alice') == ('Alice B', 'b@example.com')
+
+# A database stopped at the schema before compact_change_log
+class UncompactedDatabase(Database):
+    def migrations(self):
+        migrations = super().migrations()
+        return migrations[:migrations.index(self.compact_change_log)]
+
+    # Links logged as versions before it logged them
+    def create_change_trigger(self, entity, event, op):
+        if entity != 'link':
+            return super().create_change_trigger(entity, event, op)
+        table_name, key, data = self.CHANGE_SOURCES[entity]
+        row = 'old' if event == 'delete' else 'new'
+        self.cursor.execute(f'''CREATE TRIGGER changes_{table_name}_{event} AFTER {event.upper()} ON {table_name} BEGIN
+                                    INSERT INTO changes (origin, origin_seq, entity, op, key, data, changed_at)
+                                    SELECT origin, origin_seq, 'link', '{op}', {key.format(row=row)}, {data.format(row=row)},
+                                           COALESCE(changed_at, {self.CHANGE_TIME})
+                                    FROM sync_state;
+                                END''')
+
+def test_upgraded_change_log_is_sent_unchanged(open_db, tmp_path):
+    a = UncompactedDatabase(str(tmp_path / 'a.db'), password_hasher=FAST_HASHER)
+    a.add_user(User('alice', 'secret'))
+    add_books(a, 'alice', 'Book', 5)
+    a.add_book(Book('Read', 'Author', 'Genre', '2001'), 'alice', read_this_year=True)
+    a.remove_book('Book 0', 'alice')
+    with a.connection:
+        # The first changes came from a peer, and the last ones were compacted away
+        a.cursor.execute('''UPDATE changes SET origin = ?, origin_seq = seq + 100 WHERE seq <= 3''', ('f' * 32,))
+        a.cursor.execute('''INSERT INTO sync_peers (origin, seq) VALUES (?, 103)''', ('f' * 32,))
+        a.cursor.execute('''UPDATE sqlite_sequence SET seq = seq + 10 WHERE name = 'changes' ''')
+    logged = a.cursor.execute('''SELECT origin, COALESCE(origin_seq, seq), entity, op, key, data, changed_at
+                                 FROM changes ORDER BY seq''').fetchall()
+    last = a.cursor.execute('''SELECT seq FROM sqlite_sequence WHERE name = 'changes' ''').fetchone()[0]
+    a.close()
+
+    a = open_db('a.db')
+    assert list(a.changes_since({})) == logged
+    add_books(a, 'alice', 'Later', 1)
+    assert a.sync_vector()[a.replica_id()] > last
+    b = open_db('b.db')
+    sync_databases(a, b)
+    assert titles(b, 'alice') == titles(a, 'alice') == ['Book 1', 'Book 2', 'Book 3', 'Book 4', 'Later 0']
+    assert [book.title for book in b.get_books_read('alice')] == ['Read']
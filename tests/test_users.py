@@ -0,0 +1,63 @@
+import json
+
+from Shelf import PasswordHasher, User
+
+def logged_passwords(db, username):
+    db.cursor.execute('''SELECT data FROM changes WHERE entity = 'user' AND key = ? ORDER BY seq''', (username,))
+    return [json.loads(data)['password'] for data, in db.cursor.fetchall()]
+
+def add_plaintext_user(db, username, password):
+    db.cursor.execute('''INSERT INTO users (username, password) VALUES (?, ?)''', (username, password))
+    db.connection.commit()
+
+def test_plaintext_password_is_not_logged(db):
+    add_plaintext_user(db, 'bob', 'hunter2')
+    assert db.authenticate('bob', 'hunter2') is not None
+    passwords = logged_passwords(db, 'bob')
+    assert passwords[0] is None
+    assert passwords[-1].startswith('pbkdf2_sha256$')
+    assert 'hunter2' not in json.dumps(list(db.changes_since({})))
+
+def test_migration_scrubs_logged_plaintext(db):
+    add_plaintext_user(db, 'bob', 'hunter2')
+    # Log the plaintext the way versions before the scrub did
+    db.cursor.execute('''UPDATE changes SET data = json_set(data, '$.password', 'hunter2') WHERE key = 'bob' ''')
+    with db.connection:
+        db.scrub_logged_passwords()
+    assert logged_passwords(db, 'bob') == [None]
+    # The password itself stays until the next login hashes it
+    assert db.authenticate('bob', 'hunter2') is not None
+
+def stored_password(db, username):
+    db.cursor.execute('''SELECT password FROM users WHERE username = ?''', (username,))
+    return db.cursor.fetchone()[0]
+
+def test_login_rehashes_plaintext(db):
+    add_plaintext_user(db, 'bob', 'hunter2')
+    assert db.authenticate('bob', 'wrong') is None
+    assert stored_password(db, 'bob') == 'hunter2'
+    user = db.authenticate('bob', 'hunter2')
+    assert user.password == stored_password(db, 'bob') != 'hunter2'
+    assert db.authenticate('bob', 'hunter2') is not None
+
+def test_login_rehashes_weaker_parameters(open_db):
+    weak = open_db('shelf.db')
+    weak.add_user(User('bob', 'hunter2'))
+    old_hash = stored_password(weak, 'bob')
+    assert old_hash.startswith('pbkdf2_sha256$1$')
+
+    db = open_db('shelf.db', password_hasher=PasswordHasher('pbkdf2_sha256', iterations=2))
+    assert db.authenticate('bob', 'hunter2') is not None
+    new_hash = stored_password(db, 'bob')
+    assert new_hash.startswith('pbkdf2_sha256$2$')
+    # A hash with the current parameters is kept as it is
+    assert db.authenticate('bob', 'hunter2') is not None
+    assert stored_password(db, 'bob') == new_hash
+    assert logged_passwords(db, 'bob')[-1] == new_hash
+
+def test_malformed_hashes_never_match(db):
+    for stored in ('pbkdf2_sha256$', 'scrypt$1$2$aGk=$aGk=', 'pbkdf2_sha256$x$aGk=$aGk=', 'pbkdf2_sha256$1$!!$aGk=',
+                   'scrypt$99999999999999999999$8$1$aGk=$aGk='):
+        assert not db.password_hasher.verify(stored, stored)
+    add_plaintext_user(db, 'bob', 'pbkdf2_sha256$')
+    assert db.authenticate('bob', 'pbkdf2_sha256$') is None
@@ -0,0 +1,78 @@
+import sqlite3
+import time
+
+import pytest
+
+from Shelf import Book, User
+
+def book(i):
+    return Book(f'Book {i}', 'Author', 'Genre', '2000')
+
+@pytest.fixture
+def writer(open_db):
+    db = open_db('shelf.db', write_behind=True, flush_size=3, flush_interval=60)
+    db.add_user(User('alice', 'secret'))
+    return db
+
+# What another connection to the file sees, without flushing the writer's queue
+@pytest.fixture
+def reader(writer, open_db):
+    return open_db('shelf.db')
+
+def test_a_full_batch_is_written(writer, reader):
+    writer.add_book(book(0), 'alice')
+    writer.add_book(book(1), 'alice')
+    assert reader.count_books('alice') == 0
+    writer.add_book(book(2), 'alice')
+    assert reader.count_books('alice') == 3
+    assert writer.pending_writes == []
+
+def test_queued_books_are_written_after_the_interval(open_db):
+    writer = open_db('shelf.db', write_behind=True, flush_size=100, flush_interval=0.05)
+    writer.add_user(User('alice', 'secret'))
+    reader = open_db('shelf.db')
+    writer.add_book(book(0), 'alice')
+    deadline = time.monotonic() + 5
+    while reader.count_books('alice') == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert reader.count_books('alice') == 1
+    assert writer.flush_timer is None
+
+def test_reads_see_queued_books(writer):
+    writer.add_book(book(0), 'alice')
+    assert [b.title for b in writer.get_books('alice')] == ['Book 0']
+    writer.add_book(book(1), 'alice')
+    assert writer.count_books('alice') == 2
+    assert writer.get_shelf_stats('alice').books == 2
+
+def test_a_failed_flush_keeps_its_batch(writer, reader, monkeypatch):
+    insert_book = writer.insert_book
+    calls = []
+
+    def failing_insert(status, book, username):
+        calls.append(book)
+        if len(calls) == 2:
+            raise sqlite3.OperationalError('database is locked')
+        insert_book(status, book, username)
+    monkeypatch.setattr(writer, 'insert_book', failing_insert)
+    writer.add_book(book(0), 'alice')
+    writer.add_book(book(1), 'alice')
+    with pytest.raises(sqlite3.OperationalError):
+        writer.flush()
+    # Nothing of the batch is written, and all of it is still queued
+    assert reader.count_books('alice') == 0
+    assert [b.title for _, b, _ in writer.pending_writes] == ['Book 0', 'Book 1']
+
+    monkeypatch.undo()
+    writer.flush()
+    assert reader.count_books('alice') == 2
+
+def test_close_writes_the_queue_into_the_database_file(writer, tmp_path):
+    writer.add_book(book(0), 'alice')
+    writer.close()
+    # immutable reads the database file alone, ignoring any WAL
+    connection = sqlite3.connect(f'{(tmp_path / "shelf.db").as_uri()}?immutable=1', uri=True)
+    try:
+        assert connection.execute('''SELECT COUNT(*) FROM shelf_books''').fetchone()[0] == 1
+    finally:
+        connection.close()